@@ -160,6 +160,40 @@ function predictWithCustomModel($imageBase64, $accessToken) {
     return $responseData['predictions'][0];
 }
 
+/**
+ * Predict through the Python prediction gateway
+ * The gateway keeps a cached access token and warm connections to the endpoint
+ */
+function predictViaGateway($imageBase64, $gatewayUrl) {
+    $curl = curl_init($gatewayUrl);
+    curl_setopt_array($curl, [
+        CURLOPT_RETURNTRANSFER => true,
+        CURLOPT_POST => true,
+        CURLOPT_POSTFIELDS => json_encode(['content' => $imageBase64]),
+        CURLOPT_HTTPHEADER => ['Content-Type: application/json'],
+        CURLOPT_TIMEOUT => 30
+    ]);
+    
+    $response = curl_exec($curl);
+    $curlError = curl_error($curl);
+    curl_close($curl);
+    
+    if ($curlError) {
+        throw new Exception('Gateway error: ' . $curlError);
+    }
+    
+    $responseData = json_decode($response, true);
+    if (!$responseData) {
+        throw new Exception('Invalid gateway response');
+    }
+    
+    if (($responseData['status'] ?? '') !== 'success') {
+        throw new Exception($responseData['error'] ?? 'Prediction failed');
+    }
+    
+    return $responseData['data'];
+}
+
 /**
  * Format prediction results
  */
@@ -258,6 +292,27 @@ function validateImage($file) {
     return true;
 }
 
+/**
+ * Load the tuned preprocessing profile for a model
+ * Written by vertex-ai/resolution_search.py, defaults to 1024px at quality 90
+ */
+function loadPreprocessProfile($modelId) {
+    $profile = ['max_dimension' => 1024, 'quality' => 90];
+    
+    $profileFile = __DIR__ . '/vertex-ai/preprocess_profiles.json';
+    if (!$modelId || !file_exists($profileFile)) {
+        return $profile;
+    }
+    
+    $profiles = json_decode(file_get_contents($profileFile), true);
+    if (isset($profiles[$modelId])) {
+        $profile['max_dimension'] = intval($profiles[$modelId]['max_dimension'] ?? $profile['max_dimension']);
+        $profile['quality'] = intval($profiles[$modelId]['quality'] ?? $profile['quality']);
+    }
+    
+    return $profile;
+}
+
 /**
  * Main execution
  */
@@ -287,8 +342,9 @@ try {
         $width = imagesx($image);
         $height = imagesy($image);
         
-        // Resize if larger than 1024px
-        $maxDimension = 1024;
+        // Resize if larger than the model's tuned size (1024px by default)
+        $profile = loadPreprocessProfile($endpoint_config['model_id'] ?? null);
+        $maxDimension = $profile['max_dimension'];
         if ($width > $maxDimension || $height > $maxDimension) {
             $ratio = min($maxDimension / $width, $maxDimension / $height);
             $newWidth = intval($width * $ratio);
@@ -300,7 +356,7 @@ try {
             
             // Get resized image data
             ob_start();
-            imagejpeg($resized, null, 90);
+            imagejpeg($resized, null, $profile['quality']);
             $imageData = ob_get_clean();
             
             imagedestroy($resized);
@@ -310,30 +366,38 @@ try {
     
     $imageBase64 = base64_encode($imageData);
     
-    // Load environment and credentials
+    // Load environment
     loadEnv();
-    $credentialsFile = $_ENV['GOOGLE_APPLICATION_CREDENTIALS'] ?? 'credentials.json';
-    $credentialsPath = __DIR__ . '/' . $credentialsFile;
-    $credentials = loadGoogleCredentials($credentialsPath);
-    
-    // Get access token
-    $accessToken = getAccessToken($credentials);
-    if (!$accessToken) {
-        throw new Exception('Failed to authenticate with Google Cloud');
-    }
-    
-    // Make prediction
-    $prediction = predictWithCustomModel($imageBase64, $accessToken);
+    $gatewayUrl = $_ENV['PREDICTION_GATEWAY_URL'] ?? '';
     
-    // Format results
-    $results = formatPredictionResults($prediction);
-    
-    // Add metadata
-    $results['model_info'] = [
-        'name' => VERTEX_AI_MODEL_NAME,
-        'type' => 'Custom Trained Model',
-        'endpoint' => $endpoint_config['endpoint_id'] ?? 'Unknown'
-    ];
+    if ($gatewayUrl) {
+        // Forward to the prediction gateway (vertex-ai/prediction_gateway.py)
+        $results = predictViaGateway($imageBase64, $gatewayUrl);
+    } else {
+        // Load credentials
+        $credentialsFile = $_ENV['GOOGLE_APPLICATION_CREDENTIALS'] ?? 'credentials.json';
+        $credentialsPath = __DIR__ . '/' . $credentialsFile;
+        $credentials = loadGoogleCredentials($credentialsPath);
+        
+        // Get access token
+        $accessToken = getAccessToken($credentials);
+        if (!$accessToken) {
+            throw new Exception('Failed to authenticate with Google Cloud');
+        }
+        
+        // Make prediction
+        $prediction = predictWithCustomModel($imageBase64, $accessToken);
+        
+        // Format results
+        $results = formatPredictionResults($prediction);
+        
+        // Add metadata
+        $results['model_info'] = [
+            'name' => VERTEX_AI_MODEL_NAME,
+            'type' => 'Custom Trained Model',
+            'endpoint' => $endpoint_config['endpoint_id'] ?? 'Unknown'
+        ];
+    }
     $results['timestamp'] = date('Y-m-d H:i:s');
     
     // Return success response
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Vertex AI Batch Prediction Jobs
+Scores an image archive with sharded batch prediction jobs against the trained
+model and merges the outputs into one result file
+"""
+
+import os
+import json
+import time
+import argparse
+import asyncio
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from cloud_context import get_storage_client
+import deploy_model
+from batch_predict import IMAGE_EXTENSIONS, iter_image_inputs, read_image_bytes
+from vertex_client import ONLINE_NODE_HOUR_COST
+import instrumentation
+
+# Configuration
+BUCKET_NAME = "prasa_bucket"
+JOBS_PREFIX = "batch_jobs"  # gs://<bucket>/batch_jobs/<run id>/{inputs,outputs}
+SHARD_SIZE = 5000  # Images per batch prediction job
+MAX_CONCURRENT_JOBS = 4
+POLL_SECONDS = 60
+LOCAL_POLL_SECONDS = 0.2
+ACTIVE_JOB_STATES = (
+    "JOB_STATE_QUEUED", "JOB_STATE_PENDING", "JOB_STATE_RUNNING", "JOB_STATE_CANCELLING", "JOB_STATE_UPDATING"
+)
+OUTPUT_FILE = "batch_job_predictions.jsonl"
+REPORT_FILE = "batch_job_report.json"
+BATCH_NODE_HOUR_COST = 2.22  # USD, AutoML image classification batch prediction
+
+def iter_archive_images(source):
+    """Yield image URIs under a gs://bucket/prefix or image paths under a local directory"""
+    if not source.startswith("gs://"):
+        for item in iter_image_inputs(source):
+            yield item["path"]
+        return
+    
+    bucket_name, _, prefix = source[len("gs://"):].partition('/')
+    for blob in get_storage_client().list_blobs(bucket_name, prefix=prefix):
+        if blob.name.lower().endswith(IMAGE_EXTENSIONS):
+            instrumentation.count("images_listed")
+            yield f"gs://{bucket_name}/{blob.name}"
+
+def build_batch_instance(uri):
+    """Batch prediction input line for one image"""
+    return {"content": uri, "mimeType": mimetypes.guess_type(uri)[0] or "image/jpeg"}
+
+def write_shards(uris, shard_dir, shard_size=SHARD_SIZE):
+    """Write input JSONL shards as the listing streams in, returns shard descriptions"""
+    os.makedirs(shard_dir, exist_ok=True)
+    shards = []
+    f = None
+    
+    for uri in uris:
+        if f is None or shards[-1]["images"] >= shard_size:
+            if f is not None:
+                f.close()
+            path = os.path.join(shard_dir, f"shard_{len(shards):05d}.jsonl")
+            shards.append({"index": len(shards), "input_file": path, "images": 0})
+            f = open(path, "w")
+        
+        f.write(json.dumps(build_batch_instance(uri)) + "\n")
+        shards[-1]["images"] += 1
+    
+    if f is not None:
+        f.close()
+    return shards
+
+class VertexBatchExecutor:
+    """Runs each shard as a Vertex AI batch prediction job"""
+    
+    poll_seconds = POLL_SECONDS
+    
+    def __init__(self, model, bucket_name, run_id):
+        self.model = model
+        self.bucket = get_storage_client().bucket(bucket_name)
+        self.run_prefix = f"{JOBS_PREFIX}/{run_id}"
+    
+    def submit(self, shard):
+        """Upload the shard and start its job"""
+        blob_name = f"{self.run_prefix}/inputs/{os.path.basename(shard['input_file'])}"
+        self.bucket.blob(blob_name).upload_from_filename(shard["input_file"])
+        instrumentation.count("bytes_uploaded", os.path.getsize(shard["input_file"]))
+        
+        job = self.model.batch_predict(
+            job_display_name=f"elephant-batch-{os.path.basename(self.run_prefix)}-{shard['index']:05d}",
+            gcs_source=f"gs://{self.bucket.name}/{blob_name}",
+            gcs_destination_prefix=f"gs://{self.bucket.name}/{self.run_prefix}/outputs",
+            sync=False
+        )
+        job.wait_for_resource_creation()
+        shard["job"] = job.resource_name
+        return job
+    
+    def state(self, job):
+        """
+        Job state as running, succeeded, partial or failed (refreshed from the API)
+        Partially succeeded jobs still have output to merge. Any state that is
+        neither active nor a success, such as paused, counts as failed so the
+        run never polls it forever.
+        """
+        name = job.state.name
+        if name == "JOB_STATE_SUCCEEDED":
+            return "succeeded"
+        if name == "JOB_STATE_PARTIALLY_SUCCEEDED":
+            return "partial"
+        if name in ACTIVE_JOB_STATES:
+            return "running"
+        return "failed"
+    
+    def error(self, job):
+        """Error message the job reported, if any"""
+        error = job.gca_resource.error
+        return f"{job.state.name}: {error.message}" if error and error.message else job.state.name
+    
+    def iter_output_lines(self, job):
+        """Stream prediction lines from the job's output files"""
+        bucket_name, prefix = job.output_info.gcs_output_directory[len("gs://"):].split('/', 1)
+        for blob in get_storage_client().list_blobs(bucket_name, prefix=prefix + '/'):
+            if os.path.basename(blob.name).startswith("predictions"):
+                with blob.open("r") as f:
+                    yield from f
+    
+    def node_hours(self, job):
+        """Billed node hours, falling back to wall time on one node"""
+        replica_hours = job.gca_resource.resources_consumed.replica_hours
+        if replica_hours:
+            return replica_hours
+        return (job.gca_resource.end_time - job.gca_resource.start_time).total_seconds() / 3600
+
+class LocalBatchExecutor:
+    """
+    Stand-in for batch prediction jobs that runs shards on local threads
+    Shards are scored with an exported edge model, or with the stub endpoint's
+    deterministic predictions, and written in the batch output format so the
+    merge path is the same as for real jobs.
+    """
+    
+    poll_seconds = LOCAL_POLL_SECONDS
+    
+    def __init__(self, output_dir, edge_model=None, workers=MAX_CONCURRENT_JOBS):
+        self.output_dir = output_dir
+        self.engine = None
+        if edge_model:
+            from edge_inference import EdgeInferenceEngine
+            self.engine = EdgeInferenceEngine(edge_model)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+    
+    def run_shard(self, shard, output_file):
+        from stub_endpoint import stub_prediction
+        start_time = time.time()
+        with open(shard["input_file"], "r") as f:
+            instances = [json.loads(line) for line in f]
+        
+        with open(output_file, "w") as output:
+            for instance in instances:
+                uri = instance["content"]
+                try:
+                    image_bytes = read_image_bytes({"imageGcsUri": uri} if uri.startswith("gs://") else {"path": uri})
+                    if self.engine is not None:
+                        prediction = self.engine.predict_bytes([image_bytes])[0]
+                    else:
+                        prediction = stub_prediction(image_bytes)
+                    output.write(json.dumps({"instance": instance, "prediction": prediction}) + "\n")
+                except (OSError, ValueError) as e:
+                    output.write(json.dumps({"instance": instance, "error": {"message": str(e)}}) + "\n")
+        return time.time() - start_time
+    
+    def submit(self, shard):
+        output_file = os.path.join(self.output_dir, f"predictions_{shard['index']:05d}.jsonl")
+        os.makedirs(self.output_dir, exist_ok=True)
+        return {"future": self.pool.submit(self.run_shard, shard, output_file), "output_file": output_file}
+    
+    def state(self, job):
+        if not job["future"].done():
+            return "running"
+        return "failed" if job["future"].exception() else "succeeded"
+    
+    def error(self, job):
+        return str(job["future"].exception())
+    
+    def iter_output_lines(self, job):
+        with open(job["output_file"], "r") as f:
+            yield from f
+    
+    def node_hours(self, job):
+        return job["future"].result() / 3600
+
+def merge_output_lines(lines, output):
+    """Append batch output lines to the merged file as {"id", prediction...} records"""
+    counts = {"images": 0, "errors": 0}
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        uri = record["instance"]["content"]
+        if "prediction" in record:
+            output.write(json.dumps(dict(record["prediction"], id=uri)) + "\n")
+        else:
+            output.write(json.dumps({"id": uri, "error": str(record.get("error"))}) + "\n")
+            counts["errors"] += 1
+        counts["images"] += 1
+    return counts
+
+async def run_shard(executor, shard, slots, merge_lock, output, totals):
+    """
+    Submit one shard, wait for it and merge its output as soon as it finishes
+    A shard that cannot be submitted or polled is marked failed with the
+    reason, so the other shards keep running and get merged.
+    """
+    async with slots:
+        with instrumentation.span("shard_job", index=shard["index"], images=shard["images"]):
+            try:
+                job = await asyncio.to_thread(executor.submit, shard)
+                print(f"  🚀 Shard {shard['index']} submitted ({shard['images']} images)")
+                
+                while (state := await asyncio.to_thread(executor.state, job)) == "running":
+                    await asyncio.sleep(executor.poll_seconds)
+            except Exception as e:
+                job, state = None, "failed"
+                shard["error"] = str(e) or type(e).__name__
+    
+    shard["state"] = state
+    if state in ("failed", "partial") and job is not None:
+        shard["error"] = await asyncio.to_thread(executor.error, job)
+    if state == "failed":
+        print(f"  ❌ Shard {shard['index']} failed: {shard['error']}")
+        totals["failed_shards"] += 1
+        return
+    if state == "partial":
+        print(f"  ⚠️ Shard {shard['index']} partially succeeded: {shard['error']}")
+        totals["partial_shards"] += 1
+    
+    # One shard is written at a time so merged lines never interleave
+    async with merge_lock:
+        with instrumentation.span("merge_shard", index=shard["index"]):
+            counts = await asyncio.to_thread(merge_output_lines, executor.iter_output_lines(job), output)
+    
+    shard["node_hours"] = await asyncio.to_thread(executor.node_hours, job)
+    totals["images"] += counts["images"]
+    totals["errors"] += counts["errors"]
+    totals["node_hours"] += shard["node_hours"]
+    print(f"  ✓ Shard {shard['index']} merged: {counts['images']} predictions, {counts['errors']} errors")
+
+async def run_batch_jobs(executor, shards, output_file=OUTPUT_FILE, max_concurrent_jobs=MAX_CONCURRENT_JOBS):
+    """Run all shards with at most max_concurrent_jobs in flight, returns totals"""
+    slots = asyncio.Semaphore(max_concurrent_jobs)
+    merge_lock = asyncio.Lock()
+    totals = {"images": 0, "errors": 0, "failed_shards": 0, "partial_shards": 0, "node_hours": 0.0}
+    
+    start_time = time.time()
+    with open(output_file, "w") as output:
+        await asyncio.gather(*(
+            run_shard(executor, shard, slots, merge_lock, output, totals) for shard in shards
+        ))
+    
+    totals["seconds"] = time.time() - start_time
+    return totals
+
+def cost_report(totals, online_images_per_second=None, online_nodes=1):
+    """Throughput and cost per 1k images, with the online endpoint for comparison"""
+    images = max(1, totals["images"])
+    report = {
+        "images": totals["images"],
+        "errors": totals["errors"],
+        "failed_shards": totals["failed_shards"],
+        "partial_shards": totals["partial_shards"],
+        "wall_seconds": round(totals["seconds"], 1),
+        "images_per_second": round(totals["images"] / max(totals["seconds"], 1e-9), 2),
+        "node_hours": round(totals["node_hours"], 4),
+        "cost_usd": round(totals["node_hours"] * BATCH_NODE_HOUR_COST, 4),
+        "cost_per_1k_images": round(totals["node_hours"] * BATCH_NODE_HOUR_COST / images * 1000, 4),
+        "online_cost_per_1k_images": None
+    }
+    
+    if online_images_per_second:
+        # A deployed node bills by the hour whether or not it is busy; this is the best case
+        report["online_cost_per_1k_images"] = round(
+            ONLINE_NODE_HOUR_COST * online_nodes / (online_images_per_second * 3600) * 1000, 4
+        )
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Score an image archive with sharded batch prediction jobs')
+    parser.add_argument('--source', required=True, help='gs://bucket/prefix of images (or a local directory with --local)')
+    parser.add_argument('--project-id', default=deploy_model.PROJECT_ID, help='GCP Project ID')
+    parser.add_argument('--location', default=deploy_model.LOCATION, help='Vertex AI location')
+    parser.add_argument('--model-type', default='efficientnet', help='Model type to use (reads model_info_<type>.json)')
+    parser.add_argument('--bucket', default=BUCKET_NAME, help='Bucket for job inputs and outputs')
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE, help='Images per job')
+    parser.add_argument('--max-jobs', type=int, default=MAX_CONCURRENT_JOBS, help='Jobs running at once')
+    parser.add_argument('--output', default=OUTPUT_FILE, help='Merged JSONL prediction file')
+    parser.add_argument('--local', action='store_true', help='Run shards on local threads instead of Vertex AI')
+    parser.add_argument('--edge-model', help='Exported model for --local (default: stub predictions)')
+    parser.add_argument('--compare-benchmark', help='benchmark.py result file of the online endpoint to compare cost with')
+    parser.add_argument('--online-nodes', type=int, default=1, help='Deployed nodes during that benchmark')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "batch_jobs")
+    
+    print("=" * 60)
+    print("🐘 ELEPHANT DETECTION - BATCH PREDICTION JOBS")
+    print("=" * 60)
+    
+    run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    shard_dir = os.path.join(JOBS_PREFIX, run_id)
+    
+    if args.local:
+        executor = LocalBatchExecutor(os.path.join(shard_dir, "outputs"), args.edge_model, args.max_jobs)
+    else:
+        deploy_model.initialize_vertex_ai(args.project_id, args.location)
+        model_info = deploy_model.load_model_info(args.model_type)
+        if not model_info:
+            return
+        executor = VertexBatchExecutor(deploy_model.get_model(model_info["model_id"]), args.bucket, run_id)
+    
+    print(f"\n📦 Sharding {args.source} into jobs of {args.shard_size} images")
+    shards = write_shards(iter_archive_images(args.source), os.path.join(shard_dir, "inputs"), args.shard_size)
+    if not shards:
+        print("❌ No images found")
+        return
+    print(f"✓ {sum(shard['images'] for shard in shards)} images in {len(shards)} shards")
+    
+    totals = asyncio.run(run_batch_jobs(executor, shards, args.output, args.max_jobs))
+    
+    online_images_per_second = None
+    if args.compare_benchmark:
+        with open(args.compare_benchmark, "r") as f:
+            online_images_per_second = json.load(f).get("images_per_second")
+    report = cost_report(totals, online_images_per_second, args.online_nodes)
+    
+    with open(REPORT_FILE, "w") as f:
+        json.dump({
+            "run_id": run_id,
+            "source": args.source,
+            "executor": "local" if args.local else "vertex",
+            "shard_size": args.shard_size,
+            **report,
+            "shards": [{key: value for key, value in shard.items() if key != "input_file"} for shard in shards]
+        }, f, indent=2)
+    
+    print("\n" + "=" * 60)
+    print("✅ BATCH PREDICTION COMPLETE")
+    print("=" * 60)
+    print(f"  Images: {report['images']} ({report['errors']} errors, {report['failed_shards']} failed shards, "
+          f"{report['partial_shards']} partial)")
+    print(f"  Throughput: {report['images_per_second']} images/s over {report['wall_seconds']}s")
+    print(f"  Node hours: {report['node_hours']} (~${report['cost_usd']:.2f})")
+    print(f"  Cost per 1k images: ~${report['cost_per_1k_images']:.4f}")
+    if report["online_cost_per_1k_images"] is not None:
+        print(f"  Online endpoint at benchmark throughput: ~${report['online_cost_per_1k_images']:.4f} per 1k images")
+    if args.local:
+        print("  ⚠️ Local run: node hours are local worker time, not billed usage")
+    print(f"✓ Predictions saved to: {args.output}")
+    print(f"✓ Report saved to: {REPORT_FILE}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
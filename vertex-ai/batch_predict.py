@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Vertex AI Batch Prediction Client
+Scores a directory or JSONL list of images against the deployed endpoint
+"""
+
+import os
+import json
+import time
+import base64
+import argparse
+import asyncio
+import collections
+from cloud_context import get_storage_client
+from image_preprocess import encode_content, get_model_key, load_profile
+from tiled_inference import TILE_INPUT_SIZE, TILE_SIZE, predict_tiled
+from vertex_client import ENDPOINT_CONFIG_FILE, PredictionError, create_endpoint_client
+import instrumentation
+
+# Configuration
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+BATCH_SIZE = 8  # Instances packed into each predict call
+CONCURRENCY = 8  # Predict calls in flight
+OUTPUT_FILE = "predictions.jsonl"
+PROGRESS_INTERVAL_SECONDS = 5
+
+def iter_image_inputs(source):
+    """
+    Yield input items from a directory (recursively) or a JSONL file
+    JSONL lines may carry "path", "imageGcsUri" (e.g. an import file) or
+    base64 "content", plus an optional "id".
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for filename in sorted(files):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(root, filename)
+                    yield {"id": path, "path": path}
+        return
+    
+    with open(source, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item.setdefault("id", item.get("path") or item.get("imageGcsUri") or f"line-{line_number}")
+            yield item
+
+def read_gcs_bytes(gcs_uri):
+    """Download a GCS object, reusing the process-wide storage client"""
+    bucket_name, blob_name = gcs_uri[len("gs://"):].split('/', 1)
+    return get_storage_client().bucket(bucket_name).blob(blob_name).download_as_bytes()
+
+def read_image_bytes(item):
+    """Read the raw image bytes for an input item"""
+    if "content" in item:
+        return base64.b64decode(item["content"])
+    
+    if "imageGcsUri" in item:
+        return read_gcs_bytes(item["imageGcsUri"])
+    
+    with open(item["path"], "rb") as f:
+        return f.read()
+
+def build_instance(item, profile=None):
+    """
+    Create a predict instance for an input item, downsized like predict.php
+    uploads or to the model's tuned profile
+    """
+    if "content" in item:
+        return {"content": item["content"]}
+    return {"content": encode_content(read_image_bytes(item), **(profile or {}))}
+
+def iter_batches(items, batch_size=BATCH_SIZE):
+    """Group items into lists of at most batch_size"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def score_batch(client, batch, slots, profile=None):
+    """Load and score one batch, returning one result per item"""
+    async with slots:
+        loop = asyncio.get_running_loop()
+        try:
+            instances = await loop.run_in_executor(None, lambda: [build_instance(item, profile) for item in batch])
+        except (OSError, ValueError):
+            # Fall back to per-item loading so one unreadable file does not fail the batch
+            return await score_items_individually(client, batch, loop, profile)
+        
+        try:
+            predictions = await client.predict(instances)
+        except PredictionError as e:
+            if e.status == 400 and len(batch) > 1:
+                # One bad image rejects the whole call, find it
+                return await score_items_individually(client, batch, loop, profile)
+            return [{"id": item["id"], "error": str(e)} for item in batch]
+    
+    return [dict(prediction, id=item["id"]) for item, prediction in zip(batch, predictions)]
+
+async def score_items_individually(client, batch, loop, profile=None):
+    """Score a batch item by item, reporting unreadable images as errors"""
+    results = []
+    for item in batch:
+        try:
+            instance = await loop.run_in_executor(None, build_instance, item, profile)
+            prediction = (await client.predict([instance]))[0]
+            results.append(dict(prediction, id=item["id"]))
+        except (OSError, ValueError, PredictionError) as e:
+            results.append({"id": item["id"], "error": str(e)})
+    return results
+
+async def score_batch_tiled(client, batch, slots, tiling):
+    """Score each item of a batch as tiles, returning one result per item"""
+    async with slots:
+        loop = asyncio.get_running_loop()
+        results = []
+        for item in batch:
+            try:
+                image_bytes = await loop.run_in_executor(None, read_image_bytes, item)
+                prediction = await predict_tiled(client, image_bytes, **tiling)
+                results.append(dict(prediction, id=item["id"]))
+            except (OSError, ValueError, PredictionError) as e:
+                results.append({"id": item["id"], "error": str(e)})
+    return results
+
+async def score_images(client, items, output, batch_size=BATCH_SIZE, concurrency=CONCURRENCY, profile=None,
+                       tiling=None):
+    """
+    Score items with bounded concurrency and write results to output in input order
+    At most 2 x concurrency batches are held in memory at any time. With
+    tiling options, each image is scored as tiles instead.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    in_flight = collections.deque()
+    counts = {"images": 0, "errors": 0}
+    start_time = time.time()
+    last_report = start_time
+    
+    def write_results(results):
+        nonlocal last_report
+        for result in results:
+            output.write(json.dumps(result) + "\n")
+            counts["images"] += 1
+            if "error" in result:
+                counts["errors"] += 1
+        
+        now = time.time()
+        if now - last_report >= PROGRESS_INTERVAL_SECONDS:
+            print(f"  ... {counts['images']} images scored ({counts['images'] / (now - start_time):.1f} images/s)")
+            last_report = now
+    
+    for batch in iter_batches(items, batch_size):
+        if tiling is not None:
+            in_flight.append(asyncio.ensure_future(score_batch_tiled(client, batch, slots, tiling)))
+        else:
+            in_flight.append(asyncio.ensure_future(score_batch(client, batch, slots, profile)))
+        if len(in_flight) >= concurrency * 2:
+            write_results(await in_flight.popleft())
+    
+    while in_flight:
+        write_results(await in_flight.popleft())
+    
+    counts["seconds"] = time.time() - start_time
+    return counts
+
+async def run_batch_prediction_async(source, output_file=OUTPUT_FILE, endpoint_uri=None,
+                                     config_file=ENDPOINT_CONFIG_FILE, batch_size=BATCH_SIZE,
+                                     concurrency=CONCURRENCY, edge_model=None, tiling=None, cascade_band=None):
+    """
+    Score every image in source and stream results to output_file
+    With a cascade band, images go through the fast/accurate model cascade.
+    """
+    profile = load_profile(get_model_key(config_file, edge_model))
+    if edge_model:
+        from edge_inference import EdgeInferenceEngine
+        client = EdgeInferenceEngine(edge_model, batch_size=batch_size)
+    elif cascade_band:
+        from model_cascade import create_cascade_client
+        client = create_cascade_client(config_file, band=cascade_band, concurrency=concurrency)
+    else:
+        client = create_endpoint_client(endpoint_uri, config_file=config_file, concurrency=concurrency)
+    
+    async with client:
+        with open(output_file, "w") as output, instrumentation.span("score_images") as attributes:
+            counts = await score_images(
+                client, iter_image_inputs(source), output,
+                batch_size=batch_size, concurrency=concurrency, profile=profile, tiling=tiling
+            )
+            attributes.update(images=counts["images"], errors=counts["errors"])
+    
+    counts["retries"] = client.stats["retries"]
+    if cascade_band:
+        counts["cascade"] = client.stats
+    return counts
+
+def run_batch_prediction(source, output_file=OUTPUT_FILE, **kwargs):
+    """Synchronous wrapper around run_batch_prediction_async"""
+    return asyncio.run(run_batch_prediction_async(source, output_file, **kwargs))
+
+def predict_files(paths, endpoint_uri=None, config_file=ENDPOINT_CONFIG_FILE):
+    """Score a few local image files and return their predictions in order"""
+    async def predict():
+        client = create_endpoint_client(endpoint_uri, config_file=config_file)
+        async with client:
+            profile = load_profile(get_model_key(config_file))
+            instances = [build_instance({"path": path}, profile) for path in paths]
+            return await client.predict(instances)
+    
+    return asyncio.run(predict())
+
+def main():
+    parser = argparse.ArgumentParser(description='Score images against the elephant detection endpoint')
+    parser.add_argument('--input', required=True, help='Image directory or JSONL file of images')
+    parser.add_argument('--output', default=OUTPUT_FILE, help='JSONL file for prediction results')
+    parser.add_argument('--endpoint-uri', help='Predict URI (default: from endpoint_config.json)')
+    parser.add_argument('--config-file', default=ENDPOINT_CONFIG_FILE, help='Endpoint configuration file')
+    parser.add_argument('--edge-model', help='Score with an exported model on local CPU instead')
+    parser.add_argument('--cascade', action='store_true',
+                       help='Score with the fast model and escalate ambiguous images to the accurate model')
+    parser.add_argument('--cascade-band', type=float, nargs=2, metavar=('LOW', 'HIGH'),
+                       help='Elephant confidences escalated by --cascade (default: 0.3 0.9)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Instances per predict call')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help='Predict calls in flight')
+    parser.add_argument('--tile', action='store_true', help='Score high-resolution images as overlapping tiles')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help='Tile side in source pixels')
+    parser.add_argument('--tile-input-size', type=int, default=TILE_INPUT_SIZE, help='Tile side sent to the model')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "batch_predict")
+    if args.cascade:
+        from model_cascade import ESCALATION_BAND, print_stats as print_cascade_stats
+    
+    print("=" * 60)
+    print("🐘 ELEPHANT DETECTION - BATCH PREDICTION")
+    print("=" * 60)
+    print(f"  Input: {args.input}")
+    print(f"  Batch size: {args.batch_size}, concurrency: {args.concurrency}")
+    
+    counts = run_batch_prediction(
+        args.input,
+        args.output,
+        endpoint_uri=args.endpoint_uri,
+        config_file=args.config_file,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        edge_model=args.edge_model,
+        tiling={"tile_size": args.tile_size, "input_size": args.tile_input_size} if args.tile else None,
+        cascade_band=(args.cascade_band or ESCALATION_BAND) if args.cascade else None
+    )
+    
+    rate = counts["images"] / counts["seconds"] if counts["seconds"] else 0
+    print(f"\n✅ Scored {counts['images']} images in {counts['seconds']:.1f}s ({rate:.1f} images/s)")
+    print(f"  Errors: {counts['errors']}, retries: {counts['retries']}")
+    if "cascade" in counts:
+        print_cascade_stats(counts["cascade"])
+    print(f"✓ Results saved to: {args.output}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Prediction Endpoint Benchmark
+Replays sample images against an endpoint (or the local stub) and records
+latency percentiles, throughput and error rates
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import asyncio
+import itertools
+import collections
+from datetime import datetime
+from batch_predict import build_instance, iter_image_inputs
+from micro_batcher import percentile
+from vertex_client import ENDPOINT_CONFIG_FILE, PredictionError, create_endpoint_client
+import instrumentation
+
+# Configuration
+RESULTS_DIR = "bench_results"
+SAMPLE_LIMIT = 200  # Sample images held in memory and replayed in a loop
+DEFAULT_DURATION_SECONDS = 30
+DEFAULT_CONCURRENCY = 8
+BENCH_TIMEOUT_SECONDS = 60
+
+def load_samples(source, limit=SAMPLE_LIMIT):
+    """Load up to `limit` predict instances from a directory or JSONL file"""
+    samples = []
+    for item in iter_image_inputs(source):
+        try:
+            samples.append(build_instance(item))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Skipping {item['id']}: {e}")
+        if len(samples) >= limit:
+            break
+    
+    print(f"✓ Loaded {len(samples)} sample images from {source}")
+    return samples
+
+async def timed_predict(client, instances, records, scheduled_time):
+    """
+    Send one predict call and record (start offset, latency, error)
+    Latency is measured from the scheduled send time, so queueing behind a
+    saturated endpoint is counted (no coordinated omission).
+    """
+    error = None
+    try:
+        await client.predict(instances)
+    except PredictionError as e:
+        error = f"HTTP {e.status}" if e.status else str(e).split(":")[0]
+    
+    records.append((scheduled_time, time.perf_counter() - scheduled_time, error))
+
+async def run_closed_loop(client, samples, concurrency, duration, max_requests=None, batch_size=1):
+    """Keep `concurrency` calls in flight until the duration or request count is reached"""
+    records = []
+    batches = iter_sample_batches(samples, batch_size)
+    sent = itertools.count()
+    deadline = time.perf_counter() + duration
+    
+    async def worker():
+        while time.perf_counter() < deadline:
+            if max_requests is not None and next(sent) >= max_requests:
+                return
+            await timed_predict(client, next(batches), records, time.perf_counter())
+    
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return records
+
+async def run_open_loop(client, samples, rate, duration, max_requests=None, batch_size=1, seed=None):
+    """Send calls at Poisson arrivals of `rate` per second, whether or not earlier calls finished"""
+    records = []
+    batches = iter_sample_batches(samples, batch_size)
+    rng = random.Random(seed)
+    tasks = []
+    
+    start_time = time.perf_counter()
+    next_time = start_time
+    while next_time < start_time + duration:
+        if max_requests is not None and len(tasks) >= max_requests:
+            break
+        
+        delay = next_time - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        
+        tasks.append(asyncio.ensure_future(timed_predict(client, next(batches), records, next_time)))
+        next_time += rng.expovariate(rate)
+    
+    await asyncio.gather(*tasks)
+    return records
+
+def iter_sample_batches(samples, batch_size):
+    """Cycle through the samples in batches"""
+    cycle = itertools.cycle(samples)
+    while True:
+        yield [next(cycle) for _ in range(batch_size)]
+
+def latency_percentile(latencies, fraction):
+    """Rounded percentile of successful call latencies, None when no call succeeded"""
+    return round(percentile(latencies, fraction), 2) if latencies else None
+
+def summarize(records, batch_size=1):
+    """
+    Latency percentiles, throughput and error rates for a run
+    Percentiles only cover successful calls and are None if every call failed.
+    """
+    if not records:
+        return {"requests": 0}
+    
+    first_start = min(start for start, _, _ in records)
+    last_end = max(start + latency for start, latency, _ in records)
+    wall_seconds = max(last_end - first_start, 1e-9)
+    
+    ok_latencies = [latency * 1000 for _, latency, error in records if error is None]
+    errors = collections.Counter(error for _, _, error in records if error is not None)
+    
+    return {
+        "requests": len(records),
+        "errors": sum(errors.values()),
+        "error_rate": round(sum(errors.values()) / len(records), 4),
+        "errors_by_type": dict(errors),
+        "duration_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(ok_latencies) / wall_seconds, 2),
+        "images_per_second": round(len(ok_latencies) * batch_size / wall_seconds, 2),
+        "latency_ms": {
+            "mean": round(sum(ok_latencies) / len(ok_latencies), 2) if ok_latencies else None,
+            "p50": latency_percentile(ok_latencies, 0.50),
+            "p95": latency_percentile(ok_latencies, 0.95),
+            "p99": latency_percentile(ok_latencies, 0.99),
+            "max": round(max(ok_latencies), 2) if ok_latencies else None
+        }
+    }
+
+async def run_load(client, samples, rate=None, concurrency=DEFAULT_CONCURRENCY,
+                   duration=DEFAULT_DURATION_SECONDS, max_requests=None, batch_size=1, seed=None):
+    """Run an open-loop (rate) or closed-loop (concurrency) load and summarize it"""
+    if rate:
+        records = await run_open_loop(client, samples, rate, duration, max_requests, batch_size, seed)
+    else:
+        records = await run_closed_loop(client, samples, concurrency, duration, max_requests, batch_size)
+    return summarize(records, batch_size)
+
+async def run_benchmark(samples, endpoint_uri=None, config_file=ENDPOINT_CONFIG_FILE,
+                        stub_options=None, rate=None, concurrency=DEFAULT_CONCURRENCY,
+                        duration=DEFAULT_DURATION_SECONDS, max_requests=None, batch_size=1,
+                        retries=0, warmup_requests=0, stub_endpoints=1, hedge=True, hedge_delay_ms=None,
+                        seed=None):
+    """
+    Benchmark a real endpoint, or a local stub started in-process when
+    stub_options is given. Retries are off by default so errors are counted.
+    With several endpoint URIs (or stub_endpoints > 1) calls are routed
+    between them with hedging.
+    """
+    stub_runners = []
+    if stub_options is not None:
+        from stub_endpoint import start_stub_server
+        endpoint_uri = []
+        for number in range(stub_endpoints):
+            stub_seed = None if seed is None else seed + number
+            stub_runner, stub_uri = await start_stub_server(port=0, seed=stub_seed, **stub_options)
+            stub_runners.append(stub_runner)
+            endpoint_uri.append(stub_uri)
+    
+    # Open-loop runs need enough connections not to throttle themselves
+    connections = concurrency if not rate else max(concurrency, int(rate * 4))
+    client = create_endpoint_client(
+        endpoint_uri, config_file=config_file, concurrency=connections,
+        max_retries=retries, timeout=BENCH_TIMEOUT_SECONDS, hedge=hedge, hedge_delay_ms=hedge_delay_ms
+    )
+    
+    try:
+        async with client:
+            if warmup_requests:
+                await run_closed_loop(client, samples, concurrency, duration, warmup_requests, batch_size)
+            
+            summary = await run_load(
+                client, samples, rate=rate, concurrency=concurrency, duration=duration,
+                max_requests=max_requests, batch_size=batch_size, seed=seed
+            )
+    finally:
+        for stub_runner in stub_runners:
+            await stub_runner.cleanup()
+    
+    summary["target"] = "stub" if stub_options is not None else client.endpoint_uri
+    if "endpoints" in client.stats:
+        summary["routing"] = client.stats
+    return summary
+
+def save_results(results, output_file=None):
+    """Save benchmark results as JSON"""
+    if output_file is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        label = results.get("label") or "run"
+        output_file = os.path.join(RESULTS_DIR, f"{label}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    
+    with open(output_file, "w") as f:
+        json.dump(results, f, indent=2)
+    
+    print(f"✓ Results saved to: {output_file}")
+    return output_file
+
+def print_summary(results):
+    """Print a run summary"""
+    latency = results["latency_ms"]
+    print(f"  Requests: {results['requests']} ({results['errors']} errors, {results['error_rate']:.2%})")
+    print(f"  Throughput: {results['throughput_rps']} req/s ({results['images_per_second']} images/s)")
+    print(f"  Latency ms: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    if results["errors_by_type"]:
+        print(f"  Errors: {results['errors_by_type']}")
+    if results.get("routing"):
+        routing = results["routing"]
+        print(f"  Hedged: {routing['hedged']} ({routing['hedge_wins']} won), failovers: {routing['failovers']}")
+        for uri, health in routing["endpoints"].items():
+            print(f"    {uri}: {health['wins']} wins, EWMA {health['latency_ms']}ms, "
+                  f"errors {health['error_rate']:.2%}, {health['cancelled']} cancelled")
+
+def compare_results(result_files):
+    """Print saved runs side by side"""
+    print(f"\n{'run':<40} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>8}")
+    for path in result_files:
+        with open(path, "r") as f:
+            results = json.load(f)
+        latency = results["latency_ms"]
+        name = results.get("label") or os.path.basename(path)
+        print(f"{name:<40} {results['throughput_rps']:>8} {str(latency['p50']):>8} "
+              f"{str(latency['p95']):>8} {str(latency['p99']):>8} {results['error_rate']:>8.2%}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the elephant detection endpoint')
+    parser.add_argument('--input', help='Image directory or JSONL file of requests to replay')
+    parser.add_argument('--endpoint-uri', nargs='+',
+                       help='Predict URI, several are routed with hedging (default: from endpoint_config.json)')
+    parser.add_argument('--config-file', default=ENDPOINT_CONFIG_FILE, help='Endpoint configuration file')
+    parser.add_argument('--stub', action='store_true', help='Benchmark a local stub endpoint instead')
+    parser.add_argument('--stub-latency-ms', type=float, default=50.0, help='Stub base service time')
+    parser.add_argument('--stub-per-instance-ms', type=float, default=0.0, help='Stub service time per instance')
+    parser.add_argument('--stub-jitter-ms', type=float, default=10.0, help='Stub random extra service time')
+    parser.add_argument('--stub-replicas', type=int, help='Stub concurrent call limit')
+    parser.add_argument('--stub-error-rate', type=float, default=0.0, help='Stub 503 rate')
+    parser.add_argument('--stub-tail-rate', type=float, default=0.0, help='Stub fraction of slow calls')
+    parser.add_argument('--stub-tail-ms', type=float, default=0.0, help='Stub extra service time of slow calls')
+    parser.add_argument('--stub-endpoints', type=int, default=1, help='Stub endpoints to route between')
+    parser.add_argument('--hedge-delay-ms', type=float,
+                       help='Hedge calls slower than this (default: the endpoint\'s recent p95)')
+    parser.add_argument('--no-hedge', action='store_true', help='Route between endpoints without hedging')
+    parser.add_argument('--rate', type=float, help='Open-loop request rate per second (default: closed loop)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Closed-loop calls in flight')
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION_SECONDS, help='Run length in seconds')
+    parser.add_argument('--requests', type=int, help='Stop after this many requests')
+    parser.add_argument('--batch-size', type=int, default=1, help='Instances per predict call')
+    parser.add_argument('--warmup', type=int, default=0, help='Untimed requests sent before measuring')
+    parser.add_argument('--retries', type=int, default=0, help='Client retries per call')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible runs')
+    parser.add_argument('--label', help='Name for this run (e.g. the deployment size)')
+    parser.add_argument('--output', help='Results JSON file (default: bench_results/<label>_<time>.json)')
+    parser.add_argument('--compare', nargs='+', help='Compare saved result files and exit')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "benchmark")
+    
+    if args.compare:
+        compare_results(args.compare)
+        return
+    
+    if not args.input:
+        parser.error("--input is required unless --compare is used")
+    
+    print("=" * 60)
+    print("🐘 ELEPHANT DETECTION - ENDPOINT BENCHMARK")
+    print("=" * 60)
+    
+    samples = load_samples(args.input)
+    if not samples:
+        print("❌ No sample images found")
+        return
+    
+    stub_options = None
+    if args.stub:
+        stub_options = {
+            "latency_ms": args.stub_latency_ms,
+            "per_instance_ms": args.stub_per_instance_ms,
+            "jitter_ms": args.stub_jitter_ms,
+            "replicas": args.stub_replicas,
+            "error_rate": args.stub_error_rate,
+            "tail_rate": args.stub_tail_rate,
+            "tail_ms": args.stub_tail_ms
+        }
+    
+    mode = f"open loop at {args.rate} req/s" if args.rate else f"closed loop with {args.concurrency} in flight"
+    print(f"\n⏱️ Running {mode} for up to {args.duration}s")
+    
+    summary = asyncio.run(run_benchmark(
+        samples,
+        endpoint_uri=args.endpoint_uri,
+        config_file=args.config_file,
+        stub_options=stub_options,
+        rate=args.rate,
+        concurrency=args.concurrency,
+        duration=args.duration,
+        max_requests=args.requests,
+        batch_size=args.batch_size,
+        retries=args.retries,
+        warmup_requests=args.warmup,
+        stub_endpoints=args.stub_endpoints,
+        hedge=not args.no_hedge,
+        hedge_delay_ms=args.hedge_delay_ms,
+        seed=args.seed
+    ))
+    
+    if not summary["requests"]:
+        print("❌ No requests completed")
+        return
+    
+    results = {
+        "label": args.label,
+        "timestamp": datetime.now().isoformat(),
+        "mode": "open" if args.rate else "closed",
+        "rate": args.rate,
+        "concurrency": None if args.rate else args.concurrency,
+        "batch_size": args.batch_size,
+        "samples": len(samples),
+        "stub": stub_options,
+        **summary
+    }
+    
+    print("\n" + "=" * 60)
+    print("✅ BENCHMARK COMPLETE")
+    print("=" * 60)
+    print_summary(results)
+    save_results(results, args.output)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
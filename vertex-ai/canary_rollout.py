@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Latency-Gated Canary Rollout
+Deploys a new model next to the current one at a small traffic share, probes
+both and moves traffic over step by step or rolls back automatically
+"""
+
+import json
+import time
+import random
+import argparse
+import asyncio
+import collections
+from datetime import datetime
+import deploy_model
+from benchmark import load_samples
+from micro_batcher import percentile
+from pipeline_runner import find_deployed_model
+from vertex_client import PredictionError, create_endpoint_client, elephant_confidence
+import instrumentation
+
+# Configuration
+CANARY_REPORT_FILE = "canary_report.json"
+TRAFFIC_STEPS = [10, 25, 50]  # Canary traffic share (%) probed before it gets 100
+PROBE_RATE = 10.0  # Requests per second while probing a step
+PROBE_SECONDS = 30
+PROBE_MAX_ROUNDS = 4  # Probe rounds per step while waiting for enough canary calls
+MIN_CALLS = 30  # Calls per model needed to judge a step
+LATENCY_TOLERANCE = 0.10  # Canary percentiles may be this much slower than the current model
+GATE_PERCENTILES = {"p50": 30, "p95": 30, "p99": 100}  # Percentile -> calls per model needed to judge it
+AGREEMENT_FLOOR = 0.95  # Share of images where both models give the same top label
+MAX_ERROR_RATE = 0.01  # Allowed rise of the canary's own error rate over the baseline
+
+class VertexCanaryTarget:
+    """Current and canary model deployed side by side on one Vertex AI endpoint"""
+    
+    def __init__(self, endpoint, model, deployment_size="small", config=None, location=deploy_model.LOCATION):
+        self.endpoint = endpoint
+        self.model = model
+        self.deployment_size = deployment_size
+        self.config = config
+        self.endpoint_uri = (
+            f"https://{location}-aiplatform.googleapis.com/v1/"
+            f"{endpoint.resource_name}:predict"
+        )
+        
+        # The current model is the one serving most of the traffic
+        traffic_split = endpoint.traffic_split
+        self.current_id = max(traffic_split, key=traffic_split.get)
+        self.canary_id = None
+    
+    def deploy_canary(self, share):
+        """Deploy the new model with `share` percent of the traffic"""
+        deploy_model.deploy_model_to_endpoint(
+            self.model, self.endpoint, self.deployment_size, self.config, traffic_percentage=share
+        )
+        self.canary_id = find_deployed_model(self.endpoint, self.model).id
+        return self.canary_id
+    
+    def set_traffic(self, share):
+        """Give the canary `share` percent of the traffic and the current model the rest"""
+        with instrumentation.span("set_traffic", share=share):
+            self.endpoint.update(traffic_split={self.current_id: 100 - share, self.canary_id: share})
+    
+    def promote(self):
+        """Send all traffic to the canary and undeploy the previous model"""
+        self.set_traffic(100)
+        with instrumentation.span("undeploy_model"):
+            self.endpoint.undeploy(self.current_id)
+    
+    def rollback(self):
+        """Send all traffic back to the current model and undeploy the canary"""
+        if self.canary_id is None:
+            return
+        self.set_traffic(0)
+        with instrumentation.span("undeploy_model"):
+            self.endpoint.undeploy(self.canary_id)
+
+class StubCanaryTarget:
+    """
+    Stand-in for an endpoint with two deployed models
+    Changes the traffic split of a stub endpoint app, so a rollout can be
+    rehearsed and reproduced without cloud resources.
+    """
+    
+    current_id = "current"
+    
+    def __init__(self, app, endpoint_uri):
+        self.app = app
+        self.endpoint_uri = endpoint_uri
+        self.canary_id = None
+    
+    def deploy_canary(self, share):
+        self.canary_id = "canary"
+        self.set_traffic(share)
+        return self.canary_id
+    
+    def set_traffic(self, share):
+        split = self.app["traffic_split"]
+        split.clear()
+        split.update(
+            (deployed_model_id, weight)
+            for deployed_model_id, weight in ((self.current_id, 100 - share), (self.canary_id, share))
+            if weight
+        )
+    
+    def promote(self):
+        self.set_traffic(100)
+    
+    def rollback(self):
+        if self.canary_id is not None:
+            self.set_traffic(0)
+
+def top_label(prediction):
+    """Highest-confidence label of a prediction"""
+    labels = prediction.get("displayNames", [])
+    confidences = prediction.get("confidences", [])
+    if not labels:
+        return None
+    return max(zip(confidences, labels))[1]
+
+async def probe_call(client, samples, index, scheduled_time, observations, predictions):
+    """One probe call, recorded under the deployed model that served it"""
+    try:
+        response = await client.predict_response([samples[index]])
+    except PredictionError:
+        observations["errors"] += 1
+        return
+    
+    deployed_model_id = response.get("deployedModelId")
+    prediction = response["predictions"][0]
+    observations["latencies"][deployed_model_id].append((time.perf_counter() - scheduled_time) * 1000)
+    predictions[deployed_model_id][index] = (top_label(prediction), elephant_confidence(prediction))
+
+async def probe_step(client, samples, rate, duration, rng, predictions):
+    """
+    Send single-image calls at Poisson arrivals for `duration` seconds
+    Latencies are measured from the scheduled send time. Predictions are kept
+    per sample across steps, so agreement grows with every step.
+    """
+    observations = {"calls": 0, "errors": 0, "latencies": collections.defaultdict(list)}
+    tasks = []
+    
+    start_time = time.perf_counter()
+    next_time = start_time
+    while next_time < start_time + duration:
+        delay = next_time - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        
+        index = rng.randrange(len(samples))
+        tasks.append(asyncio.ensure_future(
+            probe_call(client, samples, index, next_time, observations, predictions)
+        ))
+        next_time += rng.expovariate(rate)
+    
+    await asyncio.gather(*tasks)
+    observations["calls"] = len(tasks)
+    return observations
+
+def latency_percentiles(latencies):
+    """Latency percentiles in milliseconds"""
+    return {
+        "calls": len(latencies),
+        "p50": round(percentile(latencies, 0.50), 2),
+        "p95": round(percentile(latencies, 0.95), 2),
+        "p99": round(percentile(latencies, 0.99), 2)
+    }
+
+def prediction_agreement(current, canary):
+    """Top-label agreement and mean confidence change over images both models answered"""
+    shared = set(current) & set(canary)
+    if not shared:
+        return {"images": 0, "top_label": None, "mean_confidence_delta": None}
+    
+    return {
+        "images": len(shared),
+        "top_label": round(sum(current[i][0] == canary[i][0] for i in shared) / len(shared), 4),
+        "mean_confidence_delta": round(sum(abs(current[i][1] - canary[i][1]) for i in shared) / len(shared), 4)
+    }
+
+def canary_error_rate(error_rate, baseline_error_rate, share):
+    """
+    Estimated error rate of the canary's own calls
+    Failed calls carry no deployedModelId, so the errors above what the current
+    model produced before the canary (on its remaining share) are put down to
+    the canary and divided by its share. Otherwise a canary failing 9% of its
+    calls at 10% traffic would show as under 1% overall.
+    """
+    fraction = share / 100
+    excess = error_rate - baseline_error_rate * (1 - fraction)
+    return round(min(1.0, max(0.0, excess / fraction)), 4)
+
+def judge_step(step, tolerance=LATENCY_TOLERANCE, agreement_floor=AGREEMENT_FLOOR):
+    """Reasons the canary fails this step (empty if it passes)"""
+    reasons = []
+    current, canary = step["latency_ms"]["current"], step["latency_ms"]["canary"]
+    
+    if step["canary_error_rate"] - step["baseline_error_rate"] > MAX_ERROR_RATE:
+        reasons.append(
+            f"canary error rate {step['canary_error_rate']:.2%} > "
+            f"baseline {step['baseline_error_rate']:.2%} + {MAX_ERROR_RATE:.0%}"
+        )
+    for name, min_calls in GATE_PERCENTILES.items():
+        if min(current["calls"], canary["calls"]) < min_calls:
+            continue
+        limit = current[name] * (1 + tolerance)
+        if canary[name] > limit:
+            reasons.append(f"{name} {canary[name]}ms > {limit:.1f}ms")
+    
+    agreement = step["agreement"]["top_label"]
+    if agreement is not None and agreement < agreement_floor:
+        reasons.append(f"top-label agreement {agreement:.2%} < {agreement_floor:.0%}")
+    return reasons
+
+async def run_canary(target, samples, steps=TRAFFIC_STEPS, rate=PROBE_RATE, probe_seconds=PROBE_SECONDS,
+                     tolerance=LATENCY_TOLERANCE, agreement_floor=AGREEMENT_FLOOR, seed=None):
+    """
+    Probe the current model alone for a baseline error rate, deploy the canary
+    at the first traffic share, then probe each step and either raise its share
+    or roll back. Any exception or interrupt after the canary is deployed also
+    rolls back, so it never keeps serving unjudged traffic. Returns the rollout
+    report.
+    """
+    rng = random.Random(seed)
+    predictions = collections.defaultdict(dict)
+    report = {
+        "created_time": datetime.now().isoformat(),
+        "endpoint_uri": target.endpoint_uri,
+        "current_model": target.current_id,
+        "gate": {
+            "latency_tolerance": tolerance,
+            "percentiles": GATE_PERCENTILES,
+            "agreement_floor": agreement_floor,
+            "max_error_rate": MAX_ERROR_RATE
+        },
+        "steps": []
+    }
+    
+    client = create_endpoint_client(target.endpoint_uri, max_retries=0, concurrency=max(8, int(rate * 4)))
+    async with client:
+        print(f"\n📏 Measuring the current model's error rate")
+        with instrumentation.span("probe_baseline"):
+            baseline = await probe_step(client, samples, rate, probe_seconds, rng, predictions)
+        baseline_error_rate = round(baseline["errors"] / baseline["calls"], 4) if baseline["calls"] else 0
+        report["baseline_error_rate"] = baseline_error_rate
+        print(f"  Baseline: {baseline['calls']} calls, errors {baseline_error_rate:.2%}")
+        
+        print(f"\n🐤 Deploying canary at {steps[0]}% traffic")
+        with instrumentation.span("deploy_canary", share=steps[0]):
+            report["canary_model"] = await asyncio.to_thread(target.deploy_canary, steps[0])
+        
+        try:
+            report["result"] = await run_steps(
+                target, client, samples, steps, rate, probe_seconds, tolerance, agreement_floor,
+                rng, predictions, report
+            )
+        except BaseException:
+            print(f"\n↩️ Rollout interrupted, rolling back the canary")
+            try:
+                target.rollback()
+            except Exception as e:
+                print(f"❌ Rollback failed, undeploy {report['canary_model']} by hand: {e}")
+            raise
+    return report
+
+async def run_steps(target, client, samples, steps, rate, probe_seconds, tolerance, agreement_floor,
+                    rng, predictions, report):
+    """Probe every traffic step of a deployed canary, then promote it or roll it back"""
+    for number, share in enumerate(steps):
+        if number:
+            await asyncio.to_thread(target.set_traffic, share)
+        
+        latencies = collections.defaultdict(list)
+        calls = errors = 0
+        with instrumentation.span("probe_step", share=share):
+            for _ in range(PROBE_MAX_ROUNDS):
+                observations = await probe_step(client, samples, rate, probe_seconds, rng, predictions)
+                calls += observations["calls"]
+                errors += observations["errors"]
+                for deployed_model_id, values in observations["latencies"].items():
+                    latencies[deployed_model_id].extend(values)
+                if min(len(latencies[target.current_id]), len(latencies[report["canary_model"]])) >= MIN_CALLS:
+                    break
+        
+        error_rate = round(errors / calls, 4) if calls else 0
+        step = {
+            "share": share,
+            "calls": calls,
+            "error_rate": error_rate,
+            "baseline_error_rate": report["baseline_error_rate"],
+            "canary_error_rate": canary_error_rate(error_rate, report["baseline_error_rate"], share),
+            "latency_ms": {
+                "current": latency_percentiles(latencies[target.current_id]),
+                "canary": latency_percentiles(latencies[report["canary_model"]])
+            },
+            "agreement": prediction_agreement(
+                predictions[target.current_id], predictions[report["canary_model"]]
+            )
+        }
+        
+        if min(step["latency_ms"]["current"]["calls"], step["latency_ms"]["canary"]["calls"]) < MIN_CALLS:
+            step["reasons"] = [f"fewer than {MIN_CALLS} calls per model, raise --probe-seconds"]
+        else:
+            step["reasons"] = judge_step(step, tolerance, agreement_floor)
+        step["passed"] = not step["reasons"]
+        report["steps"].append(step)
+        print_step(step)
+        
+        if not step["passed"]:
+            print(f"\n↩️ Rolling back: {'; '.join(step['reasons'])}")
+            with instrumentation.span("rollback"):
+                await asyncio.to_thread(target.rollback)
+            return "rolled_back"
+    
+    print(f"\n🚀 Promoting canary to 100% traffic")
+    with instrumentation.span("promote"):
+        await asyncio.to_thread(target.promote)
+    return "promoted"
+
+def print_step(step):
+    """Print one probe step"""
+    current, canary = step["latency_ms"]["current"], step["latency_ms"]["canary"]
+    agreement = step["agreement"]
+    mark = "✓" if step["passed"] else "❌"
+    print(f"  {mark} {step['share']:>3}% canary: {step['calls']} calls, errors {step['error_rate']:.2%} "
+          f"(canary {step['canary_error_rate']:.2%})")
+    print(f"      current p50 {current['p50']}  p95 {current['p95']}  p99 {current['p99']} ms ({current['calls']} calls)")
+    print(f"      canary  p50 {canary['p50']}  p95 {canary['p95']}  p99 {canary['p99']} ms ({canary['calls']} calls)")
+    if agreement["images"]:
+        print(f"      agreement {agreement['top_label']:.2%} over {agreement['images']} images, "
+              f"mean confidence change {agreement['mean_confidence_delta']}")
+
+def save_report(report, output_file=CANARY_REPORT_FILE):
+    """Save the rollout report as JSON"""
+    with open(output_file, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Canary report saved to: {output_file}")
+
+async def rehearse_canary(samples, current_options, canary_options, seed=None, **kwargs):
+    """Run a canary rollout against a local stub endpoint with two deployed models"""
+    from stub_endpoint import start_stub_server
+    runner, endpoint_uri = await start_stub_server(
+        port=0, seed=seed,
+        deployed_models={StubCanaryTarget.current_id: current_options, "canary": canary_options}
+    )
+    try:
+        return await run_canary(StubCanaryTarget(runner.app, endpoint_uri), samples, seed=seed, **kwargs)
+    finally:
+        await runner.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Rehearse a latency-gated canary rollout against the local stub '
+                    '(deploy_model.py --canary runs it on Vertex AI)'
+    )
+    parser.add_argument('--input', required=True, help='Image directory or JSONL file of probe requests')
+    parser.add_argument('--steps', type=int, nargs='+', default=TRAFFIC_STEPS,
+                       help='Canary traffic shares (%%) to probe before promoting')
+    parser.add_argument('--rate', type=float, default=PROBE_RATE, help='Probe requests per second')
+    parser.add_argument('--probe-seconds', type=float, default=PROBE_SECONDS, help='Length of each probe round')
+    parser.add_argument('--latency-tolerance', type=float, default=LATENCY_TOLERANCE,
+                       help='Allowed canary slowdown per percentile (0.1 = 10%%)')
+    parser.add_argument('--agreement-floor', type=float, default=AGREEMENT_FLOOR,
+                       help='Minimum top-label agreement with the current model')
+    parser.add_argument('--current-latency-ms', type=float, default=50.0, help='Stub current model service time')
+    parser.add_argument('--canary-latency-ms', type=float, default=40.0, help='Stub canary model service time')
+    parser.add_argument('--jitter-ms', type=float, default=10.0, help='Stub random extra service time')
+    parser.add_argument('--canary-disagreement', type=float, default=0.0,
+                       help='Share of images the stub canary labels differently')
+    parser.add_argument('--canary-error-rate', type=float, default=0.0,
+                       help='Share of the stub canary\'s calls failing with 503')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible runs')
+    parser.add_argument('--output', default=CANARY_REPORT_FILE, help='Rollout report file')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "canary_rollout")
+    
+    print("=" * 60)
+    print("🐘 ELEPHANT DETECTION - CANARY ROLLOUT (STUB)")
+    print("=" * 60)
+    
+    samples = load_samples(args.input)
+    if not samples:
+        print("❌ No sample images found")
+        return
+    
+    report = asyncio.run(rehearse_canary(
+        samples,
+        {"latency_ms": args.current_latency_ms, "jitter_ms": args.jitter_ms},
+        {"latency_ms": args.canary_latency_ms, "jitter_ms": args.jitter_ms,
+         "disagreement": args.canary_disagreement, "error_rate": args.canary_error_rate},
+        seed=args.seed,
+        steps=args.steps,
+        rate=args.rate,
+        probe_seconds=args.probe_seconds,
+        tolerance=args.latency_tolerance,
+        agreement_floor=args.agreement_floor
+    ))
+    
+    print("\n" + "=" * 60)
+    print("✅ CANARY PROMOTED" if report["result"] == "promoted" else "↩️ CANARY ROLLED BACK")
+    print("=" * 60)
+    save_report(report, args.output)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Endpoint Capacity Planner
+Probes a deployment at increasing request rates, fits per-replica throughput
+and recommends the machine type and replica counts for a target load
+"""
+
+import json
+import math
+import argparse
+import asyncio
+from datetime import datetime
+from benchmark import load_samples, run_load
+from deploy_model import MACHINE_TYPES
+from vertex_client import ENDPOINT_CONFIG_FILE, create_endpoint_client
+import instrumentation
+
+# Configuration
+CAPACITY_PLAN_FILE = "capacity_plan.json"
+PROBE_START_RATE = 2.0  # Requests per second for the first probe step
+PROBE_GROWTH = 1.5  # Rate multiplier between steps
+PROBE_MAX_STEPS = 12
+PROBE_STEP_SECONDS = 10
+PROBE_REFINE_STEPS = 2  # Bisection steps between the last passing and first failing rate
+MAX_ERROR_RATE = 0.01
+TARGET_UTILIZATION = 0.7  # Headroom for bursts and autoscaling lag
+
+def step_passes(summary, slo_ms, slo_percentile):
+    """Whether a probe step met the latency SLO without errors"""
+    latency = summary["latency_ms"].get(slo_percentile)
+    return (
+        latency is not None
+        and latency <= slo_ms
+        and summary["error_rate"] <= MAX_ERROR_RATE
+    )
+
+async def probe_capacity(client, samples, slo_ms, slo_percentile="p95", start_rate=PROBE_START_RATE,
+                         growth=PROBE_GROWTH, max_steps=PROBE_MAX_STEPS,
+                         step_seconds=PROBE_STEP_SECONDS, seed=None):
+    """
+    Raise the open-loop rate step by step until the SLO fails, then bisect
+    Returns (highest passing summary or None, list of all step summaries). If
+    every step passes, the highest rate is only a lower bound on capacity.
+    """
+    steps = []
+    best = None
+    failed_rate = None
+    
+    async def run_step(rate):
+        summary = await run_load(client, samples, rate=rate, duration=step_seconds, seed=seed)
+        summary["rate"] = round(rate, 2)
+        summary["passed"] = step_passes(summary, slo_ms, slo_percentile)
+        steps.append(summary)
+        
+        mark = "✓" if summary["passed"] else "❌"
+        print(f"  {mark} {rate:7.2f} req/s -> {summary['throughput_rps']:7.2f} req/s, "
+              f"{slo_percentile} {summary['latency_ms'][slo_percentile]}ms, "
+              f"errors {summary['error_rate']:.2%}")
+        return summary
+    
+    rate = start_rate
+    for _ in range(max_steps):
+        summary = await run_step(rate)
+        if not summary["passed"]:
+            failed_rate = rate
+            break
+        best = summary
+        rate *= growth
+    
+    if failed_rate is None and best is not None:
+        print(f"⚠️ All {max_steps} probe steps passed, so capacity is above {best['rate']} req/s and the plan "
+              f"will over-provision. Raise --probe-max-steps to probe higher rates")
+    
+    if best is not None and failed_rate is not None:
+        low, high = best["rate"], failed_rate
+        for _ in range(PROBE_REFINE_STEPS):
+            middle = (low + high) / 2
+            summary = await run_step(middle)
+            if summary["passed"]:
+                best, low = summary, middle
+            else:
+                high = middle
+    
+    return best, steps
+
+def recommend_deployment(deployment_size, per_replica_rps, peak_rate, baseline_rate=None,
+                         target_utilization=TARGET_UTILIZATION):
+    """Deployment config in the MACHINE_TYPES format sized for the target load"""
+    usable_rps = per_replica_rps * target_utilization
+    max_replicas = max(1, math.ceil(peak_rate / usable_rps))
+    min_replicas = max(1, math.ceil(baseline_rate / usable_rps)) if baseline_rate else 1
+    
+    base = MACHINE_TYPES[deployment_size]
+    return {
+        "machine_type": base["machine_type"],
+        "accelerator_type": base["accelerator_type"],
+        "accelerator_count": base["accelerator_count"],
+        "min_replica_count": min(min_replicas, max_replicas),
+        "max_replica_count": max_replicas,
+        "description": (
+            f"Planned {base['machine_type']} deployment for {peak_rate:g} req/s peak "
+            f"({per_replica_rps:.1f} req/s per replica at {target_utilization:.0%} target utilization)"
+        )
+    }
+
+async def plan_capacity(samples, deployment_size, probe_replicas, peak_rate, slo_ms,
+                        slo_percentile="p95", baseline_rate=None, endpoint_uri=None,
+                        config_file=ENDPOINT_CONFIG_FILE, stub_options=None,
+                        step_seconds=PROBE_STEP_SECONDS, target_utilization=TARGET_UTILIZATION, seed=None,
+                        max_steps=PROBE_MAX_STEPS):
+    """
+    Probe a deployment running `probe_replicas` replicas (or a local stub with
+    that many) and build a capacity plan. Returns None if even the lowest
+    probe rate misses the SLO.
+    """
+    stub_runner = None
+    if stub_options is not None:
+        from stub_endpoint import start_stub_server
+        stub_runner, endpoint_uri = await start_stub_server(
+            port=0, seed=seed, replicas=probe_replicas, **stub_options
+        )
+    
+    # Retries are off so overload shows up as errors instead of hidden latency
+    client = create_endpoint_client(
+        endpoint_uri, config_file=config_file, max_retries=0,
+        concurrency=max(64, int(peak_rate * 4))
+    )
+    
+    try:
+        async with client:
+            best, steps = await probe_capacity(
+                client, samples, slo_ms, slo_percentile, max_steps=max_steps, step_seconds=step_seconds, seed=seed
+            )
+    finally:
+        if stub_runner is not None:
+            await stub_runner.cleanup()
+    
+    if best is None:
+        return None
+    
+    # The offered rate is steadier than throughput measured over a short step
+    per_replica_rps = best["rate"] / probe_replicas
+    return {
+        "created_time": datetime.now().isoformat(),
+        "target": {
+            "peak_rate": peak_rate,
+            "baseline_rate": baseline_rate,
+            "slo_ms": slo_ms,
+            "slo_percentile": slo_percentile,
+            "target_utilization": target_utilization
+        },
+        "probe": {
+            "target": "stub" if stub_options is not None else client.endpoint_uri,
+            "stub": stub_options,
+            "deployment_size": deployment_size,
+            "replicas": probe_replicas,
+            "sustained_rps": best["rate"],
+            # No step failed, so the real capacity is higher than measured
+            "lower_bound": all(step["passed"] for step in steps),
+            "per_replica_rps": round(per_replica_rps, 2),
+            "latency_ms_at_capacity": best["latency_ms"],
+            "steps": steps
+        },
+        "deployment": recommend_deployment(
+            deployment_size, per_replica_rps, peak_rate, baseline_rate, target_utilization
+        )
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Plan endpoint machine type and replicas from measured throughput')
+    parser.add_argument('--input', required=True, help='Image directory or JSONL file of requests to replay')
+    parser.add_argument('--peak-rate', type=float, required=True, help='Target peak requests per second')
+    parser.add_argument('--baseline-rate', type=float, help='Typical off-peak requests per second (sets min replicas)')
+    parser.add_argument('--slo-ms', type=float, required=True, help='Latency SLO in milliseconds')
+    parser.add_argument('--slo-percentile', choices=['p50', 'p95', 'p99'], default='p95',
+                       help='Latency percentile the SLO applies to')
+    parser.add_argument('--deployment-size', choices=list(MACHINE_TYPES), default='small',
+                       help='Machine type of the probed deployment')
+    parser.add_argument('--probe-replicas', type=int, default=1,
+                       help='Replicas serving during the probe (deploy with min = max replicas)')
+    parser.add_argument('--endpoint-uri', help='Predict URI (default: from endpoint_config.json)')
+    parser.add_argument('--config-file', default=ENDPOINT_CONFIG_FILE, help='Endpoint configuration file')
+    parser.add_argument('--stub', action='store_true', help='Probe a local stub endpoint instead')
+    parser.add_argument('--stub-latency-ms', type=float, default=50.0, help='Stub base service time')
+    parser.add_argument('--stub-jitter-ms', type=float, default=10.0, help='Stub random extra service time')
+    parser.add_argument('--step-seconds', type=float, default=PROBE_STEP_SECONDS, help='Length of each probe step')
+    parser.add_argument('--probe-max-steps', type=int, default=PROBE_MAX_STEPS,
+                       help=f'Rate increases (x{PROBE_GROWTH} each) before giving up on finding capacity')
+    parser.add_argument('--target-utilization', type=float, default=TARGET_UTILIZATION,
+                       help='Fraction of measured replica capacity to plan for')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible runs')
+    parser.add_argument('--output', default=CAPACITY_PLAN_FILE, help='Capacity plan output file')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "capacity_planner")
+    
+    print("=" * 60)
+    print("🐘 ELEPHANT DETECTION - CAPACITY PLANNER")
+    print("=" * 60)
+    
+    samples = load_samples(args.input)
+    if not samples:
+        print("❌ No sample images found")
+        return
+    
+    stub_options = None
+    if args.stub:
+        stub_options = {"latency_ms": args.stub_latency_ms, "jitter_ms": args.stub_jitter_ms}
+    
+    print(f"\n📈 Probing {args.deployment_size} deployment with {args.probe_replicas} replica(s)")
+    print(f"  SLO: {args.slo_percentile} <= {args.slo_ms}ms, errors <= {MAX_ERROR_RATE:.0%}")
+    
+    plan = asyncio.run(plan_capacity(
+        samples,
+        args.deployment_size,
+        args.probe_replicas,
+        args.peak_rate,
+        args.slo_ms,
+        slo_percentile=args.slo_percentile,
+        baseline_rate=args.baseline_rate,
+        endpoint_uri=args.endpoint_uri,
+        config_file=args.config_file,
+        stub_options=stub_options,
+        step_seconds=args.step_seconds,
+        target_utilization=args.target_utilization,
+        seed=args.seed,
+        max_steps=args.probe_max_steps
+    ))
+    
+    if plan is None:
+        print(f"\n❌ The {args.deployment_size} deployment misses the SLO even at {PROBE_START_RATE} req/s")
+        print("  Probe a larger deployment size or relax the SLO")
+        return
+    
+    with open(args.output, "w") as f:
+        json.dump(plan, f, indent=2)
+    
+    deployment = plan["deployment"]
+    print("\n" + "=" * 60)
+    print("✅ CAPACITY PLAN COMPLETE")
+    print("=" * 60)
+    print(f"  Per-replica throughput: {'at least ' if plan['probe']['lower_bound'] else ''}"
+          f"{plan['probe']['per_replica_rps']} req/s")
+    print(f"  Machine type: {deployment['machine_type']}")
+    if deployment['accelerator_type']:
+        print(f"  Accelerator: {deployment['accelerator_type']} x{deployment['accelerator_count']}")
+    print(f"  Min replicas: {deployment['min_replica_count']}")
+    print(f"  Max replicas: {deployment['max_replica_count']}")
+    print(f"\n✓ Capacity plan saved to: {args.output}")
+    print(f"  Deploy with: python deploy_model.py --capacity-plan {args.output}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
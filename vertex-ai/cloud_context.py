@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Shared Google Cloud Context
+Loads the Vertex AI and Cloud Storage SDKs on first use and shares one
+initialized context between all stages that run in the same process
+"""
+
+import importlib
+import threading
+import instrumentation
+
+_initialized = None
+_storage_client = None
+_storage_lock = threading.Lock()
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access
+    Scripts use `aiplatform.Endpoint` as before, but `--help` and config-only
+    commands never pay for importing the SDK.
+    """
+    
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attribute):
+        if self._module is None:
+            with instrumentation.span("import_sdk", module=self._name):
+                self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+aiplatform = LazyModule("google.cloud.aiplatform")
+storage = LazyModule("google.cloud.storage")
+
+def initialize_vertex_ai(project_id, location):
+    """Initialize Vertex AI once per process; later stages reuse it"""
+    global _initialized
+    if _initialized == (project_id, location):
+        return
+    
+    aiplatform.init(project=project_id, location=location)
+    _initialized = (project_id, location)
+    print(f"✓ Initialized Vertex AI")
+    print(f"  Project: {project_id}")
+    print(f"  Location: {location}")
+
+def get_storage_client():
+    """One Cloud Storage client (and connection pool) per process"""
+    global _storage_client
+    with _storage_lock:
+        if _storage_client is None:
+            _storage_client = storage.Client()
+    return _storage_client
\ No newline at end of file
@@ -7,9 +7,21 @@ Imports elephant dataset from Google Cloud Storage for training
 import os
 import json
 import argparse
-from google.cloud import aiplatform
-from google.cloud import storage
+import base64
+import collections
+import hashlib
+import io
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from cloud_context import aiplatform, get_storage_client, storage
+import cloud_context
 import time
+from PIL import Image, ImageOps
+import image_dedup
+import instrumentation
+from datetime import datetime
 
 # Configuration
 PROJECT_ID = "pelagic-magpie-469618-k8"  # Update with your project ID
@@ -17,82 +29,490 @@ LOCATION = "us-central1"  # Update with your preferred location
 BUCKET_NAME = "prasa_bucket"
 DATASET_PATH = "Elephant_Dataset_Finalized"
 DATASET_DISPLAY_NAME = "elephant-detection-dataset"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+# Streaming import settings
+LIST_WORKERS = 8  # Concurrent label prefix listings
+LIST_QUEUE_SIZE = 10000  # Max records buffered between listing and writing
+PROGRESS_INTERVAL_SECONDS = 5
+
+# Incremental import settings
+MANIFEST_INDEX_FILE = "import_manifest.db"
+
+# Near-duplicate filtering settings
+DEDUP_WORKERS = os.cpu_count() or 4
+DEDUP_REPORT_FILE = "dedup_report.jsonl"
+
+# Image normalization settings
+NORMALIZED_PREFIX = "Elephant_Dataset_Normalized"
+NORMALIZE_MAX_EDGE = 1024  # Longest edge of normalized images in pixels
+NORMALIZE_JPEG_QUALITY = 90
+NORMALIZE_WORKERS = os.cpu_count() or 4
+REJECTED_REPORT_FILE = "rejected_images.jsonl"
 
 def initialize_vertex_ai(project_id, location):
     """Initialize Vertex AI with project and location"""
-    aiplatform.init(project=project_id, location=location)
-    print(f"✓ Initialized Vertex AI")
-    print(f"  Project: {project_id}")
-    print(f"  Location: {location}")
+    cloud_context.initialize_vertex_ai(project_id, location)
+
+def get_label_for_blob(blob_name):
+    """Derive the classification label from the blob's folder structure"""
+    # Assuming structure: Elephant_Dataset_Finalized/label/image.jpg
+    path_parts = blob_name.split('/')
+    
+    if len(path_parts) > 2:
+        return path_parts[-2]  # Get parent folder as label
+    return "elephant"  # Default label
 
-def create_import_file(bucket_name, dataset_path, output_file="import_data.jsonl"):
+def build_image_record(bucket_name, blob):
+    """Turn a listed blob into a lightweight image record (None for non-images)"""
+    # Filter for image files only
+    if not blob.name.lower().endswith(IMAGE_EXTENSIONS):
+        return None
+    
+    instrumentation.count("images_listed")
+    return {
+        "name": blob.name,
+        "uri": f"gs://{bucket_name}/{blob.name}",
+        "label": get_label_for_blob(blob.name),
+        "generation": blob.generation,
+        "md5_hash": blob.md5_hash
+    }
+
+def build_import_entry(record):
+    """Create an import data entry for image classification"""
+    return {
+        "imageGcsUri": record["uri"],
+        "classificationAnnotation": {
+            "displayName": record["label"]
+        }
+    }
+
+def list_label_prefixes(bucket, dataset_path):
     """
-    Create import file for Vertex AI dataset
-    Lists all images in the bucket and creates JSONL format
+    List the label sub-prefixes directly under the dataset path
+    Returns (prefixes, records for images stored at the top level)
     """
-    print(f"\n📦 Creating import file from gs://{bucket_name}/{dataset_path}")
+    root_prefix = dataset_path.rstrip('/') + '/'
+    iterator = bucket.list_blobs(prefix=root_prefix, delimiter='/')
     
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
+    top_level_records = []
+    for blob in iterator:
+        record = build_image_record(bucket.name, blob)
+        if record:
+            top_level_records.append(record)
     
-    # List all image files in the dataset path
-    blobs = bucket.list_blobs(prefix=dataset_path)
+    # Prefixes are only populated once the iterator has been consumed
+    return sorted(iterator.prefixes), top_level_records
+
+def iter_image_records(bucket, dataset_path, workers=LIST_WORKERS):
+    """
+    Stream image records from the bucket
+    Label sub-prefixes are listed concurrently; records flow through a bounded
+    queue so memory stays flat regardless of how many blobs there are.
+    """
+    prefixes, top_level_records = list_label_prefixes(bucket, dataset_path)
+    yield from top_level_records
     
-    import_data = []
-    image_count = 0
+    if not prefixes:
+        return
     
-    for blob in blobs:
-        # Filter for image files only
-        if blob.name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.bmp')):
-            # Extract label from folder structure if available
-            # Assuming structure: Elephant_Dataset_Finalized/label/image.jpg
-            path_parts = blob.name.split('/')
-            
-            if len(path_parts) > 2:
-                label = path_parts[-2]  # Get parent folder as label
-            else:
-                label = "elephant"  # Default label
-            
-            # Create import data entry
-            gcs_uri = f"gs://{bucket_name}/{blob.name}"
-            
-            # For image classification
-            entry = {
-                "imageGcsUri": gcs_uri,
-                "classificationAnnotation": {
-                    "displayName": label
-                }
-            }
-            
-            import_data.append(entry)
-            image_count += 1
+    print(f"  Listing {len(prefixes)} label prefixes with {min(workers, len(prefixes))} workers")
+    
+    records = queue.Queue(maxsize=LIST_QUEUE_SIZE)
+    done = object()
+    stop = threading.Event()
+    
+    def list_prefix(prefix):
+        try:
+            for blob in bucket.list_blobs(prefix=prefix):
+                if stop.is_set():
+                    return
+                record = build_image_record(bucket.name, blob)
+                if record:
+                    records.put(record)
+        finally:
+            records.put(done)
+    
+    with ThreadPoolExecutor(max_workers=min(workers, len(prefixes))) as executor:
+        futures = [executor.submit(list_prefix, prefix) for prefix in prefixes]
+        
+        try:
+            remaining = len(prefixes)
+            while remaining:
+                record = records.get()
+                if record is done:
+                    remaining -= 1
+                else:
+                    yield record
+        finally:
+            # Unblock workers if the consumer stopped early
+            stop.set()
+            while any(not future.done() for future in futures):
+                try:
+                    records.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        
+        # Surface listing errors from the workers
+        for future in futures:
+            future.result()
+
+def write_entries(records, f):
+    """
+    Write import entries as JSONL, reporting entries per second as it goes
+    Returns (entries, bytes). Bytes are counted here because the GCS blob
+    writer is not seekable and cannot report its position.
+    """
+    count = 0
+    written_bytes = 0
+    start_time = time.time()
+    last_report = start_time
+    
+    for record in records:
+        line = json.dumps(build_import_entry(record)) + '\n'
+        f.write(line)
+        written_bytes += len(line.encode())
+        count += 1
+        instrumentation.count("images_written")
+        
+        now = time.time()
+        if now - last_report >= PROGRESS_INTERVAL_SECONDS:
+            print(f"  ... {count} entries written ({count / (now - start_time):.0f} entries/s)")
+            last_report = now
+    
+    elapsed = max(time.time() - start_time, 1e-9)
+    print(f"  {count} entries in {elapsed:.1f}s ({count / elapsed:.0f} entries/s)")
+    return count, written_bytes
+
+def write_import_file(bucket, records, output_file="import_data.jsonl", streaming=False):
+    """
+    Write import entries for the given records and return (gcs uri, count)
+    In streaming mode entries go straight to GCS without a local copy.
+    """
+    upload_blob = bucket.blob(f"import_files/{output_file}")
+    import_file_uri = f"gs://{bucket.name}/import_files/{output_file}"
+    
+    if streaming:
+        with instrumentation.span("list_and_stream_import_file") as attributes:
+            with upload_blob.open('w') as f:
+                image_count, attributes["bytes"] = write_entries(records, f)
+        instrumentation.count("bytes_uploaded", attributes["bytes"])
+        
+        print(f"✓ Streamed import file to: {import_file_uri}")
+        return import_file_uri, image_count
     
     # Write to JSONL file
-    with open(output_file, 'w') as f:
-        for entry in import_data:
-            f.write(json.dumps(entry) + '\n')
+    with instrumentation.span("list_and_write_import_file"):
+        with open(output_file, 'w') as f:
+            image_count, _ = write_entries(records, f)
     
     print(f"✓ Created import file: {output_file}")
-    print(f"  Total images found: {image_count}")
     
     # Upload import file to GCS
-    upload_blob = bucket.blob(f"import_files/{output_file}")
-    upload_blob.upload_from_filename(output_file)
-    import_file_uri = f"gs://{bucket_name}/import_files/{output_file}"
+    with instrumentation.span("upload_import_file", bytes=os.path.getsize(output_file)):
+        upload_blob.upload_from_filename(output_file)
+    instrumentation.count("bytes_uploaded", os.path.getsize(output_file))
     
     print(f"✓ Uploaded import file to: {import_file_uri}")
     
     return import_file_uri, image_count
 
+def create_import_file(bucket_name, dataset_path, output_file="import_data.jsonl",
+                       streaming=False, workers=LIST_WORKERS, stages=()):
+    """
+    Create import file for Vertex AI dataset
+    Lists all images in the bucket and creates JSONL format
+    Each stage is a callable taking and returning an iterable of records
+    """
+    print(f"\n📦 Creating import file from gs://{bucket_name}/{dataset_path}")
+    
+    bucket = get_storage_client().bucket(bucket_name)
+    
+    if streaming:
+        records = iter_image_records(bucket, dataset_path, workers=workers)
+    else:
+        # List all image files in the dataset path
+        records = (
+            record for record in (
+                build_image_record(bucket_name, blob)
+                for blob in bucket.list_blobs(prefix=dataset_path)
+            ) if record
+        )
+    
+    for stage in stages:
+        records = stage(records)
+    
+    import_file_uri, image_count = write_import_file(
+        bucket, records, output_file, streaming=streaming
+    )
+    
+    print(f"  Total images found: {image_count}")
+    
+    return import_file_uri, image_count
+
+def open_manifest_index(path=MANIFEST_INDEX_FILE, keep_pending=False):
+    """
+    Open (or create) the local index of blobs already imported
+    keep_pending keeps the blobs of an import submitted without waiting, so
+    they can be committed once it succeeds.
+    """
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS imported_blobs (
+            name TEXT PRIMARY KEY,
+            generation INTEGER,
+            md5_hash TEXT,
+            imported_time TEXT
+        );
+        CREATE TABLE IF NOT EXISTS pending_blobs (
+            name TEXT PRIMARY KEY,
+            generation INTEGER,
+            md5_hash TEXT
+        );
+        CREATE TABLE IF NOT EXISTS manifest_info (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """)
+    if not keep_pending:
+        # Pending rows from an interrupted run were never imported
+        conn.execute("DELETE FROM pending_blobs")
+        conn.commit()
+    return conn
+
+def bind_manifest_to_dataset(conn, dataset_resource_name):
+    """
+    Tie the manifest index to a dataset
+    The index is cleared when it belongs to a different (or no) dataset,
+    so everything is imported again.
+    """
+    row = conn.execute(
+        "SELECT value FROM manifest_info WHERE key = 'dataset_resource_name'"
+    ).fetchone()
+    
+    if row is None or row[0] != dataset_resource_name:
+        if row is not None and row[0] is not None:
+            print(f"  Manifest index belongs to another dataset, starting fresh")
+        conn.execute("DELETE FROM imported_blobs")
+        conn.execute(
+            "INSERT OR REPLACE INTO manifest_info (key, value) VALUES ('dataset_resource_name', ?)",
+            (dataset_resource_name,)
+        )
+        conn.commit()
+    
+    count = conn.execute("SELECT COUNT(*) FROM imported_blobs").fetchone()[0]
+    print(f"✓ Manifest index: {count} blobs previously imported")
+
+def select_changed_records(conn, records):
+    """
+    Yield only records that are new or whose generation/md5 changed
+    Selected records are staged as pending until the import succeeds.
+    """
+    seen = 0
+    selected = 0
+    
+    for record in records:
+        seen += 1
+        row = conn.execute(
+            "SELECT generation, md5_hash FROM imported_blobs WHERE name = ?",
+            (record["name"],)
+        ).fetchone()
+        
+        if row is not None and row[0] == record["generation"] and row[1] == record["md5_hash"]:
+            continue
+        
+        conn.execute(
+            "INSERT OR REPLACE INTO pending_blobs (name, generation, md5_hash) VALUES (?, ?, ?)",
+            (record["name"], record["generation"], record["md5_hash"])
+        )
+        selected += 1
+        yield record
+    
+    print(f"  Incremental: {selected} new or changed of {seen} images listed")
+
+def commit_manifest_index(conn):
+    """Record pending blobs as imported once the import has succeeded"""
+    conn.execute("""
+        INSERT OR REPLACE INTO imported_blobs (name, generation, md5_hash, imported_time)
+        SELECT name, generation, md5_hash, ? FROM pending_blobs
+    """, (datetime.now().isoformat(),))
+    conn.execute("DELETE FROM pending_blobs")
+    conn.commit()
+    print(f"✓ Manifest index updated")
+
+def bounded_map(executor, fn, records, key, window):
+    """
+    Like executor.map over key(record), but with at most `window` tasks in flight
+    Yields (record, result) in input order without materializing the input.
+    """
+    in_flight = collections.deque()
+    
+    for record in records:
+        in_flight.append((record, executor.submit(fn, key(record))))
+        if len(in_flight) >= window:
+            record, future = in_flight.popleft()
+            yield record, future.result()
+    
+    while in_flight:
+        record, future = in_flight.popleft()
+        yield record, future.result()
+
+_worker_storage_client = None
+
+def get_worker_blob(gcs_uri):
+    """Get a blob handle in a worker process, reusing one client per process"""
+    global _worker_storage_client
+    if _worker_storage_client is None:
+        _worker_storage_client = storage.Client()
+    
+    bucket_name, blob_name = gcs_uri[len("gs://"):].split('/', 1)
+    return _worker_storage_client.bucket(bucket_name).blob(blob_name)
+
+def download_gcs_bytes(gcs_uri):
+    """Download an object in a worker process"""
+    return get_worker_blob(gcs_uri).download_as_bytes()
+
+def hash_image_worker(gcs_uri):
+    """Compute the perceptual hash of a GCS image (None if it cannot be read)"""
+    try:
+        return image_dedup.dhash(download_gcs_bytes(gcs_uri))
+    except Exception as e:
+        print(f"⚠️ Could not hash {gcs_uri}: {e}")
+        return None
+
+def dedup_records(records, max_distance=image_dedup.DEFAULT_MAX_DISTANCE,
+                  workers=DEDUP_WORKERS, report_file=DEDUP_REPORT_FILE):
+    """
+    Drop near-duplicate frames, keeping one representative per cluster
+    Hashes are computed on a process pool; dropped images are written to a report.
+    """
+    print(f"  Near-duplicate filter: Hamming distance <= {max_distance}, {workers} workers")
+    
+    kept = 0
+    dropped = 0
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor, open(report_file, 'w') as report:
+        hashed_records = bounded_map(
+            executor, hash_image_worker, records,
+            key=lambda record: record["uri"],
+            window=workers * 16
+        )
+        
+        for record, representative, distance in image_dedup.cluster_near_duplicates(
+            hashed_records, max_distance
+        ):
+            if representative is None:
+                kept += 1
+                yield record
+            else:
+                dropped += 1
+                instrumentation.count("images_deduplicated")
+                report.write(json.dumps({
+                    "dropped": record["uri"],
+                    "kept": representative,
+                    "label": record["label"],
+                    "distance": distance
+                }) + '\n')
+    
+    print(f"  Near-duplicate filter kept {kept} images, dropped {dropped}")
+    print(f"✓ Dedup report saved to: {report_file}")
+
+def normalize_image_bytes(image_bytes, max_edge=NORMALIZE_MAX_EDGE, quality=NORMALIZE_JPEG_QUALITY):
+    """
+    Validate, decode, downscale and re-encode an image as JPEG
+    Raises on corrupt or truncated files.
+    """
+    # Check the header and file structure without decoding pixels
+    Image.open(io.BytesIO(image_bytes)).verify()
+    
+    image = Image.open(io.BytesIO(image_bytes))
+    # Let the JPEG decoder downscale via DCT instead of decoding full resolution
+    image.draft('RGB', (max_edge, max_edge))
+    # Full decode, fails on truncated data
+    image.load()
+    
+    # Re-encoding drops EXIF, so apply the orientation to the pixels
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=quality, optimize=True)
+    return output.getvalue()
+
+def get_normalized_blob_name(record, prefix, max_edge, quality):
+    """Name normalized copies by source content hash and settings"""
+    if record.get("md5_hash"):
+        content_hash = base64.b64decode(record["md5_hash"]).hex()
+    else:
+        # Composite objects have no MD5, fall back to name and generation
+        content_hash = hashlib.sha256(
+            f"{record['name']}:{record.get('generation')}".encode()
+        ).hexdigest()[:32]
+    
+    return f"{prefix.rstrip('/')}/{record['label']}/{content_hash}_{max_edge}q{quality}.jpg"
+
+def normalize_image_worker(task):
+    """Normalize one GCS image in a worker process, skipping cached results"""
+    source_uri, target_uri, max_edge, quality = task
+    
+    try:
+        target_blob = get_worker_blob(target_uri)
+        
+        if target_blob.exists():
+            return "cached", None
+        
+        normalized = normalize_image_bytes(download_gcs_bytes(source_uri), max_edge, quality)
+        target_blob.upload_from_string(normalized, content_type="image/jpeg")
+        return "normalized", None
+    except Exception as e:
+        return "rejected", f"{type(e).__name__}: {e}"
+
+def normalize_records(records, bucket_name, prefix=NORMALIZED_PREFIX,
+                      max_edge=NORMALIZE_MAX_EDGE, quality=NORMALIZE_JPEG_QUALITY,
+                      workers=NORMALIZE_WORKERS, report_file=REJECTED_REPORT_FILE):
+    """
+    Normalize images on a process pool and point records at the normalized copies
+    Corrupt or truncated images are reported as soon as they are found and dropped.
+    """
+    print(f"  Normalizing to gs://{bucket_name}/{prefix}/ (max edge {max_edge}px, quality {quality}, {workers} workers)")
+    
+    counts = {"normalized": 0, "cached": 0, "rejected": 0}
+    
+    def to_task(record):
+        target_uri = f"gs://{bucket_name}/{get_normalized_blob_name(record, prefix, max_edge, quality)}"
+        return record["uri"], target_uri, max_edge, quality
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor, open(report_file, 'w') as report:
+        results = bounded_map(
+            executor, normalize_image_worker, records,
+            key=to_task,
+            window=workers * 16
+        )
+        
+        for record, (status, error) in results:
+            counts[status] += 1
+            instrumentation.count(f"images_{status}")
+            
+            if status == "rejected":
+                print(f"❌ Rejected {record['uri']}: {error}")
+                report.write(json.dumps({"uri": record["uri"], "error": error}) + '\n')
+                continue
+            
+            yield dict(record, source_uri=record["uri"], uri=to_task(record)[1])
+    
+    print(f"  Normalized {counts['normalized']}, cached {counts['cached']}, rejected {counts['rejected']}")
+    print(f"✓ Rejected images report saved to: {report_file}")
+
 def create_dataset(display_name, metadata_schema_uri):
     """Create a Vertex AI dataset"""
     print(f"\n🗂️ Creating Vertex AI dataset: {display_name}")
     
-    dataset = aiplatform.ImageDataset.create(
-        display_name=display_name,
-        metadata_schema_uri=metadata_schema_uri,
-        sync=True
-    )
+    with instrumentation.span("create_dataset"):
+        dataset = aiplatform.ImageDataset.create(
+            display_name=display_name,
+            metadata_schema_uri=metadata_schema_uri,
+            sync=True
+        )
     
     print(f"✓ Dataset created successfully")
     print(f"  Resource name: {dataset.resource_name}")
@@ -100,27 +520,45 @@ def create_dataset(display_name, metadata_schema_uri):
     
     return dataset
 
-def import_data_to_dataset(dataset, import_file_uri):
-    """Import data into the dataset"""
+def import_data_to_dataset(dataset, import_file_uri, sync=True):
+    """
+    Import data into the dataset
+    With sync=False the import is only submitted and the name of its
+    long-running operation is returned for the caller to poll.
+    """
     print(f"\n📥 Importing data into dataset...")
     print(f"  Import file: {import_file_uri}")
+    import_schema_uri = aiplatform.schema.dataset.ioformat.image.single_label_classification
     
-    dataset.import_data(
-        gcs_source=[import_file_uri],
-        import_schema_uri=aiplatform.schema.dataset.ioformat.image.single_label_classification,
-        sync=True
-    )
+    if not sync:
+        import_config = aiplatform.gapic.ImportDataConfig(
+            gcs_source=aiplatform.gapic.GcsSource(uris=[import_file_uri]),
+            import_schema_uri=import_schema_uri
+        )
+        with instrumentation.span("submit_import"):
+            operation = dataset.api_client.import_data(name=dataset.resource_name, import_configs=[import_config])
+        print(f"✓ Data import submitted: {operation.operation.name}")
+        return operation.operation.name
+    
+    with instrumentation.span("import_data"):
+        dataset.import_data(
+            gcs_source=[import_file_uri],
+            import_schema_uri=import_schema_uri,
+            sync=True
+        )
     
     print(f"✓ Data import completed successfully")
+    return None
 
 def check_existing_dataset(display_name):
     """Check if dataset already exists"""
     print(f"\n🔍 Checking for existing dataset: {display_name}")
     
-    datasets = aiplatform.ImageDataset.list(
-        filter=f'display_name="{display_name}"',
-        order_by="create_time desc"
-    )
+    with instrumentation.span("list_datasets"):
+        datasets = aiplatform.ImageDataset.list(
+            filter=f'display_name="{display_name}"',
+            order_by="create_time desc"
+        )
     
     if datasets:
         print(f"✓ Found existing dataset")
@@ -129,7 +567,8 @@ def check_existing_dataset(display_name):
     print(f"  No existing dataset found")
     return None
 
-def main():
+def build_arg_parser():
+    """Command line options, shared with pipeline_runner.py"""
     parser = argparse.ArgumentParser(description='Import elephant dataset to Vertex AI')
     parser.add_argument('--project-id', default=PROJECT_ID, help='GCP Project ID')
     parser.add_argument('--location', default=LOCATION, help='Vertex AI location')
@@ -137,63 +576,162 @@ def main():
     parser.add_argument('--dataset-path', default=DATASET_PATH, help='Dataset path in bucket')
     parser.add_argument('--dataset-name', default=DATASET_DISPLAY_NAME, help='Dataset display name')
     parser.add_argument('--force-create', action='store_true', help='Force create new dataset')
-    
-    args = parser.parse_args()
-    
-    print("=" * 60)
-    print("🐘 ELEPHANT DETECTION - VERTEX AI DATASET IMPORT")
-    print("=" * 60)
-    
-    # Initialize Vertex AI
-    initialize_vertex_ai(args.project_id, args.location)
+    parser.add_argument('--streaming', action='store_true',
+                       help='List label prefixes concurrently and stream the import file to GCS')
+    parser.add_argument('--list-workers', type=int, default=LIST_WORKERS,
+                       help='Concurrent prefix listings in streaming mode')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Import only new or changed images into the existing dataset')
+    parser.add_argument('--manifest-index', default=MANIFEST_INDEX_FILE,
+                       help='Local index of imported blobs used by --incremental')
+    parser.add_argument('--normalize', action='store_true',
+                       help='Validate, downscale and re-encode images before import')
+    parser.add_argument('--normalized-prefix', default=NORMALIZED_PREFIX,
+                       help='Bucket prefix for normalized images')
+    parser.add_argument('--max-edge', type=int, default=NORMALIZE_MAX_EDGE,
+                       help='Longest edge of normalized images in pixels')
+    parser.add_argument('--normalize-workers', type=int, default=NORMALIZE_WORKERS,
+                       help='Worker processes for image normalization')
+    parser.add_argument('--dedup', action='store_true',
+                       help='Drop near-duplicate frames before import')
+    parser.add_argument('--dedup-distance', type=int, default=image_dedup.DEFAULT_MAX_DISTANCE,
+                       help='Max perceptual hash Hamming distance treated as duplicate')
+    parser.add_argument('--dedup-workers', type=int, default=DEDUP_WORKERS,
+                       help='Worker processes for perceptual hashing')
+    return parser
+
+def prepare_dataset(args, sync=True):
+    """
+    Find or create the dataset and import new images
+    Returns (dataset, import operation name); the dataset is None if there are
+    no images. With sync=False the import is only submitted, and finish_import()
+    records it in the manifest index once the operation has succeeded.
+    """
     
     # Check for existing dataset
     dataset = None
+    operation_name = None
     if not args.force_create:
         dataset = check_existing_dataset(args.dataset_name)
     
-    if dataset is None:
+    if dataset is None or args.incremental:
+        # Record filters applied between listing and writing the import file
+        stages = []
+        manifest = None
+        output_file = "import_data.jsonl"
+        
+        if args.incremental:
+            manifest = open_manifest_index(args.manifest_index)
+            bind_manifest_to_dataset(manifest, dataset.resource_name if dataset else None)
+            stages.append(lambda records: select_changed_records(manifest, records))
+            output_file = f"import_delta_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        
+        if args.normalize:
+            stages.append(lambda records: normalize_records(
+                records,
+                args.bucket,
+                prefix=args.normalized_prefix,
+                max_edge=args.max_edge,
+                workers=args.normalize_workers
+            ))
+        
+        if args.dedup:
+            stages.append(lambda records: dedup_records(
+                records,
+                max_distance=args.dedup_distance,
+                workers=args.dedup_workers
+            ))
+        
         # Create import file
         import_file_uri, image_count = create_import_file(
             args.bucket, 
-            args.dataset_path
+            args.dataset_path,
+            output_file=output_file,
+            streaming=args.streaming,
+            workers=args.list_workers,
+            stages=stages
         )
         
         if image_count == 0:
-            print("❌ No images found in the specified path")
-            return
-        
-        # Create new dataset
-        dataset = create_dataset(
-            display_name=args.dataset_name,
-            metadata_schema_uri=aiplatform.schema.dataset.metadata.image
-        )
+            if dataset is None:
+                print("❌ No images found in the specified path")
+                return None
+            print("✓ No new or changed images to import")
+        else:
+            if dataset is None:
+                # Create new dataset
+                dataset = create_dataset(
+                    display_name=args.dataset_name,
+                    metadata_schema_uri=aiplatform.schema.dataset.metadata.image
+                )
+                
+                if manifest is not None:
+                    bind_manifest_to_dataset(manifest, dataset.resource_name)
+            
+            # Import data
+            operation_name = import_data_to_dataset(dataset, import_file_uri, sync=sync)
         
-        # Import data
-        import_data_to_dataset(dataset, import_file_uri)
-    
-    # Display dataset information
-    print("\n" + "=" * 60)
-    print("✅ DATASET READY FOR TRAINING")
-    print("=" * 60)
-    print(f"Dataset ID: {dataset.name}")
-    print(f"Display Name: {dataset.display_name}")
-    print(f"Resource Name: {dataset.resource_name}")
-    print(f"\nUse this dataset ID for training: {dataset.name}")
+        if manifest is not None:
+            if operation_name is None:
+                commit_manifest_index(manifest)
+            else:
+                # Kept as pending until the submitted import succeeds
+                manifest.commit()
+            manifest.close()
     
-    # Save dataset info for later use
+    return dataset, operation_name
+
+def finish_import(args):
+    """Record the blobs of a succeeded import submitted with sync=False in the manifest index"""
+    if args.incremental:
+        manifest = open_manifest_index(args.manifest_index, keep_pending=True)
+        commit_manifest_index(manifest)
+        manifest.close()
+
+def save_dataset_info(dataset, project_id, location):
+    """Save dataset info for the training step"""
     dataset_info = {
         "dataset_id": dataset.name,
         "display_name": dataset.display_name,
         "resource_name": dataset.resource_name,
-        "project_id": args.project_id,
-        "location": args.location
+        "project_id": project_id,
+        "location": location
     }
     
     with open("dataset_info.json", "w") as f:
         json.dump(dataset_info, f, indent=2)
     
     print(f"\n✓ Dataset info saved to: dataset_info.json")
+    return dataset_info
+
+def main():
+    parser = build_arg_parser()
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure(args, "dataset_import")
+    
+    print("=" * 60)
+    print("🐘 ELEPHANT DETECTION - VERTEX AI DATASET IMPORT")
+    print("=" * 60)
+    
+    # Initialize Vertex AI
+    initialize_vertex_ai(args.project_id, args.location)
+    
+    dataset, _ = prepare_dataset(args)
+    if dataset is None:
+        return
+    
+    # Display dataset information
+    print("\n" + "=" * 60)
+    print("✅ DATASET READY FOR TRAINING")
+    print("=" * 60)
+    print(f"Dataset ID: {dataset.name}")
+    print(f"Display Name: {dataset.display_name}")
+    print(f"Resource Name: {dataset.resource_name}")
+    print(f"\nUse this dataset ID for training: {dataset.name}")
+    
+    # Save dataset info for later use
+    save_dataset_info(dataset, args.project_id, args.location)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -7,9 +7,12 @@ Deploys trained model to an endpoint for serving predictions
 import os
 import json
 import argparse
+import asyncio
 from datetime import datetime
-from google.cloud import aiplatform
+from cloud_context import aiplatform, get_storage_client
+import cloud_context
 import time
+import instrumentation
 
 # Configuration
 PROJECT_ID = "pelagic-magpie-469618-k8"
@@ -44,12 +47,13 @@ MACHINE_TYPES = {
     }
 }
 
+# Edge export settings
+EDGE_EXPORT_FORMATS = ["tflite"]  # Formats edge_inference.py can run (edgetpu-tflite needs a Coral delegate)
+EDGE_MODEL_DIR = "edge_model"
+
 def initialize_vertex_ai(project_id, location):
     """Initialize Vertex AI"""
-    aiplatform.init(project=project_id, location=location)
-    print(f"✓ Initialized Vertex AI")
-    print(f"  Project: {project_id}")
-    print(f"  Location: {location}")
+    cloud_context.initialize_vertex_ai(project_id, location)
 
 def load_model_info(model_type="efficientnet"):
     """Load model information from training step"""
@@ -73,10 +77,11 @@ def create_or_get_endpoint(display_name):
     print(f"\n🎯 Setting up endpoint: {display_name}")
     
     # Check for existing endpoints
-    endpoints = aiplatform.Endpoint.list(
-        filter=f'display_name="{display_name}"',
-        order_by="create_time desc"
-    )
+    with instrumentation.span("list_endpoints"):
+        endpoints = aiplatform.Endpoint.list(
+            filter=f'display_name="{display_name}"',
+            order_by="create_time desc"
+        )
     
     if endpoints:
         endpoint = endpoints[0]
@@ -86,20 +91,35 @@ def create_or_get_endpoint(display_name):
     
     # Create new endpoint
     print(f"  Creating new endpoint...")
-    endpoint = aiplatform.Endpoint.create(
-        display_name=display_name,
-        description="Endpoint for elephant detection model",
-        sync=True
-    )
+    with instrumentation.span("create_endpoint"):
+        endpoint = aiplatform.Endpoint.create(
+            display_name=display_name,
+            description="Endpoint for elephant detection model",
+            sync=True
+        )
     
     print(f"✓ Endpoint created successfully")
     print(f"  Resource name: {endpoint.resource_name}")
     return endpoint
 
-def deploy_model_to_endpoint(model, endpoint, deployment_size="small"):
-    """Deploy model to endpoint"""
-    
-    config = MACHINE_TYPES[deployment_size]
+def load_capacity_plan(plan_file):
+    """Load the deployment config recommended by capacity_planner.py"""
+    with open(plan_file, "r") as f:
+        plan = json.load(f)
+    
+    print(f"✓ Loaded capacity plan: {plan_file}")
+    print(f"  Planned for: {plan['target']['peak_rate']} req/s peak, "
+          f"{plan['target']['slo_percentile']} <= {plan['target']['slo_ms']}ms")
+    return plan["deployment"]
+
+def deploy_model_to_endpoint(model, endpoint, deployment_size="small", config=None, traffic_percentage=100):
+    """
+    Deploy model to endpoint (with an explicit config, e.g. from a capacity plan)
+    Below 100% traffic the model serves next to the models already deployed.
+    """
+    
+    if config is None:
+        config = MACHINE_TYPES[deployment_size]
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     deployed_model_display_name = f"elephant-detector-{deployment_size}-{timestamp}"
     
@@ -112,26 +132,98 @@ def deploy_model_to_endpoint(model, endpoint, deployment_size="small"):
     
     if config['accelerator_type']:
         print(f"  Accelerator: {config['accelerator_type']} x{config['accelerator_count']}")
+    if traffic_percentage < 100:
+        print(f"  Traffic share: {traffic_percentage}%")
     
     print(f"\n⏳ Deployment in progress...")
     print(f"  This may take 10-15 minutes...")
     
     # Deploy the model
-    model.deploy(
-        endpoint=endpoint,
-        deployed_model_display_name=deployed_model_display_name,
-        machine_type=config['machine_type'],
-        accelerator_type=config['accelerator_type'],
-        accelerator_count=config['accelerator_count'],
-        min_replica_count=config['min_replica_count'],
-        max_replica_count=config['max_replica_count'],
-        traffic_percentage=100,  # Send all traffic to this model
-        sync=True
-    )
+    with instrumentation.span("deploy_model", deployment_size=deployment_size, machine_type=config['machine_type']):
+        model.deploy(
+            endpoint=endpoint,
+            deployed_model_display_name=deployed_model_display_name,
+            machine_type=config['machine_type'],
+            accelerator_type=config['accelerator_type'],
+            accelerator_count=config['accelerator_count'],
+            min_replica_count=config['min_replica_count'],
+            max_replica_count=config['max_replica_count'],
+            traffic_percentage=traffic_percentage,
+            sync=True
+        )
     
     print(f"\n✅ Model deployed successfully!")
     return endpoint
 
+def export_edge_model(model, export_format, destination_uri):
+    """Export an edge-trained model to GCS"""
+    print(f"\n📤 Exporting model as {export_format}")
+    print(f"  Destination: {destination_uri}")
+    
+    supported = model.supported_export_formats
+    if export_format not in supported:
+        raise ValueError(
+            f"Model cannot be exported as {export_format} (supported: {', '.join(supported) or 'none'}). "
+            f"Train with train_model.py --model-type mobilenet_edge."
+        )
+    
+    with instrumentation.span("export_model", export_format=export_format):
+        output = model.export_model(
+            export_format_id=export_format,
+            artifact_destination=destination_uri,
+            sync=True
+        )
+    
+    artifact_uri = output["artifactOutputUri"]
+    print(f"✓ Model exported to: {artifact_uri}")
+    return artifact_uri
+
+def download_edge_model(artifact_uri, local_dir=EDGE_MODEL_DIR):
+    """Download the exported artifact files (model and dict.txt labels)"""
+    print(f"\n📥 Downloading exported model to {local_dir}/")
+    bucket_name, prefix = artifact_uri[len("gs://"):].split('/', 1)
+    bucket = get_storage_client().bucket(bucket_name)
+    
+    os.makedirs(local_dir, exist_ok=True)
+    model_path = None
+    
+    for blob in bucket.list_blobs(prefix=prefix.rstrip('/') + '/'):
+        relative_name = blob.name[len(prefix):].lstrip('/')
+        if not relative_name or relative_name.endswith('/'):
+            continue
+        
+        local_path = os.path.join(local_dir, relative_name)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with instrumentation.span("download_artifact", name=relative_name):
+            blob.download_to_filename(local_path)
+        instrumentation.count("bytes_downloaded", blob.size or 0)
+        print(f"  {relative_name} ({blob.size} bytes)")
+        
+        if local_path.endswith(('.tflite', '.onnx')):
+            model_path = local_path
+    
+    if model_path is None:
+        raise ValueError(f"No .tflite or .onnx model file in {artifact_uri}, edge_inference.py cannot run it")
+    print(f"✓ Edge model downloaded")
+    return model_path
+
+def save_edge_model_info(model_info, artifact_uri, model_path, export_format):
+    """Save edge model information for local inference"""
+    edge_info = {
+        "model_id": model_info["model_id"],
+        "model_display_name": model_info["display_name"],
+        "export_format": export_format,
+        "artifact_uri": artifact_uri,
+        "model_path": model_path,
+        "exported_time": datetime.now().isoformat()
+    }
+    
+    with open("edge_model_info.json", "w") as f:
+        json.dump(edge_info, f, indent=2)
+    
+    print(f"\n✓ Edge model info saved to: edge_model_info.json")
+    return edge_info
+
 def test_endpoint(endpoint):
     """Test the deployed endpoint with a sample prediction"""
     print(f"\n🧪 Testing endpoint...")
@@ -149,11 +241,19 @@ def test_endpoint(endpoint):
     except Exception as e:
         print(f"  Test skipped (requires real image data)")
 
-def save_endpoint_info(endpoint, model_info, deployment_size):
-    """Save endpoint information for the PHP backend"""
+def save_endpoint_info(endpoint, model_info, deployment_size, location=LOCATION, add_route=False,
+                       config=None, ready=True, cascade_role=None):
+    """
+    Save endpoint information for the PHP backend
+    With add_route, the endpoint joins the "endpoints" that Python clients
+    route between instead of replacing them. A fresh deployment is saved with
+    ready = false until endpoint_warmup.py has warmed it up. With cascade_role,
+    the endpoint becomes the "fast" or "accurate" stage of model_cascade.py.
+    """
+    config = config or MACHINE_TYPES.get(deployment_size, {})
     
     # Get the endpoint URI
-    endpoint_uri = f"https://{LOCATION}-aiplatform.googleapis.com/v1/{endpoint.resource_name}:predict"
+    endpoint_uri = f"https://{location}-aiplatform.googleapis.com/v1/{endpoint.resource_name}:predict"
     
     endpoint_info = {
         "endpoint_id": endpoint.name,
@@ -163,11 +263,42 @@ def save_endpoint_info(endpoint, model_info, deployment_size):
         "model_id": model_info["model_id"],
         "model_display_name": model_info["display_name"],
         "deployment_size": deployment_size,
+        "min_replica_count": config.get("min_replica_count"),
+        "max_replica_count": config.get("max_replica_count"),
+        "ready": ready,
         "project_id": PROJECT_ID,
-        "location": LOCATION,
+        "location": location,
         "deployed_time": datetime.now().isoformat()
     }
     
+    previous = {}
+    if os.path.exists("endpoint_config.json"):
+        with open("endpoint_config.json", "r") as f:
+            previous = json.load(f)
+    
+    if add_route and previous:
+        routes = previous.get("endpoints") or [
+            {key: previous[key] for key in ("endpoint_id", "endpoint_uri", "location") if key in previous}
+        ]
+        routes = [route for route in routes if route["endpoint_uri"] != endpoint_uri]
+        endpoint_info["endpoints"] = routes + [
+            {"endpoint_id": endpoint.name, "endpoint_uri": endpoint_uri, "location": location}
+        ]
+        print(f"\n✓ Routing between {len(endpoint_info['endpoints'])} endpoints")
+    
+    # Cascade stages survive redeployments of either model
+    cascade = dict(previous.get("cascade", {}))
+    if cascade_role:
+        cascade[cascade_role] = {
+            "endpoint_id": endpoint.name,
+            "endpoint_uri": endpoint_uri,
+            "model_display_name": model_info["display_name"],
+            "location": location
+        }
+        print(f"\n✓ Cascade {cascade_role} model: {model_info['display_name']}")
+    if cascade:
+        endpoint_info["cascade"] = cascade
+    
     # Save endpoint configuration
     with open("endpoint_config.json", "w") as f:
         json.dump(endpoint_info, f, indent=2)
@@ -183,7 +314,7 @@ def save_endpoint_info(endpoint, model_info, deployment_size):
 
 define('VERTEX_AI_ENDPOINT', '{endpoint_uri}');
 define('VERTEX_AI_PROJECT_ID', '{PROJECT_ID}');
-define('VERTEX_AI_LOCATION', '{LOCATION}');
+define('VERTEX_AI_LOCATION', '{location}');
 define('VERTEX_AI_MODEL_NAME', '{model_info["display_name"]}');
 
 // Endpoint details
@@ -193,7 +324,7 @@ define('VERTEX_AI_MODEL_NAME', '{model_info["display_name"]}');
     'endpoint_uri' => '{endpoint_uri}',
     'model_id' => '{model_info["model_id"]}',
     'project_id' => '{PROJECT_ID}',
-    'location' => '{LOCATION}'
+    'location' => '{location}'
 ];
 """
     
@@ -210,39 +341,22 @@ def create_prediction_example():
     example_code = """
 # Python Example for Making Predictions
 # =====================================
+# Uses the batch prediction client (batch_predict.py), which packs several
+# images into each predict call over a pooled, retrying HTTP session.
+#
+# For bulk scoring of a directory or JSONL file of images:
+#   python batch_predict.py --input /path/to/images --output predictions.jsonl
 
-import base64
-import json
-from google.cloud import aiplatform
+from batch_predict import predict_files
 
-def predict_elephant(image_path, endpoint_id, project_id, location):
+def predict_elephant(image_path):
     \"\"\"Make a prediction using the deployed model\"\"\"
     
-    # Initialize client
-    aiplatform.init(project=project_id, location=location)
-    
-    # Get endpoint
-    endpoint = aiplatform.Endpoint(endpoint_id)
-    
-    # Read and encode image
-    with open(image_path, "rb") as f:
-        image_bytes = f.read()
-    encoded_image = base64.b64encode(image_bytes).decode('utf-8')
-    
-    # Prepare instance
-    instance = {
-        "content": encoded_image
-    }
-    
-    # Make prediction
-    prediction = endpoint.predict(instances=[instance])
-    
-    # Parse results
-    predictions = prediction.predictions[0]
+    prediction = predict_files([image_path])[0]
     
     # Get confidence scores and labels
-    confidences = predictions.get('confidences', [])
-    display_names = predictions.get('displayNames', [])
+    confidences = prediction.get('confidences', [])
+    display_names = prediction.get('displayNames', [])
     
     # Combine and sort results
     results = list(zip(display_names, confidences))
@@ -252,15 +366,7 @@ def predict_elephant(image_path, endpoint_id, project_id, location):
 
 # Usage
 if __name__ == "__main__":
-    with open("endpoint_config.json", "r") as f:
-        config = json.load(f)
-    
-    results = predict_elephant(
-        image_path="test_elephant.jpg",
-        endpoint_id=config["endpoint_id"],
-        project_id=config["project_id"],
-        location=config["location"]
-    )
+    results = predict_elephant("test_elephant.jpg")
     
     print("Predictions:")
     for label, confidence in results[:5]:
@@ -287,11 +393,50 @@ def main():
                        choices=['small', 'medium', 'large'],
                        default='small',
                        help='Deployment configuration size')
+    parser.add_argument('--capacity-plan',
+                       help='Deploy with the machine type and replicas from capacity_planner.py')
+    parser.add_argument('--add-route',
+                       action='store_true',
+                       help='Add this endpoint (e.g. in a second --location) to the endpoints clients route between')
+    parser.add_argument('--cascade-role',
+                       choices=['fast', 'accurate'],
+                       help='Serve this model as a stage of the confidence-gated cascade (model_cascade.py)')
+    parser.add_argument('--canary',
+                       action='store_true',
+                       help='Roll out next to the deployed model at a small traffic share, gated on latency')
+    parser.add_argument('--canary-input',
+                       help='Image directory or JSONL file used to probe the canary')
+    parser.add_argument('--canary-steps',
+                       type=int,
+                       nargs='+',
+                       help='Canary traffic shares (%%) to probe before promoting (default: 10 25 50)')
+    parser.add_argument('--warmup-input',
+                       help='Image directory or JSONL file replayed to warm up the new deployment')
+    parser.add_argument('--seed',
+                       type=int,
+                       help='Random seed for the canary probe load')
     parser.add_argument('--test', 
                        action='store_true',
                        help='Test the endpoint after deployment')
+    parser.add_argument('--export-edge',
+                       action='store_true',
+                       help='Export the model for local inference instead of deploying it')
+    parser.add_argument('--export-format',
+                       choices=EDGE_EXPORT_FORMATS,
+                       default='tflite',
+                       help='Edge export format')
+    parser.add_argument('--export-destination',
+                       help='GCS URI for exported artifacts (e.g. gs://bucket/edge_exports)')
+    parser.add_argument('--edge-dir',
+                       default=EDGE_MODEL_DIR,
+                       help='Local directory for the downloaded edge model')
+    instrumentation.add_arguments(parser)
     
     args = parser.parse_args()
+    instrumentation.configure(args, "deploy_model")
+    
+    if args.canary and not args.canary_input:
+        parser.error("--canary-input is required with --canary")
     
     print("=" * 60)
     print("🐘 ELEPHANT DETECTION - MODEL DEPLOYMENT")
@@ -313,26 +458,75 @@ def main():
     # Get model
     model = get_model(model_id)
     
+    if args.export_edge:
+        if not args.export_destination:
+            print("❌ --export-destination is required with --export-edge")
+            return
+        
+        artifact_uri = export_edge_model(model, args.export_format, args.export_destination)
+        model_path = download_edge_model(artifact_uri, args.edge_dir)
+        save_edge_model_info(model_info, artifact_uri, model_path, args.export_format)
+        
+        print("\n" + "=" * 60)
+        print("✅ EDGE EXPORT COMPLETE")
+        print("=" * 60)
+        print(f"Model file: {model_path}")
+        print(f"\nRun it locally with:")
+        print(f"  python edge_inference.py --model {model_path} --images image.jpg")
+        print(f"  python prediction_gateway.py --edge-model {model_path}")
+        return
+    
     # Create or get endpoint
     endpoint = create_or_get_endpoint(args.endpoint_name)
+    deployment_size = "planned" if args.capacity_plan else args.deployment_size
     
     # Check if model is already deployed
     deployed_models = endpoint.list_models()
-    if deployed_models:
+    config = load_capacity_plan(args.capacity_plan) if args.capacity_plan else None
+    if deployed_models and args.canary:
+        from benchmark import load_samples
+        import canary_rollout
+        
+        target = canary_rollout.VertexCanaryTarget(endpoint, model, deployment_size, config, args.location)
+        report = asyncio.run(canary_rollout.run_canary(
+            target, load_samples(args.canary_input),
+            steps=args.canary_steps or canary_rollout.TRAFFIC_STEPS, seed=args.seed
+        ))
+        canary_rollout.save_report(report)
+        if report["result"] != "promoted":
+            print(f"\n↩️ Canary rolled back, {target.current_id} keeps serving all traffic")
+            return
+    elif deployed_models:
         print(f"\n⚠️ Model already deployed to this endpoint")
         print(f"  Deployed models: {len(deployed_models)}")
         for dm in deployed_models:
             print(f"    - {dm.display_name}")
+        print(f"  Roll out a new model with --canary --canary-input /path/to/images")
     else:
         # Deploy model
-        endpoint = deploy_model_to_endpoint(model, endpoint, args.deployment_size)
+        endpoint = deploy_model_to_endpoint(model, endpoint, deployment_size, config)
+    freshly_deployed = args.canary or not deployed_models
     
     # Test endpoint if requested
     if args.test:
         test_endpoint(endpoint)
     
     # Save endpoint information
-    endpoint_info = save_endpoint_info(endpoint, model_info, args.deployment_size)
+    endpoint_info = save_endpoint_info(
+        endpoint, model_info, deployment_size, args.location, args.add_route,
+        config=config, ready=not freshly_deployed, cascade_role=args.cascade_role
+    )
+    
+    # Warm up the new replicas before users hit them
+    if freshly_deployed and args.warmup_input:
+        from benchmark import load_samples
+        import endpoint_warmup
+        
+        print(f"\n🔥 Warming up the endpoint")
+        report = asyncio.run(endpoint_warmup.run_warmup(load_samples(args.warmup_input)))
+        endpoint_warmup.print_report(report)
+        endpoint_warmup.mark_ready("endpoint_config.json", report)
+        endpoint_info["ready"] = report["warm"]
     
     # Create prediction example
     create_prediction_example()
@@ -342,11 +536,18 @@ def main():
     print("=" * 60)
     print(f"Endpoint URI: {endpoint_info['endpoint_uri']}")
     print(f"Endpoint ID: {endpoint.name}")
-    print(f"\nThe endpoint is ready to receive prediction requests!")
+    if endpoint_info["ready"]:
+        print(f"\nThe endpoint is ready to receive prediction requests!")
+    else:
+        print(f"\n⚠️ The endpoint is not warmed up yet (ready = false in endpoint_config.json)")
+        print(f"  Warm it up with: python endpoint_warmup.py --input /path/to/requests.jsonl")
     print(f"Configuration files created:")
     print(f"  - endpoint_config.json (deployment details)")
     print(f"  - vertex_ai_config.php (PHP configuration)")
     print(f"  - predict_example.py (example prediction code)")
+    print(f"\nFor bulk scoring: python batch_predict.py --input /path/to/images")
+    if set(endpoint_info.get("cascade", {})) == {"fast", "accurate"}:
+        print(f"To serve the cascade: python prediction_gateway.py --cascade")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Local Edge Inference Engine
+Runs exported elephant detection models on CPU at field stations
+"""
+
+import io
+import os
+import json
+import time
+import base64
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from vertex_client import PredictionError
+import instrumentation
+
+# Configuration
+CPU_THREADS = os.cpu_count() or 4
+BATCH_SIZE = 16  # Images per inference call
+LABEL_FILES = ("dict.txt", "labels.txt")  # AutoML edge exports ship dict.txt
+DUMMY_INPUT_SIZE = 32
+DUMMY_LABELS = ["african_elephant", "asian_elephant", "no_elephant"]
+
+def load_labels(model_path, labels=None):
+    """Labels given explicitly or read from the label file next to the model"""
+    if labels:
+        return list(labels)
+    
+    model_dir = os.path.dirname(os.path.abspath(model_path))
+    for filename in LABEL_FILES:
+        path = os.path.join(model_dir, filename)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                return [line.strip() for line in f if line.strip()]
+    
+    return None
+
+def softmax(logits):
+    """Row-wise softmax"""
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+def to_probabilities(scores):
+    """Treat outputs as probabilities if they already look like them, else apply softmax"""
+    scores = scores.astype(np.float32)
+    if scores.min() >= 0 and np.allclose(scores.sum(axis=1), 1, atol=1e-2):
+        return scores
+    return softmax(scores)
+
+def decode_image(image_bytes, height, width):
+    """Decode and resize an image to an HxWx3 uint8 array"""
+    image = Image.open(io.BytesIO(image_bytes))
+    # Let the JPEG decoder downscale via DCT instead of decoding full resolution
+    image.draft("RGB", (width, height))
+    image = image.convert("RGB").resize((width, height), Image.BILINEAR)
+    return np.asarray(image, dtype=np.uint8)
+
+def quantize_weights(weights):
+    """Symmetric per-column int8 quantization, returns (int8 weights, float scales)"""
+    scales = np.abs(weights).max(axis=0) / 127
+    scales[scales == 0] = 1
+    quantized = np.clip(np.round(weights / scales), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+class NumpyLinearBackend:
+    """
+    Linear classifier over downsampled pixels stored as .npz
+    Used as a small dummy model for testing the engine without an ML runtime.
+    """
+    
+    def __init__(self, model_path, int8=False):
+        data = np.load(model_path)
+        self.input_size = int(data["input_size"])
+        self.labels = [str(label) for label in data["labels"]]
+        self.bias = data["bias"].astype(np.float32)
+        self.int8 = int8
+        
+        if int8:
+            self.weights, self.scales = quantize_weights(data["weights"].astype(np.float32))
+        else:
+            self.weights = data["weights"].astype(np.float32)
+    
+    def input_shape(self):
+        return self.input_size, self.input_size
+    
+    def run(self, pixels):
+        features = pixels.reshape(len(pixels), -1)
+        
+        if self.int8:
+            # uint8 pixels x int8 weights, accumulated in int32
+            accumulated = features.astype(np.int32) @ self.weights.astype(np.int32)
+            logits = accumulated * (self.scales / 255) + self.bias
+        else:
+            logits = (features.astype(np.float32) / 255) @ self.weights + self.bias
+        
+        return softmax(logits)
+
+class TFLiteBackend:
+    """TFLite interpreter (tflite_runtime or tensorflow), e.g. an AutoML edge export"""
+    
+    def __init__(self, model_path, threads=CPU_THREADS):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tensorflow.lite import Interpreter
+            except ImportError:
+                raise ImportError("TFLite models need tflite-runtime: pip install tflite-runtime")
+        
+        self.interpreter = Interpreter(model_path=model_path, num_threads=threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = 1
+        self.labels = None
+    
+    def input_shape(self):
+        return int(self.input["shape"][1]), int(self.input["shape"][2])
+    
+    def run(self, pixels):
+        if len(pixels) != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input["index"], [len(pixels), *self.input["shape"][1:]])
+            self.interpreter.allocate_tensors()
+            self.input = self.interpreter.get_input_details()[0]
+            self.output = self.interpreter.get_output_details()[0]
+            self.batch_size = len(pixels)
+        
+        if self.input["dtype"] == np.uint8:
+            # Quantized models take raw uint8 pixels
+            tensor = pixels
+        else:
+            tensor = pixels.astype(np.float32) / 255
+        
+        self.interpreter.set_tensor(self.input["index"], tensor)
+        self.interpreter.invoke()
+        scores = self.interpreter.get_tensor(self.output["index"])
+        
+        scale, zero_point = self.output.get("quantization", (0, 0))
+        if scale:
+            scores = (scores.astype(np.float32) - zero_point) * scale
+        
+        return to_probabilities(scores)
+
+class ONNXBackend:
+    """ONNX Runtime session, optionally with dynamically int8-quantized weights"""
+    
+    def __init__(self, model_path, threads=CPU_THREADS, int8=False):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("ONNX models need onnxruntime: pip install onnxruntime")
+        
+        if int8:
+            model_path = quantize_onnx_model(model_path)
+        
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input = self.session.get_inputs()[0]
+        self.labels = None
+        
+        # Inputs are either NHWC or NCHW
+        shape = self.input.shape
+        self.channels_first = shape[1] == 3
+        self.height, self.width = (shape[2], shape[3]) if self.channels_first else (shape[1], shape[2])
+    
+    def input_shape(self):
+        return int(self.height), int(self.width)
+    
+    def run(self, pixels):
+        tensor = pixels.astype(np.float32) / 255
+        if self.channels_first:
+            tensor = tensor.transpose(0, 3, 1, 2)
+        
+        scores = self.session.run(None, {self.input.name: tensor})[0]
+        return to_probabilities(scores)
+
+def quantize_onnx_model(model_path):
+    """Write an int8 weight-quantized copy of an ONNX model next to it (cached)"""
+    quantized_path = model_path[:-len(".onnx")] + ".int8.onnx"
+    
+    if not os.path.exists(quantized_path) or os.path.getmtime(quantized_path) < os.path.getmtime(model_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        print(f"  Quantizing weights to int8: {quantized_path}")
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+    
+    return quantized_path
+
+class EdgeInferenceEngine:
+    """
+    Batched local inference with the same interface as EndpointClient
+    predict() takes {"content": base64} instances and returns predictions in
+    the displayNames/confidences shape the Vertex AI endpoint returns, so the
+    engine can replace the endpoint call directly. Images are decoded on a
+    thread pool and scored in batches using all CPU cores. int8 quantizes the
+    weights of ONNX and dummy models; TFLite exports carry their own
+    quantization, which is detected from the input type.
+    """
+    
+    def __init__(self, model_path, labels=None, threads=CPU_THREADS, batch_size=BATCH_SIZE, int8=False):
+        if model_path.endswith(".tflite"):
+            self.backend = TFLiteBackend(model_path, threads=threads)
+        elif model_path.endswith(".onnx"):
+            self.backend = ONNXBackend(model_path, threads=threads, int8=int8)
+        elif model_path.endswith(".npz"):
+            self.backend = NumpyLinearBackend(model_path, int8=int8)
+        else:
+            raise ValueError(f"Unsupported model format: {model_path}")
+        
+        self.labels = load_labels(model_path, labels) or self.backend.labels
+        if not self.labels:
+            raise ValueError(f"No labels found for {model_path} (expected {' or '.join(LABEL_FILES)})")
+        
+        self.batch_size = batch_size
+        self.decoder = ThreadPoolExecutor(max_workers=threads)
+        # Interpreters are not thread-safe, run inference on one worker
+        self.runner = ThreadPoolExecutor(max_workers=1)
+        self.token_provider = None
+        self.stats = {"requests": 0, "instances": 0, "retries": 0, "errors": 0}
+    
+    async def open(self):
+        pass
+    
+    async def close(self):
+        self.decoder.shutdown(wait=False)
+        self.runner.shutdown(wait=False)
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+    
+    def predict_bytes(self, images):
+        """Score a list of raw image bytes synchronously"""
+        height, width = self.backend.input_shape()
+        predictions = []
+        
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            pixels = np.stack(list(self.decoder.map(lambda data: decode_image(data, height, width), chunk)))
+            probabilities = self.runner.submit(self.backend.run, pixels).result()
+            
+            for row in probabilities:
+                predictions.append({
+                    "displayNames": list(self.labels),
+                    "confidences": [round(float(value), 6) for value in row]
+                })
+        
+        return predictions
+    
+    async def predict(self, instances):
+        """Score {"content": base64} instances off the event loop"""
+        self.stats["requests"] += 1
+        images = [base64.b64decode(instance["content"]) for instance in instances]
+        
+        loop = asyncio.get_running_loop()
+        try:
+            predictions = await loop.run_in_executor(None, self.predict_bytes, images)
+        except (OSError, ValueError) as e:
+            # Undecodable images are rejected like the endpoint does
+            self.stats["errors"] += 1
+            raise PredictionError(f"Invalid image: {e}", status=400)
+        
+        self.stats["instances"] += len(instances)
+        return predictions
+
+def create_dummy_model(model_path, labels=DUMMY_LABELS, input_size=DUMMY_INPUT_SIZE, seed=0):
+    """Write a small random linear model for testing the engine on CPU"""
+    rng = np.random.default_rng(seed)
+    features = input_size * input_size * 3
+    
+    np.savez(
+        model_path,
+        weights=rng.normal(0, 0.05, size=(features, len(labels))).astype(np.float32),
+        bias=np.zeros(len(labels), dtype=np.float32),
+        labels=np.array(labels),
+        input_size=np.array(input_size)
+    )
+    print(f"✓ Dummy model saved to: {model_path}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Run an exported elephant detection model locally')
+    parser.add_argument('--model', required=True, help='Model file (.tflite, .onnx or .npz)')
+    parser.add_argument('--images', nargs='*', default=[], help='Images to score')
+    parser.add_argument('--labels', nargs='*', help='Labels (default: dict.txt next to the model)')
+    parser.add_argument('--threads', type=int, default=CPU_THREADS, help='CPU threads')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Images per inference call')
+    parser.add_argument('--int8', action='store_true', help='Use int8-quantized weights')
+    parser.add_argument('--create-dummy', action='store_true', help='Write a dummy .npz model to --model first')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "edge_inference")
+    
+    if args.create_dummy:
+        create_dummy_model(args.model)
+    
+    engine = EdgeInferenceEngine(
+        args.model,
+        labels=args.labels,
+        threads=args.threads,
+        batch_size=args.batch_size,
+        int8=args.int8
+    )
+    
+    images = []
+    for path in args.images:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    
+    start_time = time.perf_counter()
+    predictions = engine.predict_bytes(images)
+    elapsed = time.perf_counter() - start_time
+    
+    for path, prediction in zip(args.images, predictions):
+        print(json.dumps({"image": path, **prediction}))
+    
+    if images:
+        print(f"\n✓ Scored {len(images)} images in {elapsed * 1000:.1f}ms ({len(images) / elapsed:.1f} images/s)")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
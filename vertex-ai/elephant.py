@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Elephant Detection Command Line
+One entry point for all scripts: `elephant <command> [options]`. A command's
+module (and the cloud SDKs it needs) is only imported when the command runs.
+"""
+
+import os
+import sys
+import time
+import argparse
+import importlib
+import statistics
+import subprocess
+
+# Configuration
+COMMANDS = {
+    "import": ("dataset_import", "Import the image dataset from GCS into Vertex AI"),
+    "train": ("train_model", "Train a model on the imported dataset"),
+    "deploy": ("deploy_model", "Deploy a trained model or export it for edge use"),
+    "predict": ("batch_predict", "Score images against the endpoint or an edge model"),
+    "bench": ("benchmark", "Load-test a deployment"),
+    "pipeline": ("pipeline_runner", "Run import, train and deploy as one resumable run"),
+    "sweep": ("training_sweep", "Train all model types and select the fastest accurate one"),
+    "plan": ("capacity_planner", "Size a deployment for a target load"),
+    "warmup": ("endpoint_warmup", "Warm up a new deployment and keep it warm at night"),
+    "canary": ("canary_rollout", "Rehearse a latency-gated canary rollout against the stub"),
+    "cascade": ("model_cascade", "Rehearse the fast/accurate model cascade against stubs"),
+    "evaluate": ("model_evaluation", "Evaluate models and tune thresholds on labelled prediction logs"),
+    "batch": ("batch_jobs", "Score an archive with sharded batch prediction jobs"),
+    "gateway": ("prediction_gateway", "Serve the predict.php contract over a warm connection"),
+    "video": ("video_ingest", "Score video or camera-trap streams"),
+    "tile": ("tiled_inference", "Score high-resolution aerial images as tiles"),
+    "edge": ("edge_inference", "Run an exported model locally"),
+    "resolution": ("resolution_search", "Find the smallest stable input resolution"),
+    "preprocess": ("image_preprocess", "Benchmark request image preprocessing"),
+    "stub": ("stub_endpoint", "Serve a local stub prediction endpoint"),
+    "metrics": ("instrumentation", "Show where time went in a recorded run")
+}
+CHAIN_SEPARATOR = "+"  # elephant import --streaming + train + deploy
+STARTUP_REPEAT = 5
+SDK_MODULES = ["google.cloud.aiplatform", "google.cloud.storage"]
+
+def split_chain(argv):
+    """Split `a ... + b ... + c ...` into [[a, ...], [b, ...], [c, ...]]"""
+    stages = [[]]
+    for arg in argv:
+        if arg == CHAIN_SEPARATOR:
+            stages.append([])
+        else:
+            stages[-1].append(arg)
+    return [stage for stage in stages if stage]
+
+def run_command(command, args):
+    """Run one command's main() in this process, returns its exit status"""
+    module_name, _ = COMMANDS[command]
+    module = importlib.import_module(module_name)
+    
+    sys.argv = [f"elephant {command}"] + args
+    try:
+        module.main()
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    return 0
+
+def time_command(argv, repeat):
+    """Median wall time of a fresh interpreter running argv, in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return statistics.median(timings)
+
+def measure_startup(repeat=STARTUP_REPEAT):
+    """Time `--help` for every command against the bare interpreter and SDK imports"""
+    python = sys.executable
+    script = os.path.abspath(__file__)
+    
+    print(f"\n{'command':<28} {'median ms':>10}")
+    print(f"{'python (empty)':<28} {time_command([python, '-c', 'pass'], repeat):>10.0f}")
+    for module in SDK_MODULES:
+        label = f"import {module.rsplit('.', 1)[-1]}"
+        if subprocess.run([python, "-c", f"import {module}"], capture_output=True).returncode != 0:
+            print(f"{label:<28} {'not installed':>10}")
+            continue
+        print(f"{label:<28} {time_command([python, '-c', f'import {module}'], repeat):>10.0f}")
+    
+    print(f"{'elephant --help':<28} {time_command([python, script, '--help'], repeat):>10.0f}")
+    for command in COMMANDS:
+        label = f"elephant {command} --help"
+        print(f"{label:<28} {time_command([python, script, command, '--help'], repeat):>10.0f}")
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="elephant",
+        description="Elephant detection on Vertex AI",
+        epilog=f"Chain commands with '{CHAIN_SEPARATOR}' to share one cloud context, "
+               f"e.g. elephant import --streaming {CHAIN_SEPARATOR} train {CHAIN_SEPARATOR} deploy",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--startup-time', action='store_true',
+                       help='Measure the startup time of every command and exit')
+    parser.add_argument('--repeat', type=int, default=STARTUP_REPEAT, help='Runs per --startup-time measurement')
+    
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    for command, (_, description) in COMMANDS.items():
+        # Options belong to the command's own parser, see `elephant <command> --help`
+        commands.add_parser(command, help=description, add_help=False)
+    return parser
+
+def main():
+    parser = build_parser()
+    
+    # Global options come before the first command
+    first_command = next((i for i, arg in enumerate(sys.argv[1:]) if arg in COMMANDS), len(sys.argv) - 1)
+    args = parser.parse_args(sys.argv[1:first_command + 1])
+    
+    if args.startup_time:
+        measure_startup(args.repeat)
+        return
+    
+    stages = split_chain(sys.argv[first_command + 1:])
+    if not stages:
+        parser.print_help()
+        return
+    
+    for stage in stages:
+        if stage[0] not in COMMANDS:
+            parser.error(f"unknown command '{stage[0]}' (choose from {', '.join(COMMANDS)})")
+    
+    for number, stage in enumerate(stages, 1):
+        if len(stages) > 1:
+            print(f"\n▶️ [{number}/{len(stages)}] elephant {' '.join(stage)}")
+        status = run_command(stage[0], stage[1:])
+        if status:
+            sys.exit(status)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Multi-Endpoint Prediction Router
+Sends each predict call to the endpoint with the best tracked latency and
+error rate, and hedges slow calls to a second endpoint to cut tail latency
+"""
+
+import time
+import asyncio
+import collections
+from micro_batcher import percentile
+from vertex_client import (
+    DEFAULT_CONCURRENCY,
+    RETRYABLE_STATUS_CODES,
+    AccessTokenProvider,
+    EndpointClient,
+    PredictionError
+)
+import instrumentation
+
+# Configuration
+EWMA_ALPHA = 0.2  # Weight of the newest call in the moving averages
+ERROR_PENALTY = 10.0  # Score multiplier per unit of error rate
+HEDGE_PERCENTILE = 0.95  # Hedge once a call is slower than this share of recent calls
+HEDGE_MIN_SAMPLES = 20  # Recent calls needed before the hedge delay is trusted
+MIN_HEDGE_DELAY_MS = 5
+MAX_HEDGES = 1  # Extra copies of one call, each to a different endpoint
+ENDPOINT_RETRIES = 1  # Retries per endpoint, the router fails over instead
+LATENCY_SAMPLES = 1000  # Recent call latencies kept for the hedge delay
+PROBE_INTERVAL_SECONDS = 5  # An endpoint left idle this long gets the next call, to notice recovery
+
+class EndpointHealth:
+    """
+    Exponentially weighted latency and error rate of one endpoint
+    A call cancelled because a hedge won counts with the time it had taken
+    so far, so an endpoint that always loses still looks slow.
+    """
+    
+    def __init__(self, alpha=EWMA_ALPHA):
+        self.alpha = alpha
+        self.latency = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.last_call = time.perf_counter()
+        self.stats = {"calls": 0, "wins": 0, "errors": 0, "cancelled": 0}
+    
+    def record(self, latency, error=False, completed=True):
+        """Fold one call into the moving averages"""
+        self.stats["calls"] += 1
+        self.error_rate += self.alpha * (float(error) - self.error_rate)
+        if error:
+            self.stats["errors"] += 1
+            return
+        
+        if self.latency is None:
+            self.latency = latency
+        elif completed or latency > self.latency:
+            self.latency += self.alpha * (latency - self.latency)
+    
+    def score(self):
+        """Expected cost of sending the next call here, lower is better"""
+        if not self.stats["calls"] or time.perf_counter() - self.last_call > PROBE_INTERVAL_SECONDS:
+            # Untried and long unused endpoints are tried first
+            return self.in_flight
+        if self.latency is None:
+            # Called but never answered
+            return float("inf")
+        return self.latency * (self.in_flight + 1) * (1 + ERROR_PENALTY * self.error_rate)
+    
+    def summary(self):
+        """Moving averages and counters for reports"""
+        return {
+            "latency_ms": round(self.latency * 1000, 2) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "in_flight": self.in_flight,
+            **self.stats
+        }
+
+class EndpointRouter:
+    """
+    Client spreading predict calls over several endpoints
+    Has the same interface as EndpointClient. Each call goes to the endpoint
+    with the lowest score; if it has not answered after the hedge delay, a
+    copy goes to the next best endpoint and whichever answers first wins,
+    the other call is cancelled. Failed calls fail over at once.
+    """
+    
+    def __init__(self, endpoint_uris, token_provider=None, concurrency=DEFAULT_CONCURRENCY,
+                 max_retries=ENDPOINT_RETRIES, hedge=True, hedge_delay_ms=None,
+                 max_hedges=MAX_HEDGES, **client_options):
+        self.token_provider = token_provider
+        self.hedge = hedge
+        self.hedge_delay_ms = hedge_delay_ms
+        self.max_hedges = max_hedges
+        self.clients = [
+            EndpointClient(uri, token_provider=token_provider if uri.startswith("https://") else None,
+                           concurrency=concurrency, max_retries=max_retries, **client_options)
+            for uri in endpoint_uris
+        ]
+        self.health = {client.endpoint_uri: EndpointHealth() for client in self.clients}
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.router_stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "failovers": 0, "errors": 0}
+    
+    @property
+    def endpoint_uri(self):
+        return ", ".join(client.endpoint_uri for client in self.clients)
+    
+    @property
+    def stats(self):
+        """Router counters, summed client counters and per-endpoint health"""
+        stats = dict(self.router_stats)
+        stats["instances"] = sum(client.stats["instances"] for client in self.clients)
+        stats["retries"] = sum(client.stats["retries"] for client in self.clients)
+        stats["endpoints"] = {uri: health.summary() for uri, health in self.health.items()}
+        return stats
+    
+    async def __aenter__(self):
+        await self.open()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+    
+    async def open(self):
+        """Open a pooled session to every endpoint"""
+        for client in self.clients:
+            await client.open()
+    
+    async def close(self):
+        """Close every endpoint session"""
+        for client in self.clients:
+            await client.close()
+    
+    def hedge_delay(self):
+        """Seconds to wait before hedging a call, None until there are enough samples"""
+        if self.hedge_delay_ms is not None:
+            return self.hedge_delay_ms / 1000
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(percentile(list(self.latencies), HEDGE_PERCENTILE), MIN_HEDGE_DELAY_MS / 1000)
+    
+    def ranked_clients(self):
+        """Clients from best to worst score"""
+        return sorted(self.clients, key=lambda client: self.health[client.endpoint_uri].score())
+    
+    async def call(self, client, instances):
+        """One predict call to one endpoint, tracked in its health"""
+        health = self.health[client.endpoint_uri]
+        health.in_flight += 1
+        start_time = health.last_call = time.perf_counter()
+        try:
+            predictions = await client.predict(instances)
+        except PredictionError:
+            health.record(time.perf_counter() - start_time, error=True)
+            raise
+        except asyncio.CancelledError:
+            health.stats["cancelled"] += 1
+            health.record(time.perf_counter() - start_time, completed=False)
+            raise
+        finally:
+            health.in_flight -= 1
+        
+        latency = time.perf_counter() - start_time
+        health.record(latency)
+        self.latencies.append(latency)
+        return predictions
+    
+    async def predict(self, instances):
+        """
+        Send one predict call and return one prediction per instance
+        Client errors such as a bad image (HTTP 400) are not sent elsewhere.
+        """
+        self.router_stats["requests"] += 1
+        candidates = iter(self.ranked_clients())
+        pending = {}
+        hedges = set()
+        hedges_left = self.max_hedges if self.hedge else 0
+        error = None
+        
+        def launch():
+            client = next(candidates, None)
+            if client is None:
+                return None
+            task = asyncio.ensure_future(self.call(client, instances))
+            pending[task] = client
+            return task
+        
+        launch()
+        try:
+            while pending:
+                delay = self.hedge_delay() if hedges_left else None
+                done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                
+                if not done:
+                    hedges_left -= 1
+                    hedge = launch()
+                    if hedge is not None:
+                        hedges.add(hedge)
+                        self.router_stats["hedged"] += 1
+                        instrumentation.count("hedged_requests")
+                    continue
+                
+                for task in done:
+                    client = pending.pop(task)
+                    if task.exception() is None:
+                        self.health[client.endpoint_uri].stats["wins"] += 1
+                        if task in hedges:
+                            self.router_stats["hedge_wins"] += 1
+                        return task.result()
+                    
+                    error = task.exception()
+                    status = getattr(error, "status", None)
+                    if status and status < 500 and status not in RETRYABLE_STATUS_CODES:
+                        self.router_stats["errors"] += 1
+                        raise error
+                
+                if not pending:
+                    if launch() is not None:
+                        self.router_stats["failovers"] += 1
+                        instrumentation.count("failovers")
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        self.router_stats["errors"] += 1
+        raise error
+
+def create_router(endpoint_uris, **kwargs):
+    """Router over the given endpoints, with one shared token for https:// endpoints"""
+    token_provider = None
+    if any(uri.startswith("https://") for uri in endpoint_uris):
+        token_provider = AccessTokenProvider()
+    return EndpointRouter(endpoint_uris, token_provider=token_provider, **kwargs)
\ No newline at end of file
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Endpoint Warm-Up and Keep-Warm
+Replays sample requests against a fresh deployment until its latency settles,
+marks the endpoint ready, and keeps replicas warm during low-traffic hours
+"""
+
+import os
+import json
+import time
+import argparse
+import asyncio
+import contextlib
+from datetime import datetime
+from benchmark import load_samples, run_closed_loop, summarize
+from vertex_client import ENDPOINT_CONFIG_FILE, PredictionError, create_endpoint_client, load_endpoint_config
+import instrumentation
+
+# Configuration
+WARMUP_WINDOW = 20  # Calls per measurement window
+STABLE_TOLERANCE = 0.10  # Window p50 change still counted as stable
+STABLE_WINDOWS = 3  # Consecutive stable windows before the endpoint counts as warm
+MAX_WARMUP_SECONDS = 300
+CALLS_PER_REPLICA = 2  # Concurrent calls per replica, so every replica up to the max gets traffic
+KEEP_WARM_HOURS = "22-6"  # Local hours with too little traffic to keep replicas warm
+KEEP_WARM_INTERVAL_MINUTES = 10
+KEEP_WARM_CALLS = 4
+
+def warmup_concurrency(config, calls_per_replica=CALLS_PER_REPLICA):
+    """Concurrent calls needed to reach every replica up to max_replica_count"""
+    return max(1, (config.get("max_replica_count") or 1) * calls_per_replica)
+
+async def warm_up(client, samples, concurrency, window=WARMUP_WINDOW, tolerance=STABLE_TOLERANCE,
+                  stable_windows=STABLE_WINDOWS, max_seconds=MAX_WARMUP_SECONDS):
+    """
+    Time one cold call, then send windows of concurrent calls until the window
+    p50 stays within `tolerance` of the previous window `stable_windows` times
+    in a row. Returns the warm-up report.
+    """
+    start_time = time.perf_counter()
+    first_call = summarize(await run_closed_loop(client, samples, 1, max_seconds, max_requests=1))
+    windows = []
+    stable_count = 0
+    
+    while time.perf_counter() - start_time < max_seconds:
+        summary = summarize(await run_closed_loop(
+            client, samples, concurrency, max_seconds, max_requests=window
+        ))
+        p50 = summary["latency_ms"]["p50"]
+        windows.append({
+            "elapsed_seconds": round(time.perf_counter() - start_time, 2),
+            "calls": summary["requests"],
+            "errors": summary["errors"],
+            "p50_ms": p50,
+            "p95_ms": summary["latency_ms"]["p95"]
+        })
+        print(f"  {windows[-1]['elapsed_seconds']:7.1f}s  p50 {str(p50):>8}ms"
+              f"  p95 {str(windows[-1]['p95_ms']):>8}ms  errors {summary['errors']}")
+        
+        previous = windows[-2]["p50_ms"] if len(windows) > 1 else None
+        if summary["errors"] or not p50 or previous is None or abs(p50 - previous) > tolerance * previous:
+            stable_count = 0
+        else:
+            stable_count += 1
+        if stable_count >= stable_windows:
+            break
+    
+    warm = stable_count >= stable_windows
+    return {
+        "warm": warm,
+        "concurrency": concurrency,
+        "first_call_ms": first_call["latency_ms"]["max"],
+        "first_call_error": bool(first_call["errors"]),
+        "seconds_to_stable": windows[-1]["elapsed_seconds"] if warm else None,
+        "stable_p50_ms": windows[-1]["p50_ms"] if warm else None,
+        "stable_p95_ms": windows[-1]["p95_ms"] if warm else None,
+        "calls": 1 + sum(window["calls"] for window in windows),
+        "windows": windows
+    }
+
+def mark_ready(config_file, report):
+    """Record the warm-up in endpoint_config.json and set "ready" once warm"""
+    config = load_endpoint_config(config_file) or {}
+    config["ready"] = report["warm"]
+    config["warmup"] = dict(report, finished_time=datetime.now().isoformat())
+    
+    # Readers (gateway, prediction cache) must never see a half-written file
+    temporary_file = f"{config_file}.tmp"
+    with open(temporary_file, "w") as f:
+        json.dump(config, f, indent=2)
+    os.replace(temporary_file, config_file)
+
+def in_hours(hour, hours=KEEP_WARM_HOURS):
+    """Whether an hour of the day falls in a "start-end" range (which may wrap past midnight)"""
+    start, end = (int(part) for part in hours.split("-"))
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+async def keep_warm(client, samples, hours=KEEP_WARM_HOURS, interval_minutes=KEEP_WARM_INTERVAL_MINUTES,
+                    calls=KEEP_WARM_CALLS, max_rounds=None):
+    """Every interval inside the keep-warm hours, send a few calls so replicas stay warm"""
+    rounds = 0
+    while max_rounds is None or rounds < max_rounds:
+        now = datetime.now()
+        if in_hours(now.hour, hours):
+            summary = summarize(await run_closed_loop(client, samples, calls, 60, max_requests=calls))
+            instrumentation.count("keep_warm_calls", summary["requests"])
+            print(f"  {now.strftime('%H:%M')} keep-warm: {summary['requests']} calls, "
+                  f"p50 {summary['latency_ms']['p50']}ms, errors {summary['errors']}")
+        rounds += 1
+        if max_rounds is None or rounds < max_rounds:
+            await asyncio.sleep(interval_minutes * 60)
+
+@contextlib.asynccontextmanager
+async def open_endpoint(endpoint_uri=None, config_file=ENDPOINT_CONFIG_FILE, concurrency=None, stub_options=None):
+    """
+    Open a client for the configured endpoint (or a local stub)
+    Yields (client, concurrency needed to reach every replica).
+    """
+    stub_runner = None
+    if stub_options is not None:
+        from stub_endpoint import start_stub_server
+        stub_runner, endpoint_uri = await start_stub_server(port=0, **stub_options)
+        config = {"max_replica_count": stub_options.get("replicas")}
+    else:
+        config = load_endpoint_config(config_file)
+        if config is None:
+            raise PredictionError(f"No endpoint configured in {config_file}")
+    concurrency = concurrency or warmup_concurrency(config)
+    
+    # Warm the endpoint that was just deployed, not every endpoint the config routes to
+    client = create_endpoint_client(
+        endpoint_uri or config["endpoint_uri"], config_file=config_file,
+        concurrency=concurrency, max_retries=0
+    )
+    try:
+        async with client:
+            yield client, concurrency
+    finally:
+        if stub_runner is not None:
+            await stub_runner.cleanup()
+
+async def run_warmup(samples, endpoint_uri=None, config_file=ENDPOINT_CONFIG_FILE, concurrency=None,
+                     stub_options=None, **warmup_options):
+    """Warm up the configured endpoint (or a local stub), returns the warm-up report"""
+    async with open_endpoint(endpoint_uri, config_file, concurrency, stub_options) as (client, concurrency):
+        with instrumentation.span("warm_up", concurrency=concurrency):
+            report = await warm_up(client, samples, concurrency, **warmup_options)
+    
+    report["target"] = "stub" if stub_options is not None else client.endpoint_uri
+    return report
+
+async def run_keep_warm(samples, endpoint_uri=None, config_file=ENDPOINT_CONFIG_FILE, stub_options=None,
+                        **keep_warm_options):
+    """Keep the configured endpoint (or a local stub) warm until interrupted"""
+    calls = keep_warm_options.get("calls", KEEP_WARM_CALLS)
+    async with open_endpoint(endpoint_uri, config_file, calls, stub_options) as (client, _):
+        await keep_warm(client, samples, **keep_warm_options)
+
+def print_report(report):
+    """Print the warm-up summary"""
+    print(f"  First call: {report['first_call_ms']}ms")
+    if report["warm"]:
+        print(f"  Stable after: {report['seconds_to_stable']}s ({report['calls']} calls)")
+        print(f"  Warm latency: p50 {report['stable_p50_ms']}ms  p95 {report['stable_p95_ms']}ms")
+    else:
+        print(f"  ⚠️ Latency did not settle within {len(report['windows'])} windows ({report['calls']} calls)")
+
+def main():
+    parser = argparse.ArgumentParser(description='Warm up a deployed endpoint and mark it ready')
+    parser.add_argument('--input', required=True,
+                       help='Image directory or JSONL file of representative requests (e.g. requests.jsonl)')
+    parser.add_argument('--config-file', default=ENDPOINT_CONFIG_FILE, help='Endpoint configuration file')
+    parser.add_argument('--endpoint-uri', help='Predict URI (default: from endpoint_config.json)')
+    parser.add_argument('--concurrency', type=int,
+                       help=f'Concurrent calls (default: {CALLS_PER_REPLICA} per replica up to max_replica_count)')
+    parser.add_argument('--window', type=int, default=WARMUP_WINDOW, help='Calls per measurement window')
+    parser.add_argument('--max-seconds', type=float, default=MAX_WARMUP_SECONDS, help='Longest warm-up')
+    parser.add_argument('--keep-warm', action='store_true', help='After warming up, keep the endpoint warm')
+    parser.add_argument('--hours', default=KEEP_WARM_HOURS, help='Local hours to keep warm (start-end)')
+    parser.add_argument('--interval-minutes', type=float, default=KEEP_WARM_INTERVAL_MINUTES,
+                       help='Minutes between keep-warm rounds')
+    parser.add_argument('--keep-warm-calls', type=int, default=KEEP_WARM_CALLS, help='Calls per keep-warm round')
+    parser.add_argument('--stub', action='store_true', help='Warm up a local stub endpoint instead')
+    parser.add_argument('--stub-cold-start-ms', type=float, default=1000.0, help='Stub extra time of the first call')
+    parser.add_argument('--stub-cold-calls', type=int, default=30, help='Stub calls until it is warm')
+    parser.add_argument('--stub-replicas', type=int, default=2, help='Stub concurrent call limit')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "endpoint_warmup")
+    
+    print("=" * 60)
+    print("🐘 ELEPHANT DETECTION - ENDPOINT WARM-UP")
+    print("=" * 60)
+    
+    samples = load_samples(args.input)
+    if not samples:
+        print("❌ No sample images found")
+        return
+    
+    stub_options = None
+    if args.stub:
+        stub_options = {
+            "latency_ms": 50.0,
+            "jitter_ms": 5.0,
+            "replicas": args.stub_replicas,
+            "cold_start_ms": args.stub_cold_start_ms,
+            "cold_calls": args.stub_cold_calls
+        }
+    
+    print(f"\n🔥 Warming up until the p50 of {STABLE_WINDOWS} windows in a row "
+          f"changes less than {STABLE_TOLERANCE:.0%}")
+    report = asyncio.run(run_warmup(
+        samples,
+        endpoint_uri=args.endpoint_uri,
+        config_file=args.config_file,
+        concurrency=args.concurrency,
+        stub_options=stub_options,
+        window=args.window,
+        max_seconds=args.max_seconds
+    ))
+    
+    print("\n" + "=" * 60)
+    print("✅ ENDPOINT WARM" if report["warm"] else "⚠️ ENDPOINT NOT WARM")
+    print("=" * 60)
+    print_report(report)
+    if not args.stub:
+        mark_ready(args.config_file, report)
+        print(f"✓ {args.config_file}: ready = {str(report['warm']).lower()}")
+    
+    if args.keep_warm:
+        print(f"\n🌙 Keeping warm between {args.hours}h, {args.keep_warm_calls} calls "
+              f"every {args.interval_minutes:g} minutes (Ctrl+C to stop)")
+        try:
+            asyncio.run(run_keep_warm(
+                samples,
+                endpoint_uri=args.endpoint_uri,
+                config_file=args.config_file,
+                stub_options=stub_options,
+                hours=args.hours,
+                interval_minutes=args.interval_minutes,
+                calls=args.keep_warm_calls
+            ))
+        except KeyboardInterrupt:
+            print("\n✓ Keep-warm stopped")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Image Detection
+Perceptual hashing and a BK-tree index for clustering camera-trap bursts
+"""
+
+import io
+import numpy as np
+from PIL import Image
+
+# Configuration
+HASH_SIZE = 8  # 8x8 difference hash -> 64 bit fingerprint
+DEFAULT_MAX_DISTANCE = 6  # Max Hamming distance for two frames to count as duplicates
+
+def dhash(image_bytes, hash_size=HASH_SIZE):
+    """
+    Compute the difference hash of an image
+    Compares neighbouring pixels of a small grayscale thumbnail, so the hash
+    survives re-encoding, small exposure changes and minor movement.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    
+    # Let the JPEG decoder downscale via DCT instead of decoding full resolution
+    image.draft('L', (hash_size * 4, hash_size * 4))
+    
+    pixels = np.asarray(
+        image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR),
+        dtype=np.int16
+    )
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+def hamming_distance(hash_a, hash_b):
+    """Number of differing bits between two hashes"""
+    return bin(hash_a ^ hash_b).count('1')
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance
+    Range queries only descend into children whose edge distance can still
+    contain a match, so lookups touch a small fraction of the stored hashes.
+    """
+    
+    def __init__(self):
+        self.root = None
+        self.size = 0
+    
+    def add(self, hash_value, item):
+        """Insert a hash with an associated item"""
+        self.size += 1
+        node = [hash_value, item, {}]
+        
+        if self.root is None:
+            self.root = node
+            return
+        
+        current = self.root
+        while True:
+            distance = hamming_distance(hash_value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+    
+    def find_nearest(self, hash_value, max_distance):
+        """Return (distance, item) of the closest stored hash within range, or None"""
+        if self.root is None:
+            return None
+        
+        best = None
+        candidates = [self.root]
+        
+        while candidates:
+            node_hash, node_item, children = candidates.pop()
+            distance = hamming_distance(hash_value, node_hash)
+            
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, node_item)
+                if distance == 0:
+                    break
+            
+            # Triangle inequality: matches lie in children at distance +/- max_distance
+            low = distance - max_distance
+            high = distance + max_distance
+            candidates.extend(
+                child for edge, child in children.items() if low <= edge <= high
+            )
+        
+        return best
+
+def cluster_near_duplicates(hashed_records, max_distance=DEFAULT_MAX_DISTANCE):
+    """
+    Greedily cluster records by perceptual hash, one representative per cluster
+    Takes (record, hash) pairs and yields (record, representative uri, distance);
+    the representative is None when the record starts a new cluster. Clusters never
+    span labels, so near-identical frames with different labels are all kept.
+    """
+    trees = {}
+    
+    for record, hash_value in hashed_records:
+        if hash_value is None:
+            # Could not hash the image, keep it rather than guess
+            yield record, None, None
+            continue
+        
+        tree = trees.setdefault(record["label"], BKTree())
+        match = tree.find_nearest(hash_value, max_distance)
+        
+        if match is None:
+            tree.add(hash_value, record["uri"])
+            yield record, None, None
+        else:
+            distance, representative = match
+            yield record, representative, distance
\ No newline at end of file
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Image Preprocessing for Prediction Requests
+Downsizes uploads to the serving resolution and base64-encodes them for predict calls
+"""
+
+import io
+import os
+import json
+import time
+import base64
+import argparse
+from PIL import Image, ImageOps
+import instrumentation
+
+# Configuration
+MAX_DIMENSION = 1024  # Same limit as predict.php
+JPEG_QUALITY = 90
+BENCHMARK_REPEAT = 5
+PROFILE_FILE = "preprocess_profiles.json"  # Per-model settings written by resolution_search.py
+
+def target_size(width, height, max_dimension):
+    """Size that fits in max_dimension x max_dimension, keeping the aspect ratio"""
+    ratio = min(max_dimension / width, max_dimension / height)
+    return max(1, int(width * ratio)), max(1, int(height * ratio))
+
+def preprocess_image(image_bytes, max_dimension=MAX_DIMENSION, quality=JPEG_QUALITY):
+    """
+    Return image data no larger than max_dimension on either side
+    Images that already fit are returned unchanged without decoding. Larger
+    JPEGs are decoded at reduced resolution by the DCT (1/2, 1/4 or 1/8 scale)
+    before the final resize, so a 40 MP frame never decodes at full size.
+    The result is bytes-like: the input bytes or a view of the new JPEG.
+    """
+    # Opening only reads the header
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    if width <= max_dimension and height <= max_dimension:
+        return image_bytes
+    
+    size = target_size(width, height, max_dimension)
+    image.draft("RGB", size)
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    
+    # exif_transpose may have swapped the sides
+    size = target_size(image.width, image.height, max_dimension)
+    if image.size != size:
+        image = image.resize(size, Image.BICUBIC)
+    
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=quality)
+    return output.getbuffer()
+
+def encode_content(image_bytes, max_dimension=MAX_DIMENSION, quality=JPEG_QUALITY):
+    """Preprocess an image and base64-encode it for the "content" field of a predict instance"""
+    data = preprocess_image(image_bytes, max_dimension, quality)
+    # b64encode reads the buffer in place, no copy of the JPEG is made
+    return base64.b64encode(data).decode("ascii")
+
+def get_model_key(config_file, edge_model=None):
+    """Key of the served model in the profile file"""
+    if edge_model:
+        return f"edge:{os.path.basename(edge_model)}"
+    try:
+        with open(config_file, "r") as f:
+            return json.load(f).get("model_id")
+    except (OSError, ValueError):
+        return None
+
+def load_profiles(profile_file=PROFILE_FILE):
+    """All tuned profiles by model key"""
+    try:
+        with open(profile_file, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def load_profile(model_key, profile_file=PROFILE_FILE):
+    """
+    Preprocessing settings for a model as {"max_dimension", "quality"}
+    Falls back to the predict.php defaults for models that were not tuned.
+    """
+    profile = load_profiles(profile_file).get(model_key) or {}
+    return {
+        "max_dimension": profile.get("max_dimension", MAX_DIMENSION),
+        "quality": profile.get("quality", JPEG_QUALITY)
+    }
+
+def save_profile(model_key, profile, profile_file=PROFILE_FILE):
+    """Store the tuned profile of one model, keeping the others"""
+    profiles = load_profiles(profile_file)
+    profiles[model_key] = profile
+    with open(profile_file, "w") as f:
+        json.dump(profiles, f, indent=2)
+
+def legacy_encode_content(image_bytes, max_dimension=MAX_DIMENSION, quality=JPEG_QUALITY):
+    """The predict.php path: full decode, resample and re-encode, then base64"""
+    image = Image.open(io.BytesIO(image_bytes))
+    image.load()
+    if image.width > max_dimension or image.height > max_dimension:
+        resized = image.convert("RGB").resize(target_size(image.width, image.height, max_dimension), Image.BICUBIC)
+        output = io.BytesIO()
+        resized.save(output, "JPEG", quality=quality)
+        image_bytes = output.getvalue()
+    return base64.b64encode(image_bytes).decode("ascii")
+
+def create_synthetic_jpeg(width, height, quality=JPEG_QUALITY):
+    """A noisy JPEG of the given size, standing in for a camera-trap frame"""
+    tile = Image.effect_noise((512, 512), 64).convert("RGB")
+    image = Image.new("RGB", (width, height))
+    for x in range(0, width, 512):
+        for y in range(0, height, 512):
+            image.paste(tile, (x, y))
+    
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=quality)
+    return output.getvalue()
+
+def time_encoder(encoder, image_bytes, repeat, max_dimension, quality):
+    """Best-of-repeat milliseconds and the encoded size"""
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        content = encoder(image_bytes, max_dimension, quality)
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return min(timings), len(content)
+
+def run_benchmark(images, repeat=BENCHMARK_REPEAT, max_dimension=MAX_DIMENSION, quality=JPEG_QUALITY):
+    """Compare the predict.php path with the DCT-scaled path for each image"""
+    print(f"\n{'image':<28} {'pixels':>12} {'legacy ms':>10} {'fast ms':>9} {'speedup':>8} {'legacy KB':>10} {'fast KB':>8}")
+    for name, image_bytes in images:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            pixels = f"{image.width}x{image.height}"
+        
+        legacy_ms, legacy_size = time_encoder(legacy_encode_content, image_bytes, repeat, max_dimension, quality)
+        fast_ms, fast_size = time_encoder(encode_content, image_bytes, repeat, max_dimension, quality)
+        
+        print(f"{name[-28:]:<28} {pixels:>12} {legacy_ms:>10.1f} {fast_ms:>9.1f} "
+              f"{legacy_ms / fast_ms:>7.1f}x {legacy_size / 1024:>10.0f} {fast_size / 1024:>8.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark request image preprocessing')
+    parser.add_argument('--images', nargs='*', default=[], help='Images to benchmark')
+    parser.add_argument('--synthetic', nargs='*', default=[],
+                       help='Synthetic JPEG sizes to benchmark, e.g. 6000x4000')
+    parser.add_argument('--max-dimension', type=int, default=MAX_DIMENSION, help='Longest side sent for prediction')
+    parser.add_argument('--quality', type=int, default=JPEG_QUALITY, help='JPEG quality of downsized images')
+    parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT, help='Runs per image (best is reported)')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "image_preprocess")
+    
+    images = []
+    for path in args.images:
+        with open(path, "rb") as f:
+            images.append((path, f.read()))
+    for size in args.synthetic:
+        width, height = (int(value) for value in size.lower().split("x"))
+        images.append((f"synthetic {size}", create_synthetic_jpeg(width, height)))
+    
+    if not images:
+        parser.error("give --images and/or --synthetic sizes")
+    
+    print("=" * 60)
+    print("🐘 ELEPHANT DETECTION - PREPROCESSING BENCHMARK")
+    print("=" * 60)
+    print(f"  Target: {args.max_dimension}px, JPEG quality {args.quality}")
+    
+    run_benchmark(images, args.repeat, args.max_dimension, args.quality)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
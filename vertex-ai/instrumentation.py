@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Run Instrumentation
+Nested timing spans, counters and peak-memory sampling for the vertex-ai scripts,
+written as JSON lines and optionally as a Prometheus text file
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import threading
+import contextlib
+import contextvars
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Configuration
+MEMORY_SAMPLE_SECONDS = 0.5  # RSS sampling interval for span peaks
+MEMORY_LOG_SECONDS = 60  # Interval of memory lines in the JSONL output
+METRIC_PREFIX = "elephant"
+
+_recorder = None
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+def current_rss_bytes():
+    """Resident memory of this process"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_bytes()
+
+def peak_rss_bytes(who=None):
+    """Peak resident memory reported by the OS (of this process or its children)"""
+    if resource is None:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return usage if sys.platform == "darwin" else usage * 1024
+
+class Span:
+    """One timed section; the dict of attributes can be filled in while it runs"""
+    
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.path = f"{parent.path}/{name}" if parent else name
+        self.depth = parent.depth + 1 if parent else 0
+        self.attributes = attributes
+        self.start_time = time.time()
+        self.start_rss = current_rss_bytes()
+        self.peak_rss = self.start_rss
+
+class Recorder:
+    """Collects spans and counters for one run and writes them out"""
+    
+    def __init__(self, output_file, entry_point, prometheus_file=None, sample_seconds=MEMORY_SAMPLE_SECONDS):
+        self.entry_point = entry_point
+        self.run_id = f"{entry_point}-{datetime.now().strftime('%Y%m%d_%H%M%S')}-{os.getpid()}"
+        self.prometheus_file = prometheus_file
+        self.output = open(output_file, "a")
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.span_totals = {}
+        self.open_spans = set()
+        self.peak_rss = current_rss_bytes()
+        self.start_time = time.time()
+        self.stop = threading.Event()
+        self.sampler = threading.Thread(target=self.sample_memory, args=(sample_seconds,), daemon=True)
+        self.sampler.start()
+    
+    def write(self, record):
+        with self.lock:
+            self.output.write(json.dumps(dict(record, run=self.run_id)) + "\n")
+            self.output.flush()
+    
+    def sample_memory(self, interval):
+        """Track the peak RSS of the run and of every open span"""
+        last_log = time.time()
+        while not self.stop.wait(interval):
+            rss = current_rss_bytes()
+            with self.lock:
+                self.peak_rss = max(self.peak_rss, rss)
+                for span in self.open_spans:
+                    span.peak_rss = max(span.peak_rss, rss)
+            
+            if time.time() - last_log >= MEMORY_LOG_SECONDS:
+                self.write({"type": "memory", "time": datetime.now().isoformat(), "rss_mb": round(rss / 2**20, 1)})
+                last_log = time.time()
+    
+    def start_span(self, span):
+        with self.lock:
+            self.open_spans.add(span)
+    
+    def end_span(self, span, status):
+        seconds = time.time() - span.start_time
+        rss = current_rss_bytes()
+        with self.lock:
+            self.open_spans.discard(span)
+            span.peak_rss = max(span.peak_rss, rss)
+            self.peak_rss = max(self.peak_rss, rss)
+            calls, total = self.span_totals.get(span.path, (0, 0.0))
+            self.span_totals[span.path] = (calls + 1, total + seconds)
+        
+        self.write({
+            "type": "span",
+            "span": span.path,
+            "depth": span.depth,
+            "start": datetime.fromtimestamp(span.start_time).isoformat(),
+            "seconds": round(seconds, 4),
+            "status": status,
+            "rss_start_mb": round(span.start_rss / 2**20, 1),
+            "rss_peak_mb": round(span.peak_rss / 2**20, 1),
+            **({"attributes": span.attributes} if span.attributes else {})
+        })
+    
+    def count(self, name, value):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+    
+    def finish(self):
+        """Write the run summary and the Prometheus file"""
+        self.stop.set()
+        self.peak_rss = max(self.peak_rss, peak_rss_bytes())
+        summary = {
+            "type": "summary",
+            "entry_point": self.entry_point,
+            "seconds": round(time.time() - self.start_time, 3),
+            "peak_rss_mb": round(self.peak_rss / 2**20, 1),
+            "peak_rss_children_mb": round(peak_rss_bytes(resource.RUSAGE_CHILDREN) / 2**20, 1) if resource else None,
+            "counters": dict(self.counters)
+        }
+        self.write(summary)
+        self.output.close()
+        
+        if self.prometheus_file:
+            write_prometheus(self, summary)
+
+def prometheus_labels(**labels):
+    """Label set in the text exposition format"""
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+def write_prometheus(recorder, summary):
+    """
+    Write the run as a Prometheus text file
+    Values describe the last run, for the node_exporter textfile collector.
+    The file is replaced atomically so a scrape never sees a partial file.
+    """
+    entry_point = recorder.entry_point
+    lines = [
+        f"# HELP {METRIC_PREFIX}_span_seconds Time spent in each span during the last run",
+        f"# TYPE {METRIC_PREFIX}_span_seconds gauge"
+    ]
+    for path, (calls, seconds) in sorted(recorder.span_totals.items()):
+        lines.append(f"{METRIC_PREFIX}_span_seconds{prometheus_labels(entry_point=entry_point, span=path)} {seconds:.4f}")
+    
+    lines += [
+        f"# HELP {METRIC_PREFIX}_span_calls Times each span ran during the last run",
+        f"# TYPE {METRIC_PREFIX}_span_calls gauge"
+    ]
+    for path, (calls, seconds) in sorted(recorder.span_totals.items()):
+        lines.append(f"{METRIC_PREFIX}_span_calls{prometheus_labels(entry_point=entry_point, span=path)} {calls}")
+    
+    lines += [
+        f"# HELP {METRIC_PREFIX}_counter Counters of the last run (images listed, bytes uploaded, retries, ...)",
+        f"# TYPE {METRIC_PREFIX}_counter gauge"
+    ]
+    for name, value in sorted(summary["counters"].items()):
+        lines.append(f"{METRIC_PREFIX}_counter{prometheus_labels(entry_point=entry_point, name=name)} {value}")
+    
+    lines += [
+        f"# HELP {METRIC_PREFIX}_peak_rss_bytes Peak resident memory of the last run",
+        f"# TYPE {METRIC_PREFIX}_peak_rss_bytes gauge",
+        f"{METRIC_PREFIX}_peak_rss_bytes{prometheus_labels(entry_point=entry_point)} {recorder.peak_rss}",
+        f"# HELP {METRIC_PREFIX}_last_run_timestamp_seconds End time of the last run",
+        f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge",
+        f"{METRIC_PREFIX}_last_run_timestamp_seconds{prometheus_labels(entry_point=entry_point)} {time.time():.0f}"
+    ]
+    
+    temporary_file = f"{recorder.prometheus_file}.tmp"
+    with open(temporary_file, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(temporary_file, recorder.prometheus_file)
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """
+    Time a section of work, nested under the enclosing span
+    Yields a dict that can be filled with attributes (e.g. counts) while the
+    span runs. Does nothing when instrumentation is not enabled.
+    """
+    recorder = _recorder
+    if recorder is None:
+        yield attributes
+        return
+    
+    current = Span(name, _current_span.get(), attributes)
+    recorder.start_span(current)
+    token = _current_span.set(current)
+    status = "ok"
+    try:
+        yield current.attributes
+    except BaseException as e:
+        status = f"error: {type(e).__name__}"
+        raise
+    finally:
+        _current_span.reset(token)
+        recorder.end_span(current, status)
+
+def count(name, value=1):
+    """Add to a run counter such as images_listed, bytes_uploaded or retries"""
+    if _recorder is not None:
+        _recorder.count(name, value)
+
+def enable(output_file, entry_point, prometheus_file=None):
+    """Start recording; the run is written out at interpreter exit"""
+    global _recorder
+    if _recorder is not None:
+        return _recorder
+    
+    _recorder = Recorder(output_file, entry_point, prometheus_file)
+    root = contextlib.ExitStack()
+    root.enter_context(span(entry_point, argv=sys.argv[1:]))
+    
+    def finish():
+        global _recorder
+        root.close()
+        _recorder.finish()
+        _recorder = None
+    
+    atexit.register(finish)
+    return _recorder
+
+def add_arguments(parser):
+    """The --metrics options shared by every entry point"""
+    parser.add_argument('--metrics', metavar='FILE',
+                       help='Record timing spans, counters and peak memory to this JSONL file')
+    parser.add_argument('--metrics-prom', metavar='FILE',
+                       help='With --metrics, also write a Prometheus text file')
+
+def configure(args, entry_point):
+    """Enable instrumentation when --metrics was given"""
+    if getattr(args, "metrics", None):
+        enable(args.metrics, entry_point, args.metrics_prom)
+        print(f"📈 Recording metrics to: {args.metrics}")
+
+def summarize(metrics_file, run=None):
+    """Span totals of one run (the last one by default) from a metrics file, slowest first"""
+    with open(metrics_file, "r") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    
+    if run is None:
+        runs = [record["run"] for record in records if record["type"] == "summary"]
+        run = runs[-1] if runs else None
+    
+    totals = {}
+    for record in records:
+        if record["run"] == run and record["type"] == "span":
+            calls, seconds, peak = totals.get(record["span"], (0, 0.0, 0.0))
+            totals[record["span"]] = (calls + 1, seconds + record["seconds"], max(peak, record["rss_peak_mb"]))
+    
+    summary = next((record for record in records if record["run"] == run and record["type"] == "summary"), None)
+    return run, sorted(totals.items(), key=lambda item: item[1][1], reverse=True), summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Show where time went in a recorded run')
+    parser.add_argument('metrics_file', help='JSONL file written with --metrics')
+    parser.add_argument('--run', help='Run ID (default: the last finished run)')
+    
+    args = parser.parse_args()
+    
+    run, totals, summary = summarize(args.metrics_file, args.run)
+    if run is None:
+        print("❌ No finished run found")
+        return
+    
+    print("=" * 60)
+    print(f"📈 {run}")
+    print("=" * 60)
+    print(f"{'span':<50} {'calls':>6} {'seconds':>10} {'peak MB':>9}")
+    for path, (calls, seconds, peak) in totals:
+        print(f"{path[-50:]:<50} {calls:>6} {seconds:>10.2f} {peak:>9.1f}")
+    
+    if summary:
+        print(f"\n  Peak memory: {summary['peak_rss_mb']} MB (children {summary['peak_rss_children_mb']} MB)")
+        for name, value in sorted(summary["counters"].items()):
+            print(f"  {name}: {value}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Micro-Batching Request Coalescer
+Collects concurrent single-image requests into batched predict calls
+"""
+
+import math
+import time
+import asyncio
+import collections
+
+# Configuration
+MAX_BATCH_SIZE = 16  # Instances per batched predict call
+MAX_WAIT_MS = 15  # Longest a request waits for others to join its batch
+LATENCY_SAMPLES = 10000  # Recent queue waits kept for percentiles
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+class MicroBatcher:
+    """
+    Coalesce concurrent predict requests into batches
+    A batch is sent when it reaches max_batch_size or when its first request
+    has waited max_wait_ms, whichever comes first. Each caller gets back its
+    own prediction. predict_fn takes a list of instances and returns a list
+    of predictions in the same order.
+    """
+    
+    def __init__(self, predict_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.pending = []
+        self.flush_timer = None
+        self.in_flight = set()
+        self.batch_sizes = collections.Counter()
+        self.queue_waits = collections.deque(maxlen=LATENCY_SAMPLES)
+    
+    async def submit(self, instance):
+        """Queue one instance and wait for its prediction"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((instance, future, time.perf_counter()))
+        
+        if len(self.pending) >= self.max_batch_size:
+            self.flush()
+        elif self.flush_timer is None:
+            self.flush_timer = loop.call_later(self.max_wait, self.flush)
+        
+        return await future
+    
+    def flush(self):
+        """Send everything pending as one batch"""
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        
+        if not self.pending:
+            return
+        
+        batch = self.pending[:self.max_batch_size]
+        self.pending = self.pending[self.max_batch_size:]
+        if self.pending:
+            # Leftovers start a new window
+            self.flush_timer = asyncio.get_running_loop().call_later(self.max_wait, self.flush)
+        
+        now = time.perf_counter()
+        self.queue_waits.extend(now - enqueued for _, _, enqueued in batch)
+        self.batch_sizes[len(batch)] += 1
+        
+        task = asyncio.ensure_future(self.send_batch(batch))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+    
+    async def send_batch(self, batch):
+        """Call predict_fn and hand each caller its own result"""
+        try:
+            predictions = await self.predict_fn([instance for instance, _, _ in batch])
+        except Exception as e:
+            if getattr(e, "status", None) == 400 and len(batch) > 1:
+                # One bad image rejects the whole call, don't fail its neighbours
+                await asyncio.gather(*(self.send_batch([item]) for item in batch))
+                return
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future, _), prediction in zip(batch, predictions):
+            if not future.done():
+                future.set_result(prediction)
+    
+    async def drain(self):
+        """Flush pending requests and wait for in-flight batches"""
+        while self.pending:
+            self.flush()
+        if self.in_flight:
+            await asyncio.gather(*self.in_flight, return_exceptions=True)
+    
+    def metrics(self):
+        """Batch fill rate and added queueing latency"""
+        batches = sum(self.batch_sizes.values())
+        instances = sum(size * count for size, count in self.batch_sizes.items())
+        waits_ms = [wait * 1000 for wait in self.queue_waits]
+        
+        return {
+            "batches": batches,
+            "instances": instances,
+            "mean_batch_size": round(instances / batches, 2) if batches else 0,
+            "fill_rate": round(instances / (batches * self.max_batch_size), 3) if batches else 0,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            "added_latency_ms": {
+                "mean": round(sum(waits_ms) / len(waits_ms), 2) if waits_ms else 0,
+                "p50": round(percentile(waits_ms, 0.50), 2),
+                "p95": round(percentile(waits_ms, 0.95), 2),
+                "max": round(max(waits_ms), 2) if waits_ms else 0
+            }
+        }
\ No newline at end of file
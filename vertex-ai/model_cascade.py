@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Confidence-Gated Model Cascade
+Sends every image to the low-latency model and escalates only images whose
+elephant confidence is ambiguous to the high-accuracy model
+"""
+
+import time
+import argparse
+import asyncio
+import collections
+from micro_batcher import percentile
+from vertex_client import (
+    DEFAULT_CONCURRENCY,
+    ENDPOINT_CONFIG_FILE,
+    ONLINE_NODE_HOUR_COST,
+    AccessTokenProvider,
+    EndpointClient,
+    PredictionError,
+    elephant_confidence,
+    load_endpoint_config
+)
+import instrumentation
+
+# Configuration
+ESCALATION_BAND = (0.3, 0.9)  # Elephant confidences the fast model is unsure about
+LATENCY_SAMPLES = 1000  # Recent call latencies kept per stage
+CASCADE_ROLES = ("fast", "accurate")
+REHEARSAL_CALLS = 300
+REHEARSAL_CONCURRENCY = 8
+
+class ModelCascade:
+    """
+    Client chaining a fast and an accurate model
+    Has the same interface as EndpointClient. Every instance goes to the fast
+    model; instances with an elephant confidence inside the band, low <= c < high,
+    go on to the accurate model in one call and its answer replaces the fast one.
+    If the accurate call fails, the fast predictions are returned.
+    """
+    
+    def __init__(self, fast_client, accurate_client, band=ESCALATION_BAND):
+        self.fast_client = fast_client
+        self.accurate_client = accurate_client
+        self.band = tuple(band)
+        self.token_provider = fast_client.token_provider or accurate_client.token_provider
+        self.latencies = {stage: collections.deque(maxlen=LATENCY_SAMPLES) for stage in ("cascade", *CASCADE_ROLES)}
+        self.busy_seconds = {stage: 0.0 for stage in CASCADE_ROLES}
+        self.baseline_latencies = None  # Accurate-only calls on the same batches, when measured
+        self.cascade_stats = {
+            "requests": 0, "images": 0, "escalated": 0, "escalated_calls": 0, "escalation_errors": 0, "errors": 0
+        }
+    
+    @property
+    def endpoint_uri(self):
+        return f"{self.fast_client.endpoint_uri} -> {self.accurate_client.endpoint_uri}"
+    
+    @property
+    def stats(self):
+        """Escalation counters and the latency and cost compared with always using the accurate model"""
+        stats = dict(self.cascade_stats)
+        stats["instances"] = stats["images"]
+        stats["retries"] = self.fast_client.stats["retries"] + self.accurate_client.stats["retries"]
+        stats["band"] = list(self.band)
+        stats["escalation_rate"] = round(stats["escalated"] / stats["images"], 4) if stats["images"] else 0.0
+        stats["call_escalation_rate"] = (
+            round(stats["escalated_calls"] / stats["requests"], 4) if stats["requests"] else 0.0
+        )
+        stats["latency_ms"] = {
+            stage: {
+                "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+                "p50": round(percentile(list(latencies), 0.50) * 1000, 2),
+                "p95": round(percentile(list(latencies), 0.95) * 1000, 2)
+            }
+            for stage, latencies in self.latencies.items()
+        }
+        stats["savings"] = self.savings()
+        return stats
+    
+    def savings(self):
+        """
+        Latency and node cost saved against sending every call to the accurate model
+        Compared per call, since an accurate-only client would send each whole batch
+        in one call. The measured baseline is used when there is one, otherwise the
+        escalated calls stand in for it (exact at batch size 1, an underestimate
+        of the accurate-only cost for larger batches).
+        """
+        cascade = self.latencies["cascade"]
+        accurate = self.baseline_latencies or self.latencies["accurate"]
+        calls = self.cascade_stats["requests"] - self.cascade_stats["errors"]
+        if not cascade or not accurate or not calls:
+            return None
+        
+        # Both models bill the same deployed node hour, so cost follows node-busy seconds
+        accurate_seconds_per_call = sum(accurate) / len(accurate)
+        fast_seconds_per_call = self.busy_seconds["fast"] / calls
+        cost_per_image = ONLINE_NODE_HOUR_COST / 3600 / self.cascade_stats["images"] * 1000
+        cascade_cost = sum(self.busy_seconds.values()) * cost_per_image
+        accurate_cost = accurate_seconds_per_call * calls * cost_per_image
+        
+        cascade_mean = sum(cascade) / len(cascade)
+        return {
+            "baseline": "measured" if self.baseline_latencies else "escalated calls",
+            "mean_latency_ms": round(cascade_mean * 1000, 2),
+            "accurate_only_mean_latency_ms": round(accurate_seconds_per_call * 1000, 2),
+            "latency_saved_ms": round((accurate_seconds_per_call - cascade_mean) * 1000, 2),
+            "cost_per_1000_usd": round(cascade_cost, 4),
+            "accurate_only_cost_per_1000_usd": round(accurate_cost, 4),
+            "cost_saved_fraction": round(1 - cascade_cost / accurate_cost, 4) if accurate_cost else None,
+            # Above this share of escalating calls the cascade costs more than the accurate model alone
+            "break_even_escalation_rate": round(1 - fast_seconds_per_call / accurate_seconds_per_call, 4)
+        }
+    
+    async def __aenter__(self):
+        await self.open()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+    
+    async def open(self):
+        """Open both model clients"""
+        await self.fast_client.open()
+        await self.accurate_client.open()
+    
+    async def close(self):
+        """Close both model clients"""
+        await self.fast_client.close()
+        await self.accurate_client.close()
+    
+    def ambiguous(self, prediction):
+        """Whether the fast model's elephant confidence falls inside the escalation band"""
+        low, high = self.band
+        return low <= elephant_confidence(prediction) < high
+    
+    async def call(self, stage, client, instances):
+        """One predict call to one stage, timed"""
+        start_time = time.perf_counter()
+        predictions = await client.predict(instances)
+        latency = time.perf_counter() - start_time
+        self.latencies[stage].append(latency)
+        self.busy_seconds[stage] += latency
+        return predictions
+    
+    async def predict(self, instances):
+        """Send one predict call through the cascade and return one prediction per instance"""
+        self.cascade_stats["requests"] += 1
+        start_time = time.perf_counter()
+        try:
+            predictions = await self.call("fast", self.fast_client, instances)
+        except PredictionError:
+            self.cascade_stats["errors"] += 1
+            raise
+        
+        predictions = [dict(prediction, cascadeStage="fast") for prediction in predictions]
+        escalate = [i for i, prediction in enumerate(predictions) if self.ambiguous(prediction)]
+        if escalate:
+            self.cascade_stats["escalated"] += len(escalate)
+            self.cascade_stats["escalated_calls"] += 1
+            instrumentation.count("cascade_escalations", len(escalate))
+            try:
+                accurate = await self.call("accurate", self.accurate_client, [instances[i] for i in escalate])
+                for i, prediction in zip(escalate, accurate):
+                    predictions[i] = dict(prediction, cascadeStage="accurate")
+            except PredictionError as e:
+                self.cascade_stats["escalation_errors"] += 1
+                print(f"⚠️ Escalation failed, answering with the fast model: {e}")
+        
+        self.cascade_stats["images"] += len(instances)
+        self.latencies["cascade"].append(time.perf_counter() - start_time)
+        return predictions
+
+def create_cascade_client(config_file=ENDPOINT_CONFIG_FILE, band=ESCALATION_BAND, fast_uri=None, accurate_uri=None,
+                          concurrency=DEFAULT_CONCURRENCY, **kwargs):
+    """
+    Cascade over the "cascade" endpoints saved by deploy_model.py --cascade-role
+    (or the given URIs), with one shared token for https:// endpoints
+    """
+    uris = {"fast": fast_uri, "accurate": accurate_uri}
+    if None in uris.values():
+        config = load_endpoint_config(config_file) or {}
+        roles = config.get("cascade", {})
+        for role in CASCADE_ROLES:
+            if uris[role] is None:
+                if role not in roles:
+                    raise PredictionError(
+                        f"No {role} model in {config_file}, deploy one with --cascade-role {role}"
+                    )
+                uris[role] = roles[role]["endpoint_uri"]
+    
+    token_provider = None
+    if any(uri.startswith("https://") for uri in uris.values()):
+        token_provider = AccessTokenProvider()
+    clients = {
+        role: EndpointClient(uri, token_provider=token_provider if uri.startswith("https://") else None,
+                             concurrency=concurrency, **kwargs)
+        for role, uri in uris.items()
+    }
+    return ModelCascade(clients["fast"], clients["accurate"], band=band)
+
+async def rehearse_cascade(samples, band=ESCALATION_BAND, calls=REHEARSAL_CALLS, concurrency=REHEARSAL_CONCURRENCY,
+                           fast_latency_ms=20.0, accurate_latency_ms=80.0, batch_size=1):
+    """
+    Run the cascade against two local stub models, returns its stats
+    The same calls are then sent to the accurate model alone as the savings baseline.
+    """
+    from benchmark import run_closed_loop
+    from stub_endpoint import start_stub_server
+    
+    # Two labels spread the stub confidences over the whole range, like a real binary classifier
+    labels = ["elephant", "no_elephant"]
+    fast_runner, fast_uri = await start_stub_server(
+        port=0, latency_ms=fast_latency_ms, jitter_ms=fast_latency_ms / 10, labels=labels
+    )
+    accurate_runner, accurate_uri = await start_stub_server(
+        port=0, latency_ms=accurate_latency_ms, jitter_ms=accurate_latency_ms / 10, labels=labels,
+        deployed_models={"accurate": {"disagreement": 0.3}}
+    )
+    try:
+        async with create_cascade_client(band=band, fast_uri=fast_uri, accurate_uri=accurate_uri,
+                                         concurrency=concurrency) as cascade:
+            with instrumentation.span("cascade_rehearsal", calls=calls):
+                await run_closed_loop(cascade, samples, concurrency, 300, max_requests=calls, batch_size=batch_size)
+            with instrumentation.span("accurate_baseline", calls=calls):
+                records = await run_closed_loop(cascade.accurate_client, samples, concurrency, 300,
+                                                max_requests=calls, batch_size=batch_size)
+            cascade.baseline_latencies = [latency for _, latency, error in records if error is None]
+            return cascade.stats
+    finally:
+        await fast_runner.cleanup()
+        await accurate_runner.cleanup()
+
+def print_stats(stats):
+    """Print the escalation and savings summary"""
+    print(f"  Images: {stats['images']}  escalated: {stats['escalated']} ({stats['escalation_rate']:.1%})"
+          f"  escalation errors: {stats['escalation_errors']}")
+    for stage in ("cascade", *CASCADE_ROLES):
+        latency = stats["latency_ms"][stage]
+        print(f"  {stage:>9} latency: mean {latency['mean']}ms  p50 {latency['p50']}ms  p95 {latency['p95']}ms")
+    
+    savings = stats["savings"]
+    if savings is None:
+        print("  No escalations yet, savings against the accurate model cannot be estimated")
+        return
+    print(f"  Latency saved: {savings['latency_saved_ms']}ms per call "
+          f"({savings['mean_latency_ms']}ms vs {savings['accurate_only_mean_latency_ms']}ms accurate only)")
+    print(f"  Node cost per 1000 images: ${savings['cost_per_1000_usd']} "
+          f"vs ${savings['accurate_only_cost_per_1000_usd']} accurate only "
+          f"({savings['cost_saved_fraction']:.1%} saved)")
+    print(f"  Break-even escalation rate: {savings['break_even_escalation_rate']:.1%} of calls "
+          f"(now {stats['call_escalation_rate']:.1%}, baseline: {savings['baseline']})")
+
+def main():
+    parser = argparse.ArgumentParser(description='Rehearse the fast/accurate model cascade against local stubs')
+    parser.add_argument('--input', required=True,
+                       help='Image directory or JSONL file of representative requests (e.g. requests.jsonl)')
+    parser.add_argument('--band', type=float, nargs=2, default=list(ESCALATION_BAND), metavar=('LOW', 'HIGH'),
+                       help='Escalate elephant confidences with LOW <= confidence < HIGH')
+    parser.add_argument('--calls', type=int, default=REHEARSAL_CALLS, help='Predict calls to send')
+    parser.add_argument('--concurrency', type=int, default=REHEARSAL_CONCURRENCY, help='Calls in flight')
+    parser.add_argument('--batch-size', type=int, default=1, help='Images per predict call')
+    parser.add_argument('--fast-latency-ms', type=float, default=20.0, help='Stub service time of the fast model')
+    parser.add_argument('--accurate-latency-ms', type=float, default=80.0,
+                       help='Stub service time of the accurate model')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "model_cascade")
+    
+    print("=" * 60)
+    print("🐘 ELEPHANT DETECTION - MODEL CASCADE REHEARSAL")
+    print("=" * 60)
+    
+    from benchmark import load_samples
+    samples = load_samples(args.input)
+    if not samples:
+        print("❌ No sample images found")
+        return
+    
+    print(f"\n🪜 Escalating elephant confidences in [{args.band[0]}, {args.band[1]}) to the accurate model")
+    stats = asyncio.run(rehearse_cascade(
+        samples,
+        band=args.band,
+        calls=args.calls,
+        concurrency=args.concurrency,
+        fast_latency_ms=args.fast_latency_ms,
+        accurate_latency_ms=args.accurate_latency_ms,
+        batch_size=args.batch_size
+    ))
+    
+    print("\n" + "=" * 60)
+    print("📊 CASCADE RESULTS")
+    print("=" * 60)
+    print_stats(stats)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Offline Model Evaluation and Threshold Tuning
+Streams labelled prediction logs (JSONL) into score histograms and computes
+PR/ROC curves, confusion matrices and the best thresholds for each model
+"""
+
+import os
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import instrumentation
+
+# Configuration
+SCORE_BINS = 10000  # Threshold resolution of the curves
+CHUNK_ROWS = 100000  # Rows parsed before they are folded into the histograms
+EVALUATION_WORKERS = os.cpu_count() or 1
+SPLITS_PER_WORKER = 4  # File pieces per worker, so workers finish together
+VOCABULARY_ROWS = 1000  # Rows read up front to learn the model's labels
+TARGET_PRECISION = 0.95
+REFERENCE_THRESHOLD = 0.5
+CURVE_POINTS = 101  # Thresholds per curve in the saved report
+REPORT_FILE = "evaluation_report.json"
+
+def is_elephant_label(label):
+    """Whether a label counts as an elephant (everything except no_elephant)"""
+    return "elephant" in label.lower() and not label.lower().startswith("no")
+
+def row_prediction(row):
+    """The prediction of a log row from batch_predict.py, batch_jobs.py or a raw batch output line"""
+    return row.get("prediction", row)
+
+def row_label(row):
+    """
+    Ground-truth label of a log row
+    From "label", an import-file annotation, or the parent folder of the image
+    (the dataset layout is <label>/<image>).
+    """
+    if "label" in row:
+        return row["label"]
+    if "classificationAnnotation" in row:
+        return row["classificationAnnotation"].get("displayName")
+    image_id = row.get("id") or row.get("imageGcsUri") or row.get("instance", {}).get("content", "")
+    parts = image_id.split("/")
+    return parts[-2] if len(parts) > 1 else None
+
+def row_id(row):
+    """Image identifier of a log row"""
+    return row.get("id") or row.get("imageGcsUri") or row.get("instance", {}).get("content", "")
+
+def read_vocabulary(path, rows=VOCABULARY_ROWS):
+    """Labels the model predicts, from the first rows of its log (count_log adds any found later)"""
+    labels = set()
+    with open(path, "rb") as f:
+        for line_number, line in enumerate(f):
+            if line_number >= rows:
+                break
+            try:
+                row = json.loads(line) if line.strip() else None
+            except ValueError:
+                continue
+            if isinstance(row, dict):
+                labels.update(row_prediction(row).get("displayNames", []))
+    return sorted(labels)
+
+def file_splits(path, splits):
+    """Byte ranges splitting a file into roughly equal pieces"""
+    size = os.path.getsize(path)
+    bounds = [size * i // splits for i in range(splits + 1)]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def iter_split_lines(path, start, end):
+    """Lines of a file that start inside [start, end)"""
+    with open(path, "rb") as f:
+        if start:
+            # The line running across the split belongs to the previous piece
+            f.seek(start - 1)
+            f.readline()
+        position = f.tell()
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
+
+class EvaluationCounts:
+    """
+    Histograms of one model's scores, split by ground truth
+    Memory depends on the number of labels and score bins, not on the number
+    of rows, and counts from several workers are merged by adding them.
+    """
+    
+    def __init__(self, labels, bins=SCORE_BINS):
+        self.labels = list(labels)
+        self.bins = bins
+        size = len(self.labels)
+        self.elephant = np.array([is_elephant_label(label) for label in self.labels])
+        self.detection = np.zeros((2, bins), dtype=np.int64)  # [not elephant, elephant] x elephant score
+        self.per_label = np.zeros((size, 2, bins), dtype=np.int64)  # label x [other, this label] x its score
+        self.confusion = np.zeros((size, size), dtype=np.int64)  # true label x top predicted label
+        self.stats = {"rows": 0, "errors": 0, "unlabelled": 0, "unknown_labels": 0}
+        self.fingerprint = 0  # Order-independent hash of the image ids, to compare models on the same data
+        self.new_labels = set()  # Predicted labels missing from self.labels
+    
+    def score_bins(self, scores):
+        """Histogram bin of each score"""
+        return np.clip((scores * self.bins).astype(np.int64), 0, self.bins - 1)
+    
+    def add(self, truth, scores):
+        """Fold a chunk of rows into the histograms (truth: label index per row, scores: rows x labels)"""
+        size = len(self.labels)
+        positive = self.elephant[truth].astype(np.int64)
+        elephant_bins = self.score_bins(scores[:, self.elephant].sum(axis=1))
+        self.detection += np.bincount(
+            positive * self.bins + elephant_bins, minlength=2 * self.bins
+        ).reshape(2, self.bins)
+        
+        is_label = (truth[:, None] == np.arange(size)).astype(np.int64)
+        index = np.arange(size) * 2 * self.bins + is_label * self.bins + self.score_bins(scores)
+        self.per_label += np.bincount(index.ravel(), minlength=size * 2 * self.bins).reshape(size, 2, self.bins)
+        
+        top = scores.argmax(axis=1)
+        self.confusion += np.bincount(truth * size + top, minlength=size * size).reshape(size, size)
+        self.stats["rows"] += len(truth)
+    
+    def merge(self, other):
+        """Add the counts of another worker"""
+        self.detection += other.detection
+        self.per_label += other.per_label
+        self.confusion += other.confusion
+        for key, value in other.stats.items():
+            self.stats[key] += value
+        self.new_labels |= other.new_labels
+        self.fingerprint = (self.fingerprint + other.fingerprint) % 2 ** 64
+        return self
+
+def count_split(path, start, end, labels, bins=SCORE_BINS, chunk_rows=CHUNK_ROWS):
+    """
+    Parse one piece of a log into EvaluationCounts, chunk_rows rows at a time
+    The per-row loop only collects plain lists; scores are scattered into an
+    array once per chunk.
+    """
+    counts = EvaluationCounts(labels, bins)
+    index = {label: i for i, label in enumerate(labels)}
+    decoder = json.JSONDecoder()
+    truth, lengths, columns, confidences = [], [], [], []
+    
+    def flush():
+        owners = np.repeat(np.arange(len(lengths)), lengths)
+        scores = np.zeros((len(lengths), len(labels)), dtype=np.float32)
+        scores[owners, columns] = confidences
+        counts.add(np.array(truth, dtype=np.int64), scores)
+        for values in (truth, lengths, columns, confidences):
+            values.clear()
+    
+    for line in iter_split_lines(path, start, end):
+        try:
+            line = line.decode().strip()
+            if not line:
+                continue
+            row = decoder.raw_decode(line)[0]
+        except ValueError:
+            # Truncated or corrupt lines, e.g. the last line of a log still being written
+            counts.stats["errors"] += 1
+            continue
+        if not isinstance(row, dict):
+            counts.stats["errors"] += 1
+            continue
+        prediction = row_prediction(row)
+        if "error" in row or "confidences" not in prediction:
+            counts.stats["errors"] += 1
+            continue
+        try:
+            row_columns = [index[name] for name in prediction["displayNames"]]
+        except KeyError:
+            counts.stats["unknown_labels"] += 1
+            counts.new_labels.update(name for name in prediction["displayNames"] if name not in index)
+            continue
+        label = index.get(row_label(row))
+        if label is None:
+            counts.stats["unlabelled"] += 1
+            continue
+        
+        truth.append(label)
+        lengths.append(len(row_columns))
+        columns.extend(row_columns)
+        confidences.extend(prediction["confidences"])
+        digest = hashlib.blake2b(row_id(row).encode(), digest_size=8).digest()
+        counts.fingerprint = (counts.fingerprint + int.from_bytes(digest, "little")) % 2 ** 64
+        
+        if len(truth) == chunk_rows:
+            flush()
+    
+    if truth:
+        flush()
+    return counts
+
+def count_log(path, labels=None, workers=EVALUATION_WORKERS, bins=SCORE_BINS):
+    """
+    Count a whole log, learning the labels from it unless they are given
+    Labels the first rows did not show are learned while counting; the log is
+    then counted again with the full label set, so no row is lost to them.
+    """
+    if labels:
+        return count_log_with_labels(path, labels, workers, bins)
+    
+    labels = read_vocabulary(path)
+    while True:
+        counts = count_log_with_labels(path, labels, workers, bins)
+        if not counts.new_labels:
+            return counts
+        print(f"  Found labels after the first {VOCABULARY_ROWS} rows ({', '.join(sorted(counts.new_labels))}), "
+              f"counting {path} again")
+        labels = sorted(set(labels) | counts.new_labels)
+
+def count_log_with_labels(path, labels, workers=EVALUATION_WORKERS, bins=SCORE_BINS):
+    """Count a whole log on a process pool, one file piece per task"""
+    splits = file_splits(path, workers * SPLITS_PER_WORKER)
+    counts = EvaluationCounts(labels, bins)
+    if workers <= 1:
+        for start, end in splits:
+            counts.merge(count_split(path, start, end, labels, bins))
+        return counts
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(count_split, path, start, end, labels, bins) for start, end in splits]
+        for future in futures:
+            counts.merge(future.result())
+    return counts
+
+def threshold_curve(negatives, positives):
+    """
+    Counts and rates at every bin threshold (predict positive when score >= threshold)
+    Cumulative sums from the top bin give every threshold in one pass.
+    """
+    true_positives = np.cumsum(positives[::-1])[::-1]
+    false_positives = np.cumsum(negatives[::-1])[::-1]
+    total_positives = positives.sum()
+    total_negatives = negatives.sum()
+    predicted = true_positives + false_positives
+    
+    precision = np.divide(true_positives, predicted, out=np.ones(len(predicted)), where=predicted > 0)
+    recall = true_positives / total_positives if total_positives else np.zeros(len(predicted))
+    false_positive_rate = false_positives / total_negatives if total_negatives else np.zeros(len(predicted))
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(len(predicted)),
+                   where=precision + recall > 0)
+    return {
+        "thresholds": np.arange(len(predicted)) / len(predicted),
+        "true_positives": true_positives,
+        "false_positives": false_positives,
+        "positives": int(total_positives),
+        "negatives": int(total_negatives),
+        "precision": precision,
+        "recall": recall,
+        "false_positive_rate": false_positive_rate,
+        "f1": f1
+    }
+
+def area_under_roc(curve):
+    """Trapezoid area under the ROC curve"""
+    x = np.concatenate([[0.0], curve["false_positive_rate"][::-1]])
+    y = np.concatenate([[0.0], curve["recall"][::-1]])
+    return float(np.sum(np.diff(x) * (y[1:] + y[:-1]) / 2))
+
+def average_precision(curve):
+    """Area under the precision-recall curve as average precision"""
+    recall = np.concatenate([curve["recall"], [0.0]])
+    return float(np.sum((recall[:-1] - recall[1:]) * curve["precision"]))
+
+def operating_point(curve, i):
+    """Metrics at the i-th threshold of a curve"""
+    return {
+        "threshold": round(float(curve["thresholds"][i]), 4),
+        "precision": round(float(curve["precision"][i]), 4),
+        "recall": round(float(curve["recall"][i]), 4),
+        "f1": round(float(curve["f1"][i]), 4),
+        "false_positive_rate": round(float(curve["false_positive_rate"][i]), 4),
+        "true_positives": int(curve["true_positives"][i]),
+        "false_positives": int(curve["false_positives"][i])
+    }
+
+def curve_summary(curve, target_precision=TARGET_PRECISION, reference_threshold=REFERENCE_THRESHOLD):
+    """Areas, the best-F1 threshold and the threshold with the most recall at the target precision"""
+    bins = len(curve["thresholds"])
+    meets_target = np.flatnonzero((curve["precision"] >= target_precision) & (curve["recall"] > 0))
+    step = max(1, (bins - 1) // (CURVE_POINTS - 1))
+    points = np.arange(0, bins, step)
+    return {
+        "positives": curve["positives"],
+        "negatives": curve["negatives"],
+        "au_prc": round(average_precision(curve), 4),
+        "au_roc": round(area_under_roc(curve), 4),
+        "best_f1": operating_point(curve, int(np.argmax(curve["f1"]))),
+        # Recall only falls as the threshold rises, so the lowest qualifying threshold has the most
+        "at_target_precision": operating_point(curve, int(meets_target[0])) if len(meets_target) else None,
+        "at_reference_threshold": operating_point(curve, min(int(reference_threshold * bins), bins - 1)),
+        "curve": {
+            key: [round(float(value), 4) for value in curve[key][points]]
+            for key in ("thresholds", "precision", "recall", "false_positive_rate")
+        }
+    }
+
+def evaluate_counts(counts, target_precision=TARGET_PRECISION):
+    """Detection and per-label metrics from merged counts"""
+    confusion = counts.confusion
+    correct = np.diag(confusion)
+    actual = confusion.sum(axis=1)
+    predicted = confusion.sum(axis=0)
+    
+    per_label = {}
+    for i, label in enumerate(counts.labels):
+        precision = correct[i] / predicted[i] if predicted[i] else 0.0
+        recall = correct[i] / actual[i] if actual[i] else 0.0
+        curve = threshold_curve(counts.per_label[i, 0], counts.per_label[i, 1])
+        summary = curve_summary(curve, target_precision)
+        per_label[label] = {
+            "images": int(actual[i]),
+            "top_label_precision": round(float(precision), 4),
+            "top_label_recall": round(float(recall), 4),
+            "au_prc": summary["au_prc"],
+            "best_f1": summary["best_f1"]
+        }
+    
+    return {
+        "labels": counts.labels,
+        **counts.stats,
+        "fingerprint": f"{counts.fingerprint:016x}",
+        "top_label_accuracy": round(float(correct.sum() / confusion.sum()), 4) if confusion.sum() else None,
+        "confusion_matrix": confusion.tolist(),
+        "per_label": per_label,
+        "detection": curve_summary(threshold_curve(counts.detection[0], counts.detection[1]), target_precision)
+    }
+
+def print_evaluation(name, report, target_precision=TARGET_PRECISION):
+    """Print one model's detection metrics and confusion matrix"""
+    detection = report["detection"]
+    print(f"\n📊 {name}: {report['rows']} images "
+          f"({report['errors']} errors, {report['unlabelled']} unlabelled, {report['unknown_labels']} unknown labels)")
+    print(f"  Top-label accuracy: {report['top_label_accuracy']}")
+    print(f"  Elephant detection: AU-PRC {detection['au_prc']}  AU-ROC {detection['au_roc']}")
+    best = detection["best_f1"]
+    print(f"  Best F1 {best['f1']} at threshold {best['threshold']} "
+          f"(precision {best['precision']}, recall {best['recall']})")
+    target = detection["at_target_precision"]
+    if target:
+        print(f"  Precision >= {target_precision}: threshold {target['threshold']}, recall {target['recall']}")
+    else:
+        print(f"  ⚠️ No threshold reaches precision {target_precision}")
+    
+    width = max(len(label) for label in report["labels"])
+    print(f"\n  Confusion matrix (rows: true label, columns: top predicted label)")
+    print("  " + " " * width + "".join(f"{label[:12]:>14}" for label in report["labels"]))
+    for label, row in zip(report["labels"], report["confusion_matrix"]):
+        print(f"  {label:>{width}}" + "".join(f"{count:>14}" for count in row))
+
+def print_comparison(reports):
+    """Print the models side by side and warn when they were not scored on the same images"""
+    print("\n" + "=" * 60)
+    print("📊 MODEL COMPARISON")
+    print("=" * 60)
+    print(f"  {'Model':<24}{'AU-PRC':>8}{'AU-ROC':>8}{'Best F1':>9}{'@ thr':>8}{'Accuracy':>10}")
+    for name, report in reports.items():
+        best = report["detection"]["best_f1"]
+        print(f"  {name[:23]:<24}{report['detection']['au_prc']:>8}{report['detection']['au_roc']:>8}"
+              f"{best['f1']:>9}{best['threshold']:>8}{report['top_label_accuracy']:>10}")
+    
+    if len({(report["rows"], report["fingerprint"]) for report in reports.values()}) > 1:
+        print("  ⚠️ The logs cover different images, the comparison is not like for like")
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate models and tune thresholds on labelled prediction logs')
+    parser.add_argument('--log', required=True, nargs='+',
+                       help='Prediction JSONL per model (batch_predict.py output of labelled images)')
+    parser.add_argument('--names', nargs='+', help='Model names, in --log order (default: file names)')
+    parser.add_argument('--target-precision', type=float, default=TARGET_PRECISION,
+                       help='Report the threshold with the most recall at this precision')
+    parser.add_argument('--bins', type=int, default=SCORE_BINS, help='Threshold resolution')
+    parser.add_argument('--workers', type=int, default=EVALUATION_WORKERS, help='Parsing processes')
+    parser.add_argument('--output', default=REPORT_FILE, help='JSON report with curves and matrices')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "model_evaluation")
+    
+    if args.names and len(args.names) != len(args.log):
+        parser.error("--names needs one name per --log")
+    
+    print("=" * 60)
+    print("🐘 ELEPHANT DETECTION - OFFLINE EVALUATION")
+    print("=" * 60)
+    
+    names = args.names or [os.path.splitext(os.path.basename(path))[0] for path in args.log]
+    reports = {}
+    for name, path in zip(names, args.log):
+        with instrumentation.span("evaluate_log", model=name) as attributes:
+            counts = count_log(path, workers=args.workers, bins=args.bins)
+            attributes.update(rows=counts.stats["rows"])
+        if not counts.stats["rows"]:
+            print(f"\n❌ {name}: no labelled rows with predictions in {path} ({counts.stats['errors']} errors, "
+                  f"{counts.stats['unlabelled']} unlabelled)")
+            continue
+        reports[name] = evaluate_counts(counts, args.target_precision)
+        print_evaluation(name, reports[name], args.target_precision)
+    
+    if not reports:
+        print("\n❌ Nothing to evaluate")
+        return
+    if len(reports) > 1:
+        print_comparison(reports)
+    
+    with open(args.output, "w") as f:
+        json.dump({"target_precision": args.target_precision, "models": reports}, f, indent=2)
+    print(f"\n✓ Evaluation report saved to: {args.output}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
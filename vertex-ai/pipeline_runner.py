@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Elephant Detection Pipeline Runner
+Runs import -> train -> deploy as one resumable run with per-stage timings
+"""
+
+import os
+import json
+import shlex
+import argparse
+import asyncio
+from datetime import datetime
+from cloud_context import aiplatform
+import dataset_import
+import deploy_model
+import train_model
+from vertex_client import backoff_delay
+import instrumentation
+
+# Configuration
+PROJECT_ID = "pelagic-magpie-469618-k8"
+LOCATION = "us-central1"
+CHECKPOINT_FILE = "pipeline_checkpoint.json"
+POLL_BASE_SECONDS = 15
+POLL_MAX_SECONDS = 300  # Training runs for hours, no need to poll faster than this
+DEPLOY_RESUME_WAIT_SECONDS = 30 * 60  # How long a resumed deploy waits for an in-flight deployment
+SUCCEEDED_STATES = ("PIPELINE_STATE_SUCCEEDED",)
+FAILED_STATES = ("PIPELINE_STATE_FAILED", "PIPELINE_STATE_CANCELLED")
+
+class PipelineError(Exception):
+    """Raised when a stage fails"""
+
+class Checkpoint:
+    """
+    Pipeline state saved to a JSON file after every stage transition
+    Each stage records its status (submitted, done, failed), the resources it
+    created and its start and finish times, so a new run can pick up where an
+    interrupted one stopped.
+    """
+    
+    def __init__(self, path, config):
+        self.path = path
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.state = json.load(f)
+            self.resumed = True
+        else:
+            self.state = {"created_time": datetime.now().isoformat(), "config": config, "stages": {}}
+            self.resumed = False
+    
+    @property
+    def config(self):
+        return self.state["config"]
+    
+    def stage(self, name):
+        return self.state["stages"].get(name, {})
+    
+    def update(self, name, **fields):
+        """Merge fields into a stage and save atomically"""
+        stage = self.state["stages"].setdefault(name, {})
+        stage.update(fields)
+        
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(temp_path, self.path)
+    
+    def start(self, name, **fields):
+        """Mark a stage as submitted, keeping the original start time on resume"""
+        started = self.stage(name).get("started_time") or datetime.now().isoformat()
+        self.update(name, status="submitted", started_time=started, **fields)
+    
+    def finish(self, name, **fields):
+        """Mark a stage as done and record its wall-clock time"""
+        finished = datetime.now()
+        started = datetime.fromisoformat(self.stage(name)["started_time"])
+        self.update(
+            name,
+            status="done",
+            finished_time=finished.isoformat(),
+            wall_seconds=round((finished - started).total_seconds(), 1),
+            **fields
+        )
+    
+    def fail(self, name, error):
+        self.update(name, status="failed", error=str(error))
+
+async def poll_until(check, description):
+    """Call a blocking check in a thread with backoff until it returns a result"""
+    attempt = 0
+    while True:
+        result = await asyncio.to_thread(check)
+        if result is not None:
+            return result
+        
+        delay = max(POLL_BASE_SECONDS, backoff_delay(attempt, base=POLL_BASE_SECONDS, cap=POLL_MAX_SECONDS))
+        print(f"  ⏳ {description}: checking again in {delay:.0f}s")
+        await asyncio.sleep(delay)
+        attempt += 1
+
+async def run_import_stage(checkpoint):
+    """Submit the dataset import (or reattach to it) and wait for it, or reuse the one from the checkpoint"""
+    stage = checkpoint.stage("import")
+    if stage.get("status") == "done":
+        print(f"✓ import: already done (dataset {stage['dataset_id']})")
+        return aiplatform.ImageDataset(dataset_name=stage["dataset_id"])
+    
+    config = checkpoint.config
+    import_args = dataset_import.build_arg_parser().parse_args(
+        shlex.split(config["import_args"]) + ["--project-id", config["project_id"], "--location", config["location"]]
+    )
+    
+    if stage.get("status") == "submitted" and stage.get("operation_name"):
+        print(f"🔄 import: reattaching to {stage['operation_name']}")
+        dataset = aiplatform.ImageDataset(dataset_name=stage["dataset_id"])
+        operation_name = stage["operation_name"]
+    else:
+        checkpoint.start("import")
+        dataset, operation_name = await asyncio.to_thread(dataset_import.prepare_dataset, import_args, False)
+        if dataset is None:
+            checkpoint.fail("import", "No images found")
+            raise PipelineError("import: no images found")
+        checkpoint.start("import", dataset_id=dataset.name, operation_name=operation_name)
+    
+    def check_import():
+        operation = dataset.api_client.get_operation({"name": operation_name})
+        if not operation.done:
+            return None
+        if operation.error.code:
+            raise PipelineError(f"import: {operation.error.message}")
+        return dataset
+    
+    if operation_name is not None:
+        try:
+            await poll_until(check_import, "import")
+        except PipelineError as e:
+            checkpoint.fail("import", e)
+            raise
+        await asyncio.to_thread(dataset_import.finish_import, import_args)
+    
+    dataset_import.save_dataset_info(dataset, config["project_id"], config["location"])
+    checkpoint.finish("import", dataset_id=dataset.name)
+    return dataset
+
+async def run_train_stage(checkpoint, dataset, model_type):
+    """Submit a training job (or reattach to it) and wait for the model"""
+    name = f"train:{model_type}"
+    stage = checkpoint.stage(name)
+    if stage.get("status") == "done":
+        print(f"✓ {name}: already done (model {stage['model_id']})")
+        return aiplatform.Model(model_name=stage["model_id"])
+    
+    if stage.get("status") == "submitted" and stage.get("job_resource_name"):
+        print(f"🔄 {name}: reattaching to {stage['job_resource_name']}")
+        job_resource_name = stage["job_resource_name"]
+    else:
+        checkpoint.start(name)
+        job, _ = await asyncio.to_thread(
+            train_model.start_training_job,
+            dataset, model_type, checkpoint.config["budget_hours"], False
+        )
+        job_resource_name = job.resource_name
+        checkpoint.update(name, job_resource_name=job_resource_name)
+    
+    def check_job():
+        job = aiplatform.AutoMLImageTrainingJob.get(job_resource_name)
+        state = job.state.name
+        if state in FAILED_STATES:
+            raise PipelineError(f"{name}: training job ended in {state}")
+        if state in SUCCEEDED_STATES:
+            return job.get_model()
+        return None
+    
+    try:
+        model = await poll_until(check_job, name)
+    except PipelineError as e:
+        checkpoint.fail(name, e)
+        raise
+    
+    model_info = await asyncio.to_thread(train_model.save_model_info, model, model_type)
+    checkpoint.finish(name, model_id=model_info["model_id"])
+    return model
+
+def find_deployed_model(endpoint, model):
+    """The deployment of `model` on `endpoint`, or None"""
+    for deployed_model in endpoint.list_models():
+        if deployed_model.model == model.resource_name:
+            return deployed_model
+    return None
+
+async def run_deploy_stage(checkpoint, train_task, model_type):
+    """Deploy the model as soon as its training stage finishes"""
+    stage = checkpoint.stage("deploy")
+    if stage.get("status") == "done":
+        print(f"✓ deploy: already done (endpoint {stage['endpoint_id']})")
+        return
+    
+    model = await train_task
+    config = checkpoint.config
+    endpoint = await asyncio.to_thread(deploy_model.create_or_get_endpoint, config["endpoint_name"])
+    
+    deployed = None
+    if stage.get("status") == "submitted":
+        # The deployment keeps running server-side after the runner dies
+        print(f"🔄 deploy: waiting for the deployment started by the previous run")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + DEPLOY_RESUME_WAIT_SECONDS
+        
+        def check_deployed():
+            found = find_deployed_model(endpoint, model)
+            if found is None and loop.time() > deadline:
+                return False
+            return found
+        
+        deployed = await poll_until(check_deployed, "deploy")
+        if deployed is False:
+            print(f"⚠️ deploy: previous deployment not found, deploying again")
+            deployed = None
+    
+    deployment_size = "planned" if config["capacity_plan"] else config["deployment_size"]
+    plan = deploy_model.load_capacity_plan(config["capacity_plan"]) if config["capacity_plan"] else None
+    if deployed is None:
+        checkpoint.start("deploy", endpoint_id=endpoint.name)
+        try:
+            await asyncio.to_thread(deploy_model.deploy_model_to_endpoint, model, endpoint, deployment_size, plan)
+        except Exception as e:
+            # A rejected deployment is not running server-side, so the next run must not wait for it
+            checkpoint.fail("deploy", e)
+            raise
+    
+    # Saved like deploy_model.py does: not ready until endpoint_warmup.py has warmed it up
+    model_info = deploy_model.load_model_info(model_type)
+    await asyncio.to_thread(
+        deploy_model.save_endpoint_info, endpoint, model_info, deployment_size, config["location"],
+        config=plan, ready=False
+    )
+    checkpoint.finish("deploy", endpoint_id=endpoint.name)
+    print(f"  Warm up the new endpoint with: python endpoint_warmup.py --input /path/to/requests.jsonl")
+
+async def run_in_span(name, awaitable):
+    """Await inside an instrumentation span"""
+    with instrumentation.span(name):
+        return await awaitable
+
+async def run_pipeline(checkpoint):
+    """Run all stages; training jobs run concurrently and deploy starts as soon as its model is ready"""
+    config = checkpoint.config
+    with instrumentation.span("import"):
+        dataset = await run_import_stage(checkpoint)
+    
+    train_tasks = {
+        model_type: asyncio.ensure_future(
+            run_in_span(f"train:{model_type}", run_train_stage(checkpoint, dataset, model_type))
+        )
+        for model_type in config["model_types"]
+    }
+    
+    tasks = list(train_tasks.values())
+    if config["deploy_model_type"]:
+        # Includes waiting for the model; the deploy call itself is a nested span
+        tasks.append(run_in_span("deploy", run_deploy_stage(
+            checkpoint, train_tasks[config["deploy_model_type"]], config["deploy_model_type"]
+        )))
+    
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+    for error in errors:
+        print(f"❌ {error}")
+    return not errors
+
+def print_stage_times(checkpoint):
+    """Print the status and wall-clock time of each stage"""
+    print(f"\n{'stage':<28} {'status':<10} {'wall time':>12}")
+    for name, stage in checkpoint.state["stages"].items():
+        seconds = stage.get("wall_seconds")
+        wall_time = f"{seconds / 60:.1f} min" if seconds is not None else "-"
+        print(f"{name:<28} {stage.get('status', '-'):<10} {wall_time:>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Run import, training and deployment as one resumable pipeline')
+    parser.add_argument('--project-id', default=PROJECT_ID, help='GCP Project ID')
+    parser.add_argument('--location', default=LOCATION, help='Vertex AI location')
+    parser.add_argument('--import-args', default='',
+                       help='Extra dataset_import.py options, e.g. "--streaming --dedup"')
+    parser.add_argument('--model-types', nargs='+', choices=list(train_model.TRAINING_CONFIGS),
+                       default=['efficientnet'], help='Models to train concurrently')
+    parser.add_argument('--budget-hours', type=int, default=8, help='Training budget in node hours per model')
+    parser.add_argument('--deploy-model-type', help='Model type to deploy (default: the first cloud model type)')
+    parser.add_argument('--no-deploy', action='store_true', help='Stop after training')
+    parser.add_argument('--endpoint-name', default=deploy_model.ENDPOINT_DISPLAY_NAME, help='Endpoint display name')
+    parser.add_argument('--deployment-size', choices=list(deploy_model.MACHINE_TYPES), default='small',
+                       help='Deployment configuration size')
+    parser.add_argument('--capacity-plan', help='Deploy with the config from capacity_planner.py')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE, help='Pipeline checkpoint file')
+    parser.add_argument('--restart', action='store_true', help='Discard the checkpoint and start a new run')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "pipeline_runner")
+    
+    print("=" * 60)
+    print("🐘 ELEPHANT DETECTION - PIPELINE RUNNER")
+    print("=" * 60)
+    
+    deploy_model_type = None
+    if not args.no_deploy:
+        # Edge models are exported, not deployed to an endpoint
+        cloud_types = [model_type for model_type in args.model_types if not model_type.endswith("_edge")]
+        deploy_model_type = args.deploy_model_type or (cloud_types[0] if cloud_types else None)
+        if deploy_model_type not in cloud_types:
+            print("❌ --deploy-model-type must be one of the cloud --model-types (or use --no-deploy)")
+            return
+    
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    
+    checkpoint = Checkpoint(args.checkpoint, {
+        "project_id": args.project_id,
+        "location": args.location,
+        "import_args": args.import_args,
+        "model_types": args.model_types,
+        "budget_hours": args.budget_hours,
+        "deploy_model_type": deploy_model_type,
+        "endpoint_name": args.endpoint_name,
+        "deployment_size": args.deployment_size,
+        "capacity_plan": args.capacity_plan
+    })
+    
+    if checkpoint.resumed:
+        print(f"🔄 Resuming run from {args.checkpoint} (started {checkpoint.state['created_time']})")
+        print(f"  Using the settings of that run; pass --restart to start over")
+    
+    config = checkpoint.config
+    train_model.initialize_vertex_ai(config["project_id"], config["location"])
+    
+    try:
+        succeeded = asyncio.run(run_pipeline(checkpoint))
+    except KeyboardInterrupt:
+        print(f"\n⚠️ Interrupted. Submitted jobs keep running; rerun to resume from {args.checkpoint}")
+        return
+    
+    print("\n" + "=" * 60)
+    print("✅ PIPELINE COMPLETE" if succeeded else "❌ PIPELINE FAILED")
+    print("=" * 60)
+    print_stage_times(checkpoint)
+    if not succeeded:
+        print(f"\nFix the failed stage and rerun to resume from {args.checkpoint}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed Prediction Cache
+Caches predictions by image content hash and model, in memory and on disk
+"""
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import threading
+import collections
+
+# Configuration
+CACHE_FILE = "prediction_cache.db"
+MEMORY_ENTRIES = 10000  # Predictions kept in the in-memory LRU tier
+TTL_SECONDS = 7 * 24 * 3600
+CONFIG_CHECK_SECONDS = 5  # How often endpoint_config.json is checked for a new model
+WRITE_DELAY_SECONDS = 1.0  # New predictions are written to disk together after this delay
+
+def content_key(image_bytes):
+    """Content hash of the image bytes"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+class PredictionCache:
+    """
+    Two-tier prediction cache keyed by (image content hash, model_id)
+    Concurrent requests for the same image share one in-flight prediction.
+    The disk tier is only used from worker threads: lookups run one at a time
+    there and new predictions are written to it in batches.
+    The model id is read from endpoint_config.json; when deploy_model.py writes
+    a different model, both tiers are invalidated.
+    """
+    
+    def __init__(self, config_file, cache_file=CACHE_FILE, memory_entries=MEMORY_ENTRIES,
+                 ttl_seconds=TTL_SECONDS):
+        self.config_file = config_file
+        self.memory_entries = memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.memory = collections.OrderedDict()
+        self.in_flight = {}
+        self.model_id = None
+        self.config_mtime = None
+        self.next_config_check = 0
+        self.stats = {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0,
+            "coalesced": 0, "invalidations": 0
+        }
+        
+        self.db = None
+        self.db_lock = threading.Lock()
+        self.pending_writes = []
+        self.flush_task = None
+        if cache_file:
+            self.db = sqlite3.connect(cache_file, check_same_thread=False)
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS predictions (
+                    content_hash TEXT,
+                    model_id TEXT,
+                    prediction TEXT,
+                    expires_at REAL,
+                    PRIMARY KEY (content_hash, model_id)
+                )
+            """)
+            self.db.commit()
+        
+        self.check_model()
+        self.purge_expired()
+    
+    def check_model(self):
+        """Reload the deployed model id and invalidate the cache when it changes"""
+        now = time.monotonic()
+        if now < self.next_config_check:
+            return
+        self.next_config_check = now + CONFIG_CHECK_SECONDS
+        
+        try:
+            mtime = os.path.getmtime(self.config_file)
+        except OSError:
+            return
+        if mtime == self.config_mtime:
+            return
+        self.config_mtime = mtime
+        
+        try:
+            with open(self.config_file, "r") as f:
+                model_id = json.load(f).get("model_id")
+        except (OSError, ValueError):
+            return
+        
+        if model_id != self.model_id:
+            if self.model_id is not None:
+                print(f"♻️ Deployed model changed to {model_id}, invalidating prediction cache")
+                self.stats["invalidations"] += 1
+            self.model_id = model_id
+            self.memory.clear()
+            if self.db is not None:
+                with self.db_lock:
+                    self.db.execute("DELETE FROM predictions WHERE model_id IS NOT ?", (model_id,))
+                    self.db.commit()
+    
+    async def get(self, key):
+        """Look up a cached prediction, memory tier first"""
+        now = time.time()
+        
+        entry = self.memory.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[1]
+            del self.memory[key]
+        
+        if self.db is not None:
+            row = await asyncio.to_thread(self.read_row, key, self.model_id)
+            if row is not None and row[1] > now:
+                prediction = json.loads(row[0])
+                self.remember(key, prediction, row[1])
+                self.stats["disk_hits"] += 1
+                return prediction
+        
+        return None
+    
+    def read_row(self, key, model_id):
+        """Read one disk tier row, (prediction JSON, expires_at) or None"""
+        with self.db_lock:
+            if self.db is None:
+                return None
+            return self.db.execute(
+                "SELECT prediction, expires_at FROM predictions WHERE content_hash = ? AND model_id IS ?",
+                (key, model_id)
+            ).fetchone()
+    
+    def remember(self, key, prediction, expires_at):
+        """Store in the memory tier, evicting the least recently used entry"""
+        self.memory[key] = (expires_at, prediction)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+    
+    def put(self, key, prediction):
+        """Store a prediction in memory and queue it for the disk tier"""
+        expires_at = time.time() + self.ttl_seconds
+        self.remember(key, prediction, expires_at)
+        
+        if self.db is not None:
+            self.pending_writes.append((key, self.model_id, json.dumps(prediction), expires_at))
+            if self.flush_task is None:
+                self.flush_task = asyncio.get_running_loop().create_task(self.flush_later())
+    
+    async def flush_later(self):
+        """Write the queued predictions after a short delay, off the event loop"""
+        await asyncio.sleep(WRITE_DELAY_SECONDS)
+        rows, self.pending_writes = self.pending_writes, []
+        self.flush_task = None
+        try:
+            await asyncio.to_thread(self.write_rows, rows)
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not write {len(rows)} predictions to the disk cache: {e}")
+    
+    def write_rows(self, rows):
+        """Write prediction rows to disk in one transaction"""
+        with self.db_lock:
+            if self.db is None or not rows:
+                return
+            self.db.executemany(
+                "INSERT OR REPLACE INTO predictions (content_hash, model_id, prediction, expires_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self.db.commit()
+    
+    async def get_or_predict(self, image_bytes, predict_fn):
+        """
+        Return the cached prediction for an image or compute it with predict_fn
+        predict_fn is a coroutine function taking no arguments.
+        """
+        self.check_model()
+        key = content_key(image_bytes)
+        
+        prediction = await self.get(key)
+        if prediction is not None:
+            return prediction
+        
+        # Single flight: identical concurrent requests wait on the same call
+        while key in self.in_flight:
+            future = self.in_flight[key]
+            self.stats["coalesced"] += 1
+            # wait() leaves the shared future alone when this request is cancelled
+            await asyncio.wait([future])
+            if not future.cancelled():
+                return future.result()
+            # The leader was cancelled, take over its prediction
+        
+        self.stats["misses"] += 1
+        model_id = self.model_id
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        
+        try:
+            prediction = await predict_fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(prediction)
+            if self.model_id == model_id:
+                self.put(key, prediction)
+            return prediction
+        finally:
+            del self.in_flight[key]
+    
+    def purge_expired(self):
+        """Delete expired rows from the disk tier"""
+        if self.db is not None:
+            with self.db_lock:
+                self.db.execute("DELETE FROM predictions WHERE expires_at <= ?", (time.time(),))
+                self.db.commit()
+    
+    def close(self):
+        """Write any queued predictions and close the disk tier"""
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        rows, self.pending_writes = self.pending_writes, []
+        self.write_rows(rows)
+        with self.db_lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
\ No newline at end of file
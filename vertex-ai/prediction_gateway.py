@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Elephant Detection Prediction Gateway
+Long-running service serving the predict.php JSON contract over a warm
+Vertex AI connection with cached access tokens
+"""
+
+import os
+import time
+import base64
+import argparse
+import asyncio
+from datetime import datetime
+from aiohttp import web
+from image_preprocess import encode_content, get_model_key, load_profile
+from micro_batcher import MAX_BATCH_SIZE, MicroBatcher
+from prediction_cache import CACHE_FILE, TTL_SECONDS, PredictionCache
+from vertex_client import (
+    DEFAULT_CONCURRENCY,
+    ENDPOINT_CONFIG_FILE,
+    PredictionError,
+    create_endpoint_client,
+    format_prediction_results,
+    load_endpoint_config
+)
+import instrumentation
+
+# Configuration
+GATEWAY_HOST = "127.0.0.1"
+GATEWAY_PORT = 8080
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # Same limit as predict.php
+BATCH_WINDOW_MS = 0  # Micro-batching window, 0 sends every request on its own
+
+async def read_image_content(request):
+    """
+    Read the base64 image from a request
+    Accepts JSON {"content": "<base64>"} (as forwarded by predict.php, already
+    downsized) or a multipart upload with an "image" field, which is downsized here.
+    """
+    if request.content_type == "application/json":
+        body = await request.json()
+        content = body.get("content") if isinstance(body, dict) else None
+        if not content:
+            raise web.HTTPBadRequest(reason="Missing image content")
+        return content
+    
+    post = await request.post()
+    upload = post.get("image")
+    if upload is None or not hasattr(upload, "file"):
+        raise web.HTTPBadRequest(reason="No image uploaded or upload error occurred")
+    try:
+        # Decoding and resizing take long enough to stall the event loop
+        loop = asyncio.get_running_loop()
+        profile = request.app["preprocess_profile"]
+        return await loop.run_in_executor(
+            None, encode_content, upload.file.read(), profile["max_dimension"], profile["quality"]
+        )
+    except (OSError, ValueError):
+        raise web.HTTPBadRequest(reason="Invalid image file")
+
+def error_response(message, status):
+    """JSON error in the predict.php format"""
+    return web.json_response({"status": "error", "error": message}, status=status)
+
+async def handle_predict(request):
+    """Serve one prediction in the predict.php response format"""
+    app = request.app
+    start_time = time.perf_counter()
+    
+    try:
+        content = await read_image_content(request)
+    except web.HTTPBadRequest as e:
+        return error_response(e.reason, 400)
+    except ValueError:
+        return error_response("Invalid request body", 400)
+    
+    try:
+        prediction = await app["predict"](content)
+    except PredictionError as e:
+        app["stats"]["errors"] += 1
+        return error_response(str(e), 502)
+    
+    results = format_prediction_results(prediction)
+    results["model_info"] = app["model_info"]
+    if "cascadeStage" in prediction:
+        results["model_info"] = dict(app["model_info"], stage=prediction["cascadeStage"])
+    results["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    app["stats"]["requests"] += 1
+    app["stats"]["latency_seconds_total"] += time.perf_counter() - start_time
+    
+    return web.json_response({"status": "success", "data": results})
+
+def endpoint_ready(config_file):
+    """Whether the endpoint has been warmed up (configs without the flag count as ready)"""
+    if not os.path.exists(config_file):
+        return True
+    return load_endpoint_config(config_file).get("ready", True)
+
+async def handle_health(request):
+    """
+    Report gateway health and counters
+    Answers 503 while the endpoint is still being warmed up, so load balancers
+    hold traffic back until it is ready.
+    """
+    app = request.app
+    ready = app["edge"] or endpoint_ready(app["config_file"])
+    stats = dict(app["stats"])
+    stats["upstream"] = app["client"].stats
+    stats["preprocess_profile"] = app["preprocess_profile"]
+    if app["client"].token_provider is not None:
+        stats["token_refreshes"] = app["client"].token_provider.stats["refreshes"]
+        stats["token_expires_in_seconds"] = round(app["client"].token_provider.seconds_until_expiry())
+    if app["batcher"] is not None:
+        stats["batching"] = app["batcher"].metrics()
+    if app["cache"] is not None:
+        stats["cache"] = dict(app["cache"].stats, model_id=app["cache"].model_id)
+    if not ready:
+        return web.json_response({"status": "warming", "stats": stats}, status=503)
+    return web.json_response({"status": "ok", "stats": stats})
+
+def create_gateway_app(endpoint_uri=None, config_file=ENDPOINT_CONFIG_FILE,
+                       concurrency=DEFAULT_CONCURRENCY, batch_window_ms=BATCH_WINDOW_MS,
+                       max_batch_size=MAX_BATCH_SIZE, cache_file=None, cache_ttl_seconds=TTL_SECONDS,
+                       edge_model=None, hedge=True, hedge_delay_ms=None, cascade_band=None):
+    """
+    Create the gateway application
+    The upstream client, its connection pool and the token refresh task live
+    for the lifetime of the app. With a batch window, concurrent requests are
+    coalesced into batched predict calls. With a cache file, predictions are
+    cached by image content and deployed model. With an edge model, predictions
+    run locally on CPU instead of calling the endpoint. With several endpoints
+    in the config, calls are routed between them with hedging. With a cascade
+    band, the fast model answers and ambiguous images go to the accurate model.
+    """
+    config = load_endpoint_config(config_file) if os.path.exists(config_file) else {}
+    
+    app = web.Application(client_max_size=MAX_UPLOAD_BYTES * 2)
+    if edge_model:
+        from edge_inference import EdgeInferenceEngine
+        app["client"] = EdgeInferenceEngine(edge_model)
+        app["model_info"] = {
+            "name": os.path.basename(edge_model),
+            "type": "Edge Model (local CPU)",
+            "endpoint": "local"
+        }
+    elif cascade_band:
+        from model_cascade import CASCADE_ROLES, create_cascade_client
+        app["client"] = create_cascade_client(config_file, band=cascade_band, concurrency=concurrency)
+        stages = [config["cascade"][role] for role in CASCADE_ROLES]
+        app["model_info"] = {
+            "name": " -> ".join(stage["model_display_name"] for stage in stages),
+            "type": "Model Cascade",
+            "endpoint": " -> ".join(stage["endpoint_id"] for stage in stages)
+        }
+    else:
+        app["client"] = create_endpoint_client(
+            endpoint_uri,
+            config_file=config_file,
+            concurrency=concurrency,
+            hedge=hedge,
+            hedge_delay_ms=hedge_delay_ms
+        )
+        app["model_info"] = {
+            "name": config.get("model_display_name", "Unknown"),
+            "type": "Custom Trained Model",
+            "endpoint": config.get("endpoint_id", "Unknown")
+        }
+    app["stats"] = {"requests": 0, "errors": 0, "latency_seconds_total": 0.0}
+    app["config_file"] = config_file
+    app["edge"] = bool(edge_model)
+    app["preprocess_profile"] = load_profile(get_model_key(config_file, edge_model))
+    
+    async def predict_one(content):
+        return (await app["client"].predict([{"content": content}]))[0]
+    
+    if batch_window_ms > 0:
+        app["batcher"] = MicroBatcher(app["client"].predict, max_batch_size, batch_window_ms)
+        app["predict"] = lambda content: app["batcher"].submit({"content": content})
+    else:
+        app["batcher"] = None
+        app["predict"] = predict_one
+    
+    app["cache"] = None
+    if cache_file:
+        app["cache"] = PredictionCache(config_file, cache_file=cache_file, ttl_seconds=cache_ttl_seconds)
+        uncached_predict = app["predict"]
+        
+        async def cached_predict(content):
+            return await app["cache"].get_or_predict(
+                base64.b64decode(content),
+                lambda: uncached_predict(content)
+            )
+        
+        app["predict"] = cached_predict
+    
+    async def on_startup(app):
+        await app["client"].open()
+        token_provider = app["client"].token_provider
+        if token_provider is not None:
+            # Mint the first token before serving, then keep it fresh
+            await token_provider.refresh()
+            token_provider.start_background_refresh()
+    
+    async def on_cleanup(app):
+        if app["batcher"] is not None:
+            await app["batcher"].drain()
+        if app["client"].token_provider is not None:
+            await app["client"].token_provider.stop_background_refresh()
+        await app["client"].close()
+        if app["cache"] is not None:
+            app["cache"].close()
+    
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    
+    app.router.add_post("/predict", handle_predict)
+    app.router.add_get("/healthz", handle_health)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the elephant detection prediction gateway')
+    parser.add_argument('--host', default=GATEWAY_HOST, help='Host to bind')
+    parser.add_argument('--port', type=int, default=GATEWAY_PORT, help='Port to bind')
+    parser.add_argument('--endpoint-uri', nargs='+',
+                       help='Predict URI, several are routed with hedging (default: from endpoint_config.json)')
+    parser.add_argument('--config-file', default=ENDPOINT_CONFIG_FILE, help='Endpoint configuration file')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                       help='Pooled upstream connections')
+    parser.add_argument('--batch-window-ms', type=float, default=BATCH_WINDOW_MS,
+                       help='Coalesce concurrent requests for up to this long (0 disables batching)')
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE,
+                       help='Max instances per batched predict call')
+    parser.add_argument('--hedge-delay-ms', type=float,
+                       help='Hedge calls slower than this (default: the endpoint\'s recent p95)')
+    parser.add_argument('--no-hedge', action='store_true', help='Route between endpoints without hedging')
+    parser.add_argument('--edge-model', help='Serve an exported model locally instead of the endpoint')
+    parser.add_argument('--cascade', action='store_true',
+                       help='Answer with the fast model and escalate ambiguous images to the accurate model')
+    parser.add_argument('--cascade-band', type=float, nargs=2, metavar=('LOW', 'HIGH'),
+                       help='Elephant confidences escalated by --cascade (default: 0.3 0.9)')
+    parser.add_argument('--cache', action='store_true',
+                       help='Cache predictions by image content and deployed model')
+    parser.add_argument('--cache-file', default=CACHE_FILE, help='On-disk prediction cache')
+    parser.add_argument('--cache-ttl-hours', type=float, default=TTL_SECONDS / 3600,
+                       help='How long cached predictions stay valid')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "prediction_gateway")
+    
+    print("=" * 60)
+    print("🐘 ELEPHANT DETECTION - PREDICTION GATEWAY")
+    print("=" * 60)
+    print(f"  Listening on: http://{args.host}:{args.port}/predict")
+    cascade_band = None
+    if args.cascade:
+        from model_cascade import ESCALATION_BAND
+        cascade_band = args.cascade_band or ESCALATION_BAND
+        print(f"  Cascade: escalating elephant confidences in [{cascade_band[0]}, {cascade_band[1]})")
+    if args.batch_window_ms > 0:
+        print(f"  Micro-batching: up to {args.max_batch_size} instances / {args.batch_window_ms}ms")
+    
+    web.run_app(
+        create_gateway_app(
+            endpoint_uri=args.endpoint_uri,
+            config_file=args.config_file,
+            concurrency=args.concurrency,
+            batch_window_ms=args.batch_window_ms,
+            max_batch_size=args.max_batch_size,
+            cache_file=args.cache_file if args.cache else None,
+            cache_ttl_seconds=args.cache_ttl_hours * 3600,
+            edge_model=args.edge_model,
+            hedge=not args.no_hedge,
+            hedge_delay_ms=args.hedge_delay_ms,
+            cascade_band=cascade_band
+        ),
+        host=args.host,
+        port=args.port,
+        print=None
+    )
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Input Resolution Search
+Finds the smallest image size and JPEG quality that keep a model's decisions
+stable and saves it as the model's preprocessing profile
+"""
+
+import os
+import json
+import argparse
+import asyncio
+from datetime import datetime
+from batch_predict import iter_batches, iter_image_inputs, read_image_bytes
+from image_preprocess import JPEG_QUALITY, MAX_DIMENSION, PROFILE_FILE, encode_content, get_model_key, save_profile
+from vertex_client import ENDPOINT_CONFIG_FILE, create_endpoint_client, elephant_confidence
+import instrumentation
+
+# Configuration
+DIMENSIONS = [1024, 896, 768, 640, 512, 448, 384, 320, 256]
+QUALITIES = [90, 80, 70, 60, 50]
+SAMPLE_LIMIT = 200
+BATCH_SIZE = 8
+CONCURRENCY = 4
+MIN_AGREEMENT = 0.98  # Share of images whose top label matches the reference setting
+MAX_MEAN_CONFIDENCE_DELTA = 0.03  # Mean absolute change of the elephant confidence
+MAX_ACCURACY_DROP = 0.01  # Allowed drop in labelled accuracy
+REPORT_FILE = "resolution_search_report.json"
+
+def top_label(prediction):
+    """Label with the highest confidence"""
+    pairs = zip(prediction.get("displayNames", []), prediction.get("confidences", []))
+    return max(pairs, key=lambda pair: pair[1], default=(None, 0))[0]
+
+def load_labelled_samples(source, limit=SAMPLE_LIMIT):
+    """Sample items with a label from JSONL "label" or the image's parent directory"""
+    samples = []
+    for item in iter_image_inputs(source):
+        if "label" not in item and "path" in item and os.path.isdir(source):
+            item["label"] = os.path.basename(os.path.dirname(item["path"]))
+        samples.append(item)
+        if len(samples) >= limit:
+            break
+    
+    print(f"✓ Loaded {len(samples)} sample images from {source}")
+    return samples
+
+async def score_setting(client, samples, max_dimension, quality):
+    """Predict every sample at one setting, returns (base64 size, top label, elephant confidence) per sample"""
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(CONCURRENCY)
+    
+    async def score(batch):
+        async with slots:
+            instances = await loop.run_in_executor(None, lambda: [
+                {"content": encode_content(read_image_bytes(item), max_dimension, quality)}
+                for item in batch
+            ])
+            predictions = await client.predict(instances)
+        return [
+            (len(instance["content"]), top_label(prediction), elephant_confidence(prediction))
+            for instance, prediction in zip(instances, predictions)
+        ]
+    
+    batches = await asyncio.gather(*(score(batch) for batch in iter_batches(samples, BATCH_SIZE)))
+    return [result for batch in batches for result in batch]
+
+def compare_to_reference(samples, results, reference):
+    """Payload size and decision stability of a setting against the reference setting"""
+    count = len(results)
+    labelled = [sample.get("label") for sample in samples]
+    
+    summary = {
+        "mean_bytes": round(sum(size for size, _, _ in results) / count),
+        "agreement": round(sum(
+            label == reference_label
+            for (_, label, _), (_, reference_label, _) in zip(results, reference)
+        ) / count, 4),
+        "mean_confidence_delta": round(sum(
+            abs(confidence - reference_confidence)
+            for (_, _, confidence), (_, _, reference_confidence) in zip(results, reference)
+        ) / count, 4),
+        "accuracy": None
+    }
+    
+    if all(labelled):
+        summary["accuracy"] = round(sum(
+            label == expected for (_, label, _), expected in zip(results, labelled)
+        ) / count, 4)
+    return summary
+
+def is_stable(summary, reference_summary):
+    """Whether a setting keeps decisions close enough to the reference"""
+    if summary["agreement"] < MIN_AGREEMENT:
+        return False
+    if summary["mean_confidence_delta"] > MAX_MEAN_CONFIDENCE_DELTA:
+        return False
+    if summary["accuracy"] is not None and summary["accuracy"] < reference_summary["accuracy"] - MAX_ACCURACY_DROP:
+        return False
+    return True
+
+async def search_resolutions(client, samples, dimensions=DIMENSIONS, qualities=QUALITIES):
+    """Score every setting against the predict.php setting, returns (reference, settings, best setting)"""
+    print(f"\n📏 Reference: {MAX_DIMENSION}px q{JPEG_QUALITY}")
+    reference = await score_setting(client, samples, MAX_DIMENSION, JPEG_QUALITY)
+    reference_summary = compare_to_reference(samples, reference, reference)
+    
+    settings = []
+    for max_dimension in sorted(dimensions, reverse=True):
+        for quality in sorted(qualities, reverse=True):
+            results = await score_setting(client, samples, max_dimension, quality)
+            summary = compare_to_reference(samples, results, reference)
+            summary.update(max_dimension=max_dimension, quality=quality)
+            summary["stable"] = is_stable(summary, reference_summary)
+            settings.append(summary)
+            
+            mark = "✓" if summary["stable"] else "❌"
+            print(f"  {mark} {max_dimension:>5}px q{quality:<3} {summary['mean_bytes'] / 1024:>7.1f} KB  "
+                  f"agreement {summary['agreement']:.2%}  confidence delta {summary['mean_confidence_delta']:.3f}")
+    
+    stable = [summary for summary in settings if summary["stable"]]
+    best = min(stable, key=lambda summary: summary["mean_bytes"], default=None)
+    return reference_summary, settings, best
+
+async def run_search(samples, endpoint_uri=None, config_file=ENDPOINT_CONFIG_FILE,
+                     edge_model=None, stub=False, dimensions=DIMENSIONS, qualities=QUALITIES):
+    """Run the search against the endpoint, an edge model or the local stub"""
+    stub_runner = None
+    if edge_model:
+        from edge_inference import EdgeInferenceEngine
+        client = EdgeInferenceEngine(edge_model)
+    else:
+        if stub:
+            from stub_endpoint import start_stub_server
+            stub_runner, endpoint_uri = await start_stub_server(port=0)
+        client = create_endpoint_client(endpoint_uri, config_file=config_file, concurrency=CONCURRENCY)
+    
+    try:
+        async with client:
+            return await search_resolutions(client, samples, dimensions, qualities)
+    finally:
+        if stub_runner is not None:
+            await stub_runner.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the smallest stable input resolution for a model')
+    parser.add_argument('--input', required=True,
+                       help='Labelled images: directory of <label>/ folders or JSONL with "label"')
+    parser.add_argument('--limit', type=int, default=SAMPLE_LIMIT, help='Max sample images')
+    parser.add_argument('--endpoint-uri', help='Predict URI (default: from endpoint_config.json)')
+    parser.add_argument('--config-file', default=ENDPOINT_CONFIG_FILE, help='Endpoint configuration file')
+    parser.add_argument('--edge-model', help='Tune an exported model on local CPU instead')
+    parser.add_argument('--stub', action='store_true', help='Run against the local stub (plumbing test only)')
+    parser.add_argument('--dimensions', type=int, nargs='+', default=DIMENSIONS, help='Longest sides to try')
+    parser.add_argument('--qualities', type=int, nargs='+', default=QUALITIES, help='JPEG qualities to try')
+    parser.add_argument('--profile-file', default=PROFILE_FILE, help='Profile file read by the serving path')
+    parser.add_argument('--dry-run', action='store_true', help='Report only, do not save the profile')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "resolution_search")
+    
+    print("=" * 60)
+    print("🐘 ELEPHANT DETECTION - INPUT RESOLUTION SEARCH")
+    print("=" * 60)
+    
+    model_key = "stub" if args.stub else get_model_key(args.config_file, args.edge_model)
+    if model_key is None:
+        print("❌ No deployed model found in endpoint_config.json (use --edge-model or --stub)")
+        return
+    print(f"  Model: {model_key}")
+    
+    samples = load_labelled_samples(args.input, args.limit)
+    if not samples:
+        print("❌ No sample images found")
+        return
+    
+    reference, settings, best = asyncio.run(run_search(
+        samples,
+        endpoint_uri=args.endpoint_uri,
+        config_file=args.config_file,
+        edge_model=args.edge_model,
+        stub=args.stub,
+        dimensions=args.dimensions,
+        qualities=args.qualities
+    ))
+    
+    with open(REPORT_FILE, "w") as f:
+        json.dump({
+            "model_key": model_key,
+            "created_time": datetime.now().isoformat(),
+            "samples": len(samples),
+            "reference": dict(reference, max_dimension=MAX_DIMENSION, quality=JPEG_QUALITY),
+            "settings": settings,
+            "selected": best
+        }, f, indent=2)
+    
+    print("\n" + "=" * 60)
+    print("✅ RESOLUTION SEARCH COMPLETE")
+    print("=" * 60)
+    print(f"✓ Report saved to: {REPORT_FILE}")
+    
+    if best is None:
+        print(f"⚠️ No setting was stable; keeping {MAX_DIMENSION}px q{JPEG_QUALITY}")
+        return
+    
+    print(f"  Selected: {best['max_dimension']}px q{best['quality']} "
+          f"({best['mean_bytes'] / 1024:.1f} KB vs {reference['mean_bytes'] / 1024:.1f} KB per image)")
+    
+    if not args.dry_run:
+        save_profile(model_key, {
+            "max_dimension": best["max_dimension"],
+            "quality": best["quality"],
+            "mean_bytes": best["mean_bytes"],
+            "reference_mean_bytes": reference["mean_bytes"],
+            "agreement": best["agreement"],
+            "tuned_time": datetime.now().isoformat()
+        }, args.profile_file)
+        print(f"✓ Profile saved to: {args.profile_file}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Local Stub Prediction Endpoint
+Serves the Vertex AI :predict REST contract for testing without cloud resources
+"""
+
+import random
+import hashlib
+import argparse
+import asyncio
+from aiohttp import web
+import instrumentation
+
+# Configuration
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8085
+STUB_LABELS = ["african_elephant", "asian_elephant", "no_elephant"]
+
+def stub_prediction(content, labels=STUB_LABELS, salt=b""):
+    """Deterministic classification result derived from the image content"""
+    digest = hashlib.sha256(salt + (content.encode() if isinstance(content, str) else content)).digest()
+    weights = [digest[i] + 1 for i in range(len(labels))]
+    total = sum(weights)
+    
+    return {
+        "ids": [str(i) for i in range(len(labels))],
+        "displayNames": list(labels),
+        "confidences": [round(weight / total, 6) for weight in weights]
+    }
+
+def deployed_model_prediction(content, deployed_model_id, disagreement=0.0, labels=STUB_LABELS):
+    """
+    Prediction of one of several stub deployed models
+    For a `disagreement` share of images (picked by content) the model answers
+    differently from the others, like a retrained model would.
+    """
+    salt = deployed_model_id.encode()
+    digest = hashlib.sha256(salt + (content.encode() if isinstance(content, str) else content)).digest()
+    if digest[0] < disagreement * 256:
+        return stub_prediction(content, labels, salt)
+    return stub_prediction(content, labels)
+
+def create_stub_app(latency_ms=50.0, per_instance_ms=0.0, jitter_ms=0.0, replicas=None,
+                    error_rate=0.0, tail_rate=0.0, tail_ms=0.0, cold_start_ms=0.0, cold_calls=None,
+                    seed=None, labels=STUB_LABELS, deployed_models=None):
+    """
+    Create the stub application
+    Each call takes latency_ms + per_instance_ms per instance (plus up to jitter_ms).
+    With `replicas` set, at most that many calls are served at once and the rest queue,
+    like a deployment at its replica limit. error_rate returns HTTP 503 at random.
+    tail_rate of the calls take tail_ms longer, like a slow replica or a GC pause.
+    The first cold_calls calls (default 1) take up to cold_start_ms longer, shrinking
+    as the stub warms up, like freshly started replicas.
+    deployed_models maps deployed model ids to their own latency_ms, jitter_ms,
+    disagreement and error_rate; app["traffic_split"] spreads calls between them like an
+    endpoint's traffic split.
+    """
+    rng = random.Random(seed)
+    if cold_calls is None:
+        cold_calls = 1 if cold_start_ms > 0 else 0
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app["stats"] = {"requests": 0, "instances": 0, "errors": 0}
+    app["replica_slots"] = None
+    app["deployed_models"] = deployed_models or {"stub": {}}
+    app["traffic_split"] = {next(iter(app["deployed_models"])): 100}
+    
+    async def handle_predict(request):
+        stats = request.app["stats"]
+        stats["requests"] += 1
+        
+        try:
+            instances = (await request.json())["instances"]
+        except (ValueError, KeyError, TypeError):
+            stats["errors"] += 1
+            return web.json_response({"error": {"code": 400, "message": "Invalid request body"}}, status=400)
+        
+        split = request.app["traffic_split"]
+        deployed_model_id = next(iter(split))
+        if len(split) > 1:
+            deployed_model_id = rng.choices(list(split), weights=list(split.values()))[0]
+        model = request.app["deployed_models"][deployed_model_id]
+        
+        model_error_rate = model.get("error_rate", error_rate)
+        if model_error_rate and rng.random() < model_error_rate:
+            stats["errors"] += 1
+            return web.json_response({"error": {"code": 503, "message": "Stub unavailable"}}, status=503)
+        
+        service_time = (
+            model.get("latency_ms", latency_ms) + per_instance_ms * len(instances)
+            + rng.uniform(0, model.get("jitter_ms", jitter_ms))
+        ) / 1000
+        if tail_rate and rng.random() < tail_rate:
+            service_time += tail_ms / 1000
+        if stats["requests"] <= cold_calls:
+            service_time += cold_start_ms * (1 - (stats["requests"] - 1) / cold_calls) / 1000
+        
+        if replicas:
+            if request.app["replica_slots"] is None:
+                request.app["replica_slots"] = asyncio.Semaphore(replicas)
+            async with request.app["replica_slots"]:
+                await asyncio.sleep(service_time)
+        else:
+            await asyncio.sleep(service_time)
+        
+        stats["instances"] += len(instances)
+        return web.json_response({
+            "predictions": [
+                deployed_model_prediction(instance.get("content", ""), deployed_model_id,
+                                          model.get("disagreement", 0.0), labels)
+                for instance in instances
+            ],
+            "deployedModelId": deployed_model_id
+        })
+    
+    app.router.add_post("/{tail:.*}", handle_predict)
+    return app
+
+async def start_stub_server(host=DEFAULT_HOST, port=DEFAULT_PORT, **options):
+    """
+    Start the stub inside the running event loop
+    Returns (runner, predict url); call `await runner.cleanup()` to stop it.
+    Pass port=0 to pick a free port.
+    """
+    runner = web.AppRunner(create_stub_app(**options))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    
+    bound_port = runner.addresses[0][1]
+    return runner, f"http://{host}:{bound_port}/v1/stub:predict"
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local stub of the prediction endpoint')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Host to bind')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to bind')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Base service time per call')
+    parser.add_argument('--per-instance-ms', type=float, default=0.0, help='Extra service time per instance')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='Random extra service time')
+    parser.add_argument('--replicas', type=int, help='Max calls served concurrently')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls failing with 503')
+    parser.add_argument('--tail-rate', type=float, default=0.0, help='Fraction of calls that are slow')
+    parser.add_argument('--tail-ms', type=float, default=0.0, help='Extra service time of slow calls')
+    parser.add_argument('--cold-start-ms', type=float, default=0.0, help='Extra service time of the first call')
+    parser.add_argument('--cold-calls', type=int,
+                       help='Calls until the cold start has worn off (default: 1 with --cold-start-ms)')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible runs')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "stub_endpoint")
+    
+    print(f"🧪 Stub endpoint: http://{args.host}:{args.port}/v1/stub:predict")
+    web.run_app(
+        create_stub_app(
+            latency_ms=args.latency_ms,
+            per_instance_ms=args.per_instance_ms,
+            jitter_ms=args.jitter_ms,
+            replicas=args.replicas,
+            error_rate=args.error_rate,
+            tail_rate=args.tail_rate,
+            tail_ms=args.tail_ms,
+            cold_start_ms=args.cold_start_ms,
+            cold_calls=args.cold_calls,
+            seed=args.seed
+        ),
+        host=args.host,
+        port=args.port,
+        print=None
+    )
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
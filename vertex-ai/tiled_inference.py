@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Tiled Inference for Aerial Imagery
+Scores high-resolution drone images as overlapping tiles and combines them
+into one result with a coarse heat map
+"""
+
+import io
+import math
+import base64
+import argparse
+import asyncio
+from PIL import Image, ImageOps
+from image_preprocess import JPEG_QUALITY
+from vertex_client import ENDPOINT_CONFIG_FILE, create_endpoint_client, elephant_confidence
+import instrumentation
+
+# Configuration
+TILE_SIZE = 1024  # Tile side in source pixels
+TILE_OVERLAP = 0.2  # Fraction of a tile shared with its neighbour
+TILE_INPUT_SIZE = 1024  # Tile side sent to the model
+TILE_BATCH_SIZE = 8  # Tiles per predict call
+MAX_TILES = 64  # Tiles grow when an image would need more
+EARLY_STOP_CONFIDENCE = 0.9  # Stop once a tile is this confident of an elephant
+MAX_DECODED_PIXELS = 48_000_000  # Decode cap, enough for MAX_TILES tiles at TILE_INPUT_SIZE
+HEATMAP_SHADES = " .:-=+*#%@"
+
+def tile_origins(length, tile_size, stride):
+    """Start offsets covering [0, length) with the last tile flush to the edge"""
+    if length <= tile_size:
+        return [0]
+    origins = list(range(0, length - tile_size, stride))
+    origins.append(length - tile_size)
+    return origins
+
+def plan_tiles(width, height, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, max_tiles=MAX_TILES):
+    """
+    Tile boxes in source pixels as a grid of rows
+    The tile size grows until the grid fits in max_tiles, which bounds the
+    number of endpoint calls for any image size.
+    """
+    while True:
+        stride = max(1, int(tile_size * (1 - overlap)))
+        xs = tile_origins(width, tile_size, stride)
+        ys = tile_origins(height, tile_size, stride)
+        if len(xs) * len(ys) <= max_tiles:
+            break
+        tile_size = int(tile_size * 1.25)
+    
+    return [
+        [(x, y, min(x + tile_size, width), min(y + tile_size, height)) for x in xs]
+        for y in ys
+    ]
+
+def load_for_tiling(image_bytes, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, input_size=TILE_INPUT_SIZE,
+                    max_tiles=MAX_TILES, max_pixels=MAX_DECODED_PIXELS):
+    """
+    Plan the tiles from the image header, then decode no larger than they need
+    Tiles are sent at input_size, so a JPEG is decoded at reduced DCT scale
+    when the final (possibly grown) tiles are larger than that, and never above
+    max_pixels. Returns (image, source to decoded scale, tile grid).
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    if image.getexif().get(0x0112) in (5, 6, 7, 8):
+        # Rotated by EXIF orientation, tiles are planned on the upright image
+        width, height = height, width
+    grid = plan_tiles(width, height, tile_size, overlap, max_tiles)
+    left, top, right, bottom = grid[0][0]
+    tile_extent = max(right - left, bottom - top)  # After plan_tiles grew it to fit max_tiles
+    
+    target_scale = min(1.0, input_size / tile_extent, math.sqrt(max_pixels / (width * height)))
+    target_size = (math.ceil(image.width * target_scale), math.ceil(image.height * target_scale))
+    if target_scale < 1:
+        # draft picks the nearest DCT scale that is at least as large; other formats ignore it
+        image.draft("RGB", target_size)
+        if image.width * image.height > max_pixels:
+            image = image.resize(target_size, Image.BICUBIC, reducing_gap=2.0)
+    
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    return image, image.width / width, grid
+
+def encode_tile(image, box, scale, input_size, quality):
+    """Crop one tile, fit it to input_size and base64-encode it"""
+    crop = image.crop(tuple(round(value * scale) for value in box))
+    if max(crop.size) > input_size:
+        crop.thumbnail((input_size, input_size), Image.BICUBIC)
+    
+    output = io.BytesIO()
+    crop.save(output, "JPEG", quality=quality)
+    return base64.b64encode(output.getbuffer()).decode("ascii")
+
+async def predict_tiled(client, image_bytes, tile_size=TILE_SIZE, overlap=TILE_OVERLAP,
+                        input_size=TILE_INPUT_SIZE, quality=JPEG_QUALITY, batch_size=TILE_BATCH_SIZE,
+                        max_tiles=MAX_TILES, stop_confidence=EARLY_STOP_CONFIDENCE):
+    """
+    Score an image tile by tile and combine the results
+    Returns the prediction of the most elephant-like tile (so the result has
+    the usual displayNames/confidences shape) plus the tile count, the heat
+    map of per-tile elephant confidence (None for tiles not scored after an
+    early stop) and the box of the best tile.
+    """
+    loop = asyncio.get_running_loop()
+    image, scale, grid = await loop.run_in_executor(
+        None, load_for_tiling, image_bytes, tile_size, overlap, input_size, max_tiles
+    )
+    
+    positions = [(row, column) for row in range(len(grid)) for column in range(len(grid[0]))]
+    heatmap = [[None] * len(grid[0]) for _ in grid]
+    best = None
+    calls = 0
+    
+    for start in range(0, len(positions), batch_size):
+        chunk = positions[start:start + batch_size]
+        instances = await loop.run_in_executor(None, lambda: [
+            {"content": encode_tile(image, grid[row][column], scale, input_size, quality)}
+            for row, column in chunk
+        ])
+        predictions = await client.predict(instances)
+        calls += 1
+        
+        for (row, column), prediction in zip(chunk, predictions):
+            confidence = elephant_confidence(prediction)
+            heatmap[row][column] = round(confidence, 4)
+            if best is None or confidence > best[0]:
+                best = (confidence, prediction, grid[row][column])
+        
+        if best[0] >= stop_confidence:
+            break
+    
+    image.close()
+    return dict(
+        best[1],
+        elephant_confidence=round(best[0], 4),
+        tiles=sum(value is not None for row in heatmap for value in row),
+        tiles_planned=len(positions),
+        calls=calls,
+        early_stopped=calls * batch_size < len(positions),
+        best_tile=list(best[2]),
+        heatmap=heatmap
+    )
+
+def render_heatmap(heatmap):
+    """ASCII rendering of a heat map, '?' for unscored tiles"""
+    lines = []
+    for row in heatmap:
+        lines.append("".join(
+            "?" if value is None else HEATMAP_SHADES[min(len(HEATMAP_SHADES) - 1, int(value * len(HEATMAP_SHADES)))]
+            for value in row
+        ))
+    return "\n".join(lines)
+
+async def predict_files_tiled(paths, endpoint_uri=None, config_file=ENDPOINT_CONFIG_FILE, edge_model=None, **options):
+    """Score image files with tiling, one result per file"""
+    if edge_model:
+        from edge_inference import EdgeInferenceEngine
+        client = EdgeInferenceEngine(edge_model)
+    else:
+        client = create_endpoint_client(endpoint_uri, config_file=config_file)
+    
+    results = []
+    async with client:
+        for path in paths:
+            with open(path, "rb") as f:
+                results.append(await predict_tiled(client, f.read(), **options))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Score high-resolution aerial images as tiles')
+    parser.add_argument('--images', nargs='+', required=True, help='Images to score')
+    parser.add_argument('--endpoint-uri', help='Predict URI (default: from endpoint_config.json)')
+    parser.add_argument('--config-file', default=ENDPOINT_CONFIG_FILE, help='Endpoint configuration file')
+    parser.add_argument('--edge-model', help='Score with an exported model on local CPU instead')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help='Tile side in source pixels')
+    parser.add_argument('--overlap', type=float, default=TILE_OVERLAP, help='Tile overlap fraction')
+    parser.add_argument('--input-size', type=int, default=TILE_INPUT_SIZE, help='Tile side sent to the model')
+    parser.add_argument('--max-tiles', type=int, default=MAX_TILES, help='Max tiles per image')
+    parser.add_argument('--stop-confidence', type=float, default=EARLY_STOP_CONFIDENCE,
+                       help='Stop once a tile reaches this elephant confidence (above 1 disables)')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "tiled_inference")
+    
+    results = asyncio.run(predict_files_tiled(
+        args.images,
+        endpoint_uri=args.endpoint_uri,
+        config_file=args.config_file,
+        edge_model=args.edge_model,
+        tile_size=args.tile_size,
+        overlap=args.overlap,
+        input_size=args.input_size,
+        max_tiles=args.max_tiles,
+        stop_confidence=args.stop_confidence
+    ))
+    
+    for path, result in zip(args.images, results):
+        print(f"\n🛰️ {path}")
+        print(f"  Elephant confidence: {result['elephant_confidence']:.2%} (best tile {result['best_tile']})")
+        print(f"  Tiles scored: {result['tiles']}/{result['tiles_planned']} in {result['calls']} calls"
+              f"{' (stopped early)' if result['early_stopped'] else ''}")
+        print(render_heatmap(result["heatmap"]))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -8,8 +8,10 @@ import os
 import json
 import argparse
 from datetime import datetime
-from google.cloud import aiplatform
+from cloud_context import aiplatform
+import cloud_context
 import time
+import instrumentation
 
 # Configuration
 PROJECT_ID = "pelagic-magpie-469618-k8"
@@ -36,15 +38,18 @@ TRAINING_CONFIGS = {
         "model_type": "CLOUD",
         "node_hours": 8,
         "description": "AutoML optimized model with automatic architecture selection"
+    },
+    "mobilenet_edge": {
+        "display_name": "MobileNet Edge Elephant Detector",
+        "model_type": "MOBILE_TF_LOW_LATENCY_1",
+        "node_hours": 4,
+        "description": "Exportable TFLite model for offline CPU inference at field stations"
     }
 }
 
 def initialize_vertex_ai(project_id, location):
     """Initialize Vertex AI"""
-    aiplatform.init(project=project_id, location=location)
-    print(f"✓ Initialized Vertex AI")
-    print(f"  Project: {project_id}")
-    print(f"  Location: {location}")
+    cloud_context.initialize_vertex_ai(project_id, location)
 
 def load_dataset_info():
     """Load dataset information from previous step"""
@@ -58,12 +63,17 @@ def load_dataset_info():
 def get_dataset(dataset_id):
     """Get existing dataset by ID"""
     print(f"\n📊 Loading dataset: {dataset_id}")
-    dataset = aiplatform.ImageDataset(dataset_name=dataset_id)
+    with instrumentation.span("load_dataset"):
+        dataset = aiplatform.ImageDataset(dataset_name=dataset_id)
     print(f"✓ Dataset loaded: {dataset.display_name}")
     return dataset
 
-def create_training_job(dataset, model_type="efficientnet", budget_hours=8):
-    """Create and run a training job"""
+def start_training_job(dataset, model_type="efficientnet", budget_hours=8, sync=True):
+    """
+    Create and run a training job, returns (job, model)
+    With sync=False the call returns once the job is submitted; the model is
+    available from job.get_model() after the job succeeds.
+    """
     
     config = TRAINING_CONFIGS.get(model_type, TRAINING_CONFIGS["automl"])
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -87,16 +97,28 @@ def create_training_job(dataset, model_type="efficientnet", budget_hours=8):
     print(f"  This may take several hours depending on dataset size and model complexity")
     
     # Run the training job
-    model = job.run(
-        dataset=dataset,
-        model_display_name=f"{MODEL_DISPLAY_NAME}_{model_type}_{timestamp}",
-        training_fraction_split=0.8,  # 80% for training
-        validation_fraction_split=0.1,  # 10% for validation
-        test_fraction_split=0.1,  # 10% for testing
-        budget_milli_node_hours=budget_hours * 1000,  # Convert to milli node hours
-        disable_early_stopping=False,
-        sync=True  # Wait for completion
-    )
+    with instrumentation.span("training_job", model_type=model_type, sync=sync):
+        model = job.run(
+            dataset=dataset,
+            model_display_name=f"{MODEL_DISPLAY_NAME}_{model_type}_{timestamp}",
+            training_fraction_split=0.8,  # 80% for training
+            validation_fraction_split=0.1,  # 10% for validation
+            test_fraction_split=0.1,  # 10% for testing
+            budget_milli_node_hours=budget_hours * 1000,  # Convert to milli node hours
+            disable_early_stopping=False,
+            sync=sync  # Wait for completion
+        )
+        
+        if not sync:
+            job.wait_for_resource_creation()
+            print(f"✓ Training job submitted: {job.resource_name}")
+    
+    return job, model
+
+def create_training_job(dataset, model_type="efficientnet", budget_hours=8):
+    """Create and run a training job"""
+    
+    job, model = start_training_job(dataset, model_type, budget_hours)
     
     print(f"\n✅ Training completed successfully!")
     print(f"  Model resource name: {model.resource_name}")
@@ -105,29 +127,30 @@ def create_training_job(dataset, model_type="efficientnet", budget_hours=8):
     return model
 
 def evaluate_model(model):
-    """Get model evaluation metrics"""
+    """
+    Get model evaluation metrics
+    Vertex AI reports AutoML metrics as a dict with camelCase keys. To tune the
+    threshold on your own cameras, run model_evaluation.py on scored images.
+    """
     print(f"\n📈 Model Evaluation Metrics:")
     
-    evaluations = model.list_model_evaluations()
+    with instrumentation.span("list_evaluations"):
+        evaluations = model.list_model_evaluations()
     
     for evaluation in evaluations:
-        metrics = evaluation.metrics
+        metrics = dict(evaluation.metrics or {})
         
-        if hasattr(metrics, 'au_prc'):
-            print(f"  AU-PRC: {metrics.au_prc:.4f}")
-        if hasattr(metrics, 'au_roc'):
-            print(f"  AU-ROC: {metrics.au_roc:.4f}")
-        if hasattr(metrics, 'log_loss'):
-            print(f"  Log Loss: {metrics.log_loss:.4f}")
+        for key, name in (("auPrc", "AU-PRC"), ("auRoc", "AU-ROC"), ("logLoss", "Log Loss")):
+            if metrics.get(key) is not None:
+                print(f"  {name}: {metrics[key]:.4f}")
         
         # Get confusion matrix if available
-        if hasattr(metrics, 'confusion_matrix'):
-            cm = metrics.confusion_matrix
-            print(f"\n  Confusion Matrix:")
-            print(f"    True Positives: {cm.get('true_positives', 'N/A')}")
-            print(f"    False Positives: {cm.get('false_positives', 'N/A')}")
-            print(f"    True Negatives: {cm.get('true_negatives', 'N/A')}")
-            print(f"    False Negatives: {cm.get('false_negatives', 'N/A')}")
+        confusion_matrix = metrics.get("confusionMatrix")
+        if confusion_matrix:
+            labels = [spec.get("displayName", "?") for spec in confusion_matrix.get("annotationSpecs", [])]
+            print(f"\n  Confusion Matrix (rows: true label):")
+            for label, row in zip(labels, confusion_matrix.get("rows", [])):
+                print(f"    {label:>20}: {' '.join(f'{int(count):>6}' for count in row)}")
 
 def save_model_info(model, model_type):
     """Save model information for deployment"""
@@ -155,7 +178,7 @@ def main():
     parser.add_argument('--location', default=LOCATION, help='Vertex AI location')
     parser.add_argument('--dataset-id', help='Dataset ID (from dataset_import.py)')
     parser.add_argument('--model-type', 
-                       choices=['efficientnet', 'mobilenet', 'automl'],
+                       choices=list(TRAINING_CONFIGS),
                        default='efficientnet',
                        help='Model architecture type')
     parser.add_argument('--budget-hours', 
@@ -165,8 +188,10 @@ def main():
     parser.add_argument('--evaluate', 
                        action='store_true',
                        help='Show model evaluation metrics after training')
+    instrumentation.add_arguments(parser)
     
     args = parser.parse_args()
+    instrumentation.configure(args, "train_model")
     
     print("=" * 60)
     print("🐘 ELEPHANT DETECTION - MODEL TRAINING")
@@ -209,7 +234,10 @@ def main():
     print("=" * 60)
     print(f"Model ID: {model.name}")
     print(f"Display Name: {model.display_name}")
-    print(f"\nNext step: Run deploy_model.py to deploy this model")
+    if args.model_type.endswith("_edge"):
+        print(f"\nNext step: Run deploy_model.py --model-type {args.model_type} --export-edge to export this model")
+    else:
+        print(f"\nNext step: Run deploy_model.py to deploy this model")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
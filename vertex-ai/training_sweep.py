@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Multi-Architecture Training Sweep
+Trains every model type concurrently, measures accuracy and serving latency,
+and selects the fastest model that meets the accuracy floor
+"""
+
+import json
+import argparse
+import asyncio
+from datetime import datetime
+import deploy_model
+import train_model
+from benchmark import load_samples, run_load
+from pipeline_runner import Checkpoint, find_deployed_model, run_train_stage
+from vertex_client import PredictionError, create_endpoint_client
+import instrumentation
+
+# Configuration
+SWEEP_CHECKPOINT_FILE = "sweep_checkpoint.json"
+SWEEP_RESULTS_FILE = "sweep_results.json"
+SELECTED_MODEL_TYPE = "selected"  # Written to model_info_selected.json
+ACCURACY_FLOOR = 0.90  # Minimum AU-PRC
+LATENCY_DEPLOYMENT_SIZE = "small"  # Every model is measured on the same machine type
+LATENCY_REQUESTS = 100
+LATENCY_WARMUP_REQUESTS = 10
+
+def get_evaluation_metrics(model):
+    """AU-PRC and log loss from the model's first evaluation"""
+    for evaluation in model.list_model_evaluations():
+        metrics = evaluation.metrics
+        return {
+            "au_prc": metrics.get("auPrc"),
+            "log_loss": metrics.get("logLoss")
+        }
+    return {"au_prc": None, "log_loss": None}
+
+async def measure_serving_latency(model, model_type, samples, location=deploy_model.LOCATION):
+    """
+    Deploy the model to a temporary endpoint, time sequential predictions and
+    tear the endpoint down again. Raises PredictionError if any probe call
+    failed, since the latency of a failing endpoint says nothing.
+    """
+    # Reuse the endpoint if an interrupted sweep left it behind
+    endpoint = await asyncio.to_thread(
+        deploy_model.create_or_get_endpoint, f"elephant-sweep-{model_type.replace('_', '-')}"
+    )
+    
+    try:
+        if await asyncio.to_thread(find_deployed_model, endpoint, model) is None:
+            await asyncio.to_thread(
+                deploy_model.deploy_model_to_endpoint, model, endpoint, LATENCY_DEPLOYMENT_SIZE
+            )
+        
+        endpoint_uri = f"https://{location}-aiplatform.googleapis.com/v1/{endpoint.resource_name}:predict"
+        async with create_endpoint_client(endpoint_uri, concurrency=1, max_retries=0) as client:
+            await run_load(client, samples, concurrency=1, max_requests=LATENCY_WARMUP_REQUESTS)
+            summary = await run_load(client, samples, concurrency=1, duration=600, max_requests=LATENCY_REQUESTS)
+    finally:
+        print(f"🧹 Removing temporary endpoint for {model_type}")
+        await asyncio.to_thread(endpoint.undeploy_all)
+        await asyncio.to_thread(endpoint.delete)
+    
+    if not summary["requests"] or summary["error_rate"] > 0 or summary["latency_ms"]["p95"] is None:
+        raise PredictionError(
+            f"Latency probe of {model_type} failed: {summary.get('errors_by_type') or 'no calls completed'}"
+        )
+    return summary["latency_ms"]
+
+async def evaluate_candidate(checkpoint, dataset, model_type, samples, location=deploy_model.LOCATION):
+    """Train (or reattach to) one model type, then record its accuracy and latency"""
+    model = await run_train_stage(checkpoint, dataset, model_type)
+    
+    name = f"measure:{model_type}"
+    stage = checkpoint.stage(name)
+    if stage.get("status") == "done":
+        return stage["result"]
+    
+    checkpoint.start(name)
+    metrics = await asyncio.to_thread(get_evaluation_metrics, model)
+    try:
+        latency = await measure_serving_latency(model, model_type, samples, location)
+    except PredictionError as e:
+        checkpoint.fail(name, e)
+        raise
+    
+    result = {
+        "model_type": model_type,
+        "model_id": model.name,
+        "display_name": model.display_name,
+        **metrics,
+        "latency_ms": latency
+    }
+    checkpoint.finish(name, result=result)
+    print(f"✓ {model_type}: AU-PRC {metrics['au_prc']}, p95 latency {latency['p95']}ms")
+    return result
+
+def pareto_frontier(candidates):
+    """Candidates not beaten on both AU-PRC (higher) and p95 latency (lower) by another"""
+    frontier = []
+    for candidate in candidates:
+        dominated = any(
+            other["au_prc"] >= candidate["au_prc"]
+            and other["latency_ms"]["p95"] <= candidate["latency_ms"]["p95"]
+            and (other["au_prc"] > candidate["au_prc"] or other["latency_ms"]["p95"] < candidate["latency_ms"]["p95"])
+            for other in candidates
+        )
+        if not dominated:
+            frontier.append(candidate)
+    return frontier
+
+def select_model(candidates, accuracy_floor=ACCURACY_FLOOR):
+    """The lowest-latency frontier model meeting the accuracy floor, or None"""
+    measured = [
+        candidate for candidate in candidates
+        if candidate["au_prc"] is not None and candidate["latency_ms"].get("p95") is not None
+    ]
+    eligible = [
+        candidate for candidate in pareto_frontier(measured)
+        if candidate["au_prc"] >= accuracy_floor
+    ]
+    return min(eligible, key=lambda candidate: candidate["latency_ms"]["p95"], default=None)
+
+def save_selected_model_info(selected):
+    """Copy the selected model's info to model_info_selected.json for deploy_model.py"""
+    with open(f"model_info_{selected['model_type']}.json", "r") as f:
+        model_info = json.load(f)
+    
+    model_info["selected_by_sweep"] = datetime.now().isoformat()
+    filename = f"model_info_{SELECTED_MODEL_TYPE}.json"
+    with open(filename, "w") as f:
+        json.dump(model_info, f, indent=2)
+    
+    print(f"✓ Selected model info saved to: {filename}")
+
+async def run_sweep(checkpoint, dataset, model_types, samples, location=deploy_model.LOCATION):
+    """Train and measure all model types concurrently"""
+    results = await asyncio.gather(
+        *(evaluate_candidate(checkpoint, dataset, model_type, samples, location) for model_type in model_types),
+        return_exceptions=True
+    )
+    
+    candidates = []
+    for model_type, result in zip(model_types, results):
+        if isinstance(result, Exception):
+            print(f"❌ {model_type}: {result}")
+        else:
+            candidates.append(result)
+    return candidates
+
+def print_candidates(candidates, frontier, selected):
+    """Print the sweep results table"""
+    print(f"\n{'model type':<16} {'AU-PRC':>8} {'p50 ms':>9} {'p95 ms':>9}  frontier")
+    for candidate in sorted(candidates, key=lambda candidate: candidate["latency_ms"]["p95"]):
+        mark = "✓" if candidate in frontier else ""
+        if candidate is selected:
+            mark += " (selected)"
+        au_prc = f"{candidate['au_prc']:.4f}" if candidate["au_prc"] is not None else "-"
+        print(f"{candidate['model_type']:<16} {au_prc:>8} {candidate['latency_ms']['p50']:>9} "
+              f"{candidate['latency_ms']['p95']:>9}  {mark}")
+
+def main():
+    cloud_types = [model_type for model_type in train_model.TRAINING_CONFIGS if not model_type.endswith("_edge")]
+    
+    parser = argparse.ArgumentParser(description='Train all model types and select the fastest accurate one')
+    parser.add_argument('--project-id', default=train_model.PROJECT_ID, help='GCP Project ID')
+    parser.add_argument('--location', default=train_model.LOCATION, help='Vertex AI location')
+    parser.add_argument('--dataset-id', help='Dataset ID (from dataset_import.py)')
+    parser.add_argument('--model-types', nargs='+', choices=cloud_types, default=cloud_types,
+                       help='Model types to sweep')
+    parser.add_argument('--budget-hours', type=int, default=8, help='Training budget in node hours per model')
+    parser.add_argument('--latency-samples', required=True,
+                       help='Image directory or JSONL file used to measure serving latency')
+    parser.add_argument('--accuracy-floor', type=float, default=ACCURACY_FLOOR, help='Minimum AU-PRC')
+    parser.add_argument('--checkpoint', default=SWEEP_CHECKPOINT_FILE, help='Sweep checkpoint file')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "training_sweep")
+    
+    print("=" * 60)
+    print("🐘 ELEPHANT DETECTION - TRAINING SWEEP")
+    print("=" * 60)
+    
+    train_model.initialize_vertex_ai(args.project_id, args.location)
+    
+    if not args.dataset_id:
+        dataset_info = train_model.load_dataset_info()
+        if not dataset_info:
+            return
+        dataset_id = dataset_info["dataset_id"]
+    else:
+        dataset_id = args.dataset_id
+    
+    dataset = train_model.get_dataset(dataset_id)
+    samples = load_samples(args.latency_samples)
+    if not samples:
+        print("❌ No latency sample images found")
+        return
+    
+    # Reruns reattach to running training jobs and skip finished measurements
+    checkpoint = Checkpoint(args.checkpoint, {"budget_hours": args.budget_hours})
+    print(f"\n🚀 Sweeping {len(args.model_types)} model types: {', '.join(args.model_types)}")
+    candidates = asyncio.run(run_sweep(checkpoint, dataset, args.model_types, samples, args.location))
+    
+    frontier = pareto_frontier([candidate for candidate in candidates if candidate["au_prc"] is not None])
+    selected = select_model(candidates, args.accuracy_floor)
+    
+    with open(SWEEP_RESULTS_FILE, "w") as f:
+        json.dump({
+            "created_time": datetime.now().isoformat(),
+            "accuracy_floor": args.accuracy_floor,
+            "candidates": candidates,
+            "frontier": [candidate["model_type"] for candidate in frontier],
+            "selected": selected["model_type"] if selected else None
+        }, f, indent=2)
+    
+    print("\n" + "=" * 60)
+    print("✅ TRAINING SWEEP COMPLETE")
+    print("=" * 60)
+    print_candidates(candidates, frontier, selected)
+    print(f"\n✓ Sweep results saved to: {SWEEP_RESULTS_FILE}")
+    
+    if selected is None:
+        print(f"\n❌ No model reached the AU-PRC floor of {args.accuracy_floor}")
+        return
+    
+    save_selected_model_info(selected)
+    print(f"\nNext step: Run deploy_model.py --model-type {SELECTED_MODEL_TYPE} to deploy {selected['model_type']}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Vertex AI Endpoint Client
+Async REST client for online predictions with pooled connections and retries
+"""
+
+import json
+import random
+import asyncio
+from datetime import datetime, timezone
+from cloud_context import LazyModule
+import instrumentation
+
+# Configuration
+ENDPOINT_CONFIG_FILE = "endpoint_config.json"
+AUTH_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+DEFAULT_CONCURRENCY = 8  # Pooled connections per client
+DEFAULT_TIMEOUT_SECONDS = 30
+MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+TOKEN_REFRESH_MARGIN_SECONDS = 300  # Refresh tokens this long before they expire
+TOKEN_RETRY_SECONDS = 30
+ONLINE_NODE_HOUR_COST = 1.375  # USD, AutoML image classification deployed node
+
+aiohttp = LazyModule("aiohttp")  # Imported when the first client opens
+
+class PredictionError(Exception):
+    """Raised when the endpoint rejects a request or retries are exhausted"""
+    
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+def load_endpoint_config(config_file=ENDPOINT_CONFIG_FILE):
+    """Load endpoint information saved by deploy_model.py"""
+    try:
+        with open(config_file, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"❌ {config_file} not found. Please run deploy_model.py first.")
+        return None
+
+def backoff_delay(attempt, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_MAX_SECONDS):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class AccessTokenProvider:
+    """
+    Access tokens from Google Application Default Credentials
+    Tokens are cached until shortly before they expire. Concurrent callers
+    share a single refresh, and an optional background task refreshes ahead
+    of expiry so requests never wait on a token mint.
+    """
+    
+    def __init__(self, refresh_margin=TOKEN_REFRESH_MARGIN_SECONDS):
+        self.credentials = None
+        self.refresh_margin = refresh_margin
+        self.refresh_task = None
+        self.background_task = None
+        self.stats = {"refreshes": 0}
+    
+    def seconds_until_expiry(self):
+        """Seconds the cached token remains valid (0 if there is none)"""
+        if self.credentials is None or not self.credentials.token:
+            return 0
+        if self.credentials.expiry is None:
+            return float("inf")
+        
+        # google-auth stores expiry as naive UTC
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (self.credentials.expiry - now).total_seconds()
+    
+    async def refresh(self):
+        """Mint a new token off the event loop, sharing one refresh between callers"""
+        if self.refresh_task is None or self.refresh_task.done():
+            self.refresh_task = asyncio.ensure_future(self._refresh())
+        await asyncio.shield(self.refresh_task)
+    
+    async def _refresh(self):
+        import google.auth
+        from google.auth.transport.requests import Request
+        
+        loop = asyncio.get_running_loop()
+        if self.credentials is None:
+            self.credentials, _ = await loop.run_in_executor(
+                None, lambda: google.auth.default(scopes=[AUTH_SCOPE])
+            )
+        
+        await loop.run_in_executor(None, self.credentials.refresh, Request())
+        self.stats["refreshes"] += 1
+    
+    async def get_token(self):
+        """Return a cached access token, refreshing it when close to expiry"""
+        if self.seconds_until_expiry() <= self.refresh_margin:
+            await self.refresh()
+        return self.credentials.token
+    
+    def start_background_refresh(self):
+        """Keep the token fresh from a background task"""
+        if self.background_task is None:
+            self.background_task = asyncio.ensure_future(self._refresh_loop())
+    
+    async def stop_background_refresh(self):
+        """Stop the background refresh task"""
+        if self.background_task is not None:
+            self.background_task.cancel()
+            try:
+                await self.background_task
+            except asyncio.CancelledError:
+                pass
+            self.background_task = None
+    
+    async def _refresh_loop(self):
+        while True:
+            try:
+                if self.seconds_until_expiry() <= self.refresh_margin:
+                    await self.refresh()
+                delay = self.seconds_until_expiry() - self.refresh_margin
+            except Exception as e:
+                print(f"⚠️ Access token refresh failed: {e}")
+                delay = TOKEN_RETRY_SECONDS
+            
+            await asyncio.sleep(min(max(delay, 1), 3600))
+
+class EndpointClient:
+    """
+    Client for a Vertex AI :predict endpoint
+    Keeps one pooled HTTP session open for the lifetime of the client.
+    Use as `async with EndpointClient(uri) as client`.
+    """
+    
+    def __init__(self, endpoint_uri, token_provider=None, concurrency=DEFAULT_CONCURRENCY,
+                 timeout=DEFAULT_TIMEOUT_SECONDS, max_retries=MAX_RETRIES):
+        self.endpoint_uri = endpoint_uri
+        self.token_provider = token_provider
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = None
+        self.stats = {"requests": 0, "instances": 0, "retries": 0, "errors": 0}
+    
+    async def __aenter__(self):
+        await self.open()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+    
+    async def open(self):
+        """Open the pooled HTTP session"""
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+    
+    async def close(self):
+        """Close the HTTP session and its connections"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+    
+    async def predict(self, instances):
+        """
+        Send one predict call and return one prediction per instance
+        Retries throttling, server errors and network failures with jittered backoff.
+        """
+        return (await self.predict_response(instances))["predictions"]
+    
+    async def predict_response(self, instances):
+        """Like predict(), but returns the whole response including deployedModelId"""
+        payload = json.dumps({"instances": instances})
+        error = None
+        
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                instrumentation.count("retries")
+                await asyncio.sleep(backoff_delay(attempt - 1))
+            
+            headers = {"Content-Type": "application/json"}
+            if self.token_provider is not None:
+                headers["Authorization"] = f"Bearer {await self.token_provider.get_token()}"
+            
+            self.stats["requests"] += 1
+            instrumentation.count("predict_requests")
+            instrumentation.count("bytes_uploaded", len(payload))
+            try:
+                async with self.session.post(self.endpoint_uri, data=payload, headers=headers) as response:
+                    body = await response.text()
+                    
+                    if response.status == 200:
+                        try:
+                            result = json.loads(body)
+                            predictions = result.get("predictions")
+                        except (ValueError, AttributeError):
+                            predictions = None
+                        if predictions is None or len(predictions) != len(instances):
+                            self.stats["errors"] += 1
+                            raise PredictionError("Invalid prediction response")
+                        self.stats["instances"] += len(instances)
+                        return result
+                    
+                    try:
+                        message = json.loads(body)["error"]["message"]
+                    except (ValueError, KeyError, TypeError):
+                        message = body[:200] or "Prediction failed"
+                    error = PredictionError(f"HTTP {response.status}: {message}", status=response.status)
+                    
+                    if response.status not in RETRYABLE_STATUS_CODES:
+                        self.stats["errors"] += 1
+                        raise error
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = PredictionError(f"Network error: {str(e) or type(e).__name__}")
+        
+        self.stats["errors"] += 1
+        raise error
+
+def create_endpoint_client(endpoint_uri=None, config_file=ENDPOINT_CONFIG_FILE, hedge=True, hedge_delay_ms=None,
+                           **kwargs):
+    """
+    Create a client for the given endpoint URI or the one in endpoint_config.json
+    Plain http:// endpoints (such as the local stub) are called without credentials.
+    With a list of URIs, or several "endpoints" in the config, calls are routed
+    between them (see endpoint_router.py).
+    """
+    if endpoint_uri is None:
+        config = load_endpoint_config(config_file)
+        if not config:
+            raise PredictionError(f"No endpoint configured in {config_file}")
+        endpoints = config.get("endpoints") or [config]
+        endpoint_uri = [endpoint["endpoint_uri"] for endpoint in endpoints]
+    
+    if isinstance(endpoint_uri, (list, tuple)):
+        if len(endpoint_uri) > 1:
+            from endpoint_router import create_router
+            return create_router(endpoint_uri, hedge=hedge, hedge_delay_ms=hedge_delay_ms, **kwargs)
+        endpoint_uri = endpoint_uri[0]
+    
+    token_provider = AccessTokenProvider() if endpoint_uri.startswith("https://") else None
+    return EndpointClient(endpoint_uri, token_provider=token_provider, **kwargs)
+
+def format_prediction_results(prediction):
+    """
+    Format a raw prediction like formatPredictionResults in predict.php
+    Returns the same fields so Python serving components share the web contract.
+    """
+    display_names = prediction.get("displayNames", [])
+    confidences = prediction.get("confidences", [])
+    
+    # Combine labels with confidence scores
+    results = []
+    for i, label in enumerate(display_names):
+        confidence = confidences[i] if i < len(confidences) else 0
+        results.append({
+            "label": label,
+            "confidence": confidence,
+            "percentage": round(confidence * 100, 2)
+        })
+    
+    # Sort by confidence
+    results.sort(key=lambda result: result["confidence"], reverse=True)
+    
+    # Determine if elephant is detected
+    elephant_detected = False
+    elephant_confidence = 0
+    
+    for result in results:
+        if "elephant" in result["label"].lower():
+            elephant_detected = True
+            elephant_confidence = result["confidence"]
+            break
+    
+    # Create detailed response
+    response = {
+        "elephant_detected": elephant_detected,
+        "confidence": elephant_confidence,
+        "confidence_percentage": round(elephant_confidence * 100, 2),
+        "top_predictions": results[:5],
+        "all_predictions": results
+    }
+    
+    # Add detection message
+    if elephant_detected:
+        if elephant_confidence > 0.9:
+            confidence_level = "Very High"
+        elif elephant_confidence > 0.7:
+            confidence_level = "High"
+        elif elephant_confidence > 0.5:
+            confidence_level = "Moderate"
+        else:
+            confidence_level = "Low"
+        
+        response["message"] = "🐘 Elephant Detected!"
+        response["details"] = (
+            f"An elephant has been detected in the image with {confidence_level} "
+            f"confidence ({response['confidence_percentage']}%)."
+        )
+        response["conservation_note"] = (
+            "Elephants are magnificent creatures that play a crucial role in their ecosystems. "
+            "This detection helps in wildlife monitoring and conservation efforts."
+        )
+    else:
+        top_label = results[0]["label"] if results else "Unknown"
+        response["message"] = "No Elephant Detected"
+        response["details"] = f"No elephants were detected in this image. The image appears to contain: {top_label}."
+        response["suggestion"] = "Try uploading a clear image containing elephants for detection."
+    
+    return response
+
+def elephant_confidence(prediction):
+    """Total confidence of the elephant labels (everything except no_elephant)"""
+    return sum(
+        confidence
+        for label, confidence in zip(prediction.get("displayNames", []), prediction.get("confidences", []))
+        if "elephant" in label.lower() and not label.lower().startswith("no")
+    )
\ No newline at end of file
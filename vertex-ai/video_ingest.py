@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Video and Camera-Trap Stream Ingestion
+Scores only the frames where the scene changed and reports detections with timestamps
+"""
+
+import io
+import os
+import json
+import time
+import base64
+import argparse
+import asyncio
+import collections
+import numpy as np
+from PIL import Image
+from batch_predict import IMAGE_EXTENSIONS
+from image_preprocess import get_model_key, load_profile
+from vertex_client import ENDPOINT_CONFIG_FILE, PredictionError, create_endpoint_client, elephant_confidence
+import instrumentation
+
+# Configuration
+THUMBNAIL_WIDTH = 64  # Frames are compared as small grayscale thumbnails
+CHANGE_THRESHOLD = 8.0  # Mean absolute difference (0-255) that counts as a scene change
+HISTOGRAM_THRESHOLD = 0.1  # Histogram distance (0-1) that counts as a scene change
+HISTOGRAM_BINS = 32
+MAX_GAP_SECONDS = 30.0  # Send a frame at least this often even in a static scene
+SEQUENCE_FPS = 1.0  # Frame rate assumed for a directory of stills
+BATCH_SIZE = 8
+CONCURRENCY = 4
+DETECTION_THRESHOLD = 0.5
+OUTPUT_FILE = "video_detections.jsonl"
+EVENTS_FILE = "video_events.jsonl"
+
+def iter_video_frames(source, sample_fps=None):
+    """
+    Yield (frame index, timestamp in seconds, RGB array) from a video file or stream URL
+    With sample_fps, frames in between are grabbed without being converted.
+    Timestamps come from the decoder, so variable frame rates and dropped
+    stream frames do not drift them.
+    """
+    try:
+        import cv2
+    except ImportError:
+        raise ImportError("Video ingestion needs OpenCV: pip install opencv-python-headless")
+    
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise OSError(f"Cannot open video: {source}")
+    
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    step = max(1, round(fps / sample_fps)) if sample_fps else 1
+    index = 0
+    try:
+        while True:
+            if index % step:
+                if not capture.grab():
+                    break
+            else:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                # Some backends report no position, fall back to the nominal frame rate
+                position = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                timestamp = position if position > 0 or index == 0 else index / fps
+                yield index, timestamp, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            index += 1
+    finally:
+        capture.release()
+
+def iter_image_sequence(directory, fps=SEQUENCE_FPS):
+    """Yield (frame index, timestamp, RGB array) from a directory of camera-trap stills in name order"""
+    filenames = sorted(name for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+    for index, filename in enumerate(filenames):
+        with Image.open(os.path.join(directory, filename)) as image:
+            yield index, index / fps, np.asarray(image.convert("RGB"))
+
+def iter_frames(source, sample_fps=None):
+    """Frames from a directory of stills, or from a video file or stream"""
+    if os.path.isdir(source):
+        return iter_image_sequence(source, sample_fps or SEQUENCE_FPS)
+    return iter_video_frames(source, sample_fps)
+
+def frame_thumbnail(frame, width=THUMBNAIL_WIDTH):
+    """Small grayscale view of a frame by striding, without resampling"""
+    step = max(1, frame.shape[1] // width)
+    return frame[::step, ::step].mean(axis=2, dtype=np.float32)
+
+class SceneChangeDetector:
+    """
+    Select frames whose content differs from the last selected frame
+    Comparing against the last *selected* frame rather than the previous one
+    catches slow changes (an elephant walking in) as well as cuts. "diff" uses
+    the mean absolute pixel difference, "histogram" the total variation
+    distance of brightness histograms, which ignores small camera shake.
+    """
+    
+    def __init__(self, method="diff", threshold=None, max_gap_seconds=MAX_GAP_SECONDS):
+        self.method = method
+        self.threshold = threshold if threshold is not None else (
+            CHANGE_THRESHOLD if method == "diff" else HISTOGRAM_THRESHOLD
+        )
+        self.max_gap_seconds = max_gap_seconds
+        self.reference = None
+        self.reference_time = None
+    
+    def signature(self, frame):
+        thumbnail = frame_thumbnail(frame)
+        if self.method == "histogram":
+            histogram, _ = np.histogram(thumbnail, bins=HISTOGRAM_BINS, range=(0, 256))
+            return histogram / max(1, histogram.sum())
+        return thumbnail
+    
+    def change_score(self, signature):
+        if self.method == "histogram":
+            return float(np.abs(signature - self.reference).sum() / 2)
+        return float(np.abs(signature - self.reference).mean())
+    
+    def check(self, frame, timestamp):
+        """Returns (selected, change score) for a frame"""
+        signature = self.signature(frame)
+        if self.reference is None:
+            score = None
+            selected = True
+        else:
+            score = self.change_score(signature)
+            selected = score >= self.threshold or timestamp - self.reference_time >= self.max_gap_seconds
+        
+        if selected:
+            self.reference = signature
+            self.reference_time = timestamp
+        return selected, score
+
+def encode_frame(frame, max_dimension, quality):
+    """Downsize a frame to the serving profile and base64-encode it as JPEG"""
+    image = Image.fromarray(frame)
+    image.thumbnail((max_dimension, max_dimension), Image.BICUBIC)
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=quality)
+    return base64.b64encode(output.getbuffer()).decode("ascii")
+
+def format_timestamp(seconds):
+    """HH:MM:SS.mmm"""
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:06.3f}"
+
+def iter_selected_batches(frames, detector, profile, counts, batch_size=BATCH_SIZE):
+    """Run scene detection over decoded frames and yield batches of encoded changed frames"""
+    batch = []
+    for index, timestamp, frame in frames:
+        counts["decoded"] += 1
+        selected, score = detector.check(frame, timestamp)
+        if not selected:
+            continue
+        
+        batch.append({
+            "frame": index,
+            "timestamp": round(timestamp, 3),
+            "change_score": None if score is None else round(score, 4),
+            "content": encode_frame(frame, profile["max_dimension"], profile["quality"])
+        })
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def score_frame_batch(client, batch, slots, threshold):
+    """Score one batch of frames, returning one detection record per frame"""
+    async with slots:
+        try:
+            predictions = await client.predict([{"content": frame["content"]} for frame in batch])
+        except PredictionError as e:
+            return [{"frame": frame["frame"], "timestamp": frame["timestamp"], "error": str(e)} for frame in batch]
+    
+    records = []
+    for frame, prediction in zip(batch, predictions):
+        confidence = elephant_confidence(prediction)
+        records.append({
+            "frame": frame["frame"],
+            "timestamp": frame["timestamp"],
+            "time": format_timestamp(frame["timestamp"]),
+            "change_score": frame["change_score"],
+            "elephant_confidence": round(confidence, 4),
+            "detected": confidence >= threshold
+        })
+    return records
+
+class EventMerger:
+    """
+    Merge detected frames closer than max_gap_seconds into elephant events as they are scored
+    An event closes once a scored frame lies more than max_gap_seconds past its
+    last detection. Static scenes are still scored every max_gap_seconds, so a
+    live stream reports each event shortly after the elephants leave.
+    """
+    
+    def __init__(self, max_gap_seconds=MAX_GAP_SECONDS):
+        self.max_gap_seconds = max_gap_seconds
+        self.event = None
+    
+    def add(self, record):
+        """Fold in one scored frame, returns the event it closed or None"""
+        closed = None
+        if self.event is not None and record["timestamp"] - self.event["end"] > self.max_gap_seconds:
+            closed, self.event = self.event, None
+        
+        if record.get("detected"):
+            if self.event is None:
+                self.event = {
+                    "start": record["timestamp"],
+                    "end": record["timestamp"],
+                    "peak_confidence": record["elephant_confidence"],
+                    "frames": 0
+                }
+            self.event["end"] = record["timestamp"]
+            self.event["peak_confidence"] = max(self.event["peak_confidence"], record["elephant_confidence"])
+            self.event["frames"] += 1
+        return closed
+    
+    def finish(self):
+        """Close the event still open at the end of the stream"""
+        closed, self.event = self.event, None
+        return closed
+
+def format_event(event):
+    """One-line summary of an elephant event"""
+    return (f"{format_timestamp(event['start'])} - {format_timestamp(event['end'])}  "
+            f"peak {event['peak_confidence']:.2%} ({event['frames']} frames)")
+
+async def ingest_stream(client, frames, output, detector, profile, batch_size=BATCH_SIZE,
+                        concurrency=CONCURRENCY, threshold=DETECTION_THRESHOLD, events_output=None,
+                        max_gap_seconds=MAX_GAP_SECONDS):
+    """
+    Decode, select and score frames, writing records in frame order
+    Decoding runs in a worker thread one batch at a time while up to
+    `concurrency` predict calls are in flight. Elephant events are written to
+    events_output and printed as soon as they close, so memory stays bounded
+    on endless streams.
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(concurrency)
+    counts = collections.Counter()
+    batches = iter_selected_batches(frames, detector, profile, counts, batch_size)
+    in_flight = collections.deque()
+    events = EventMerger(max_gap_seconds)
+    
+    def report(event):
+        if event is None:
+            return
+        counts["events"] += 1
+        print(f"🐘 Elephant event: {format_event(event)}")
+        if events_output is not None:
+            events_output.write(json.dumps(event) + "\n")
+            events_output.flush()
+    
+    def write(batch_records):
+        for record in batch_records:
+            output.write(json.dumps(record) + "\n")
+            counts["sent"] += 1
+            counts["detected"] += bool(record.get("detected"))
+            counts["errors"] += "error" in record
+            report(events.add(record))
+        output.flush()
+    
+    start_time = time.time()
+    while True:
+        batch = await loop.run_in_executor(None, next, batches, None)
+        if batch is None:
+            break
+        in_flight.append(asyncio.ensure_future(score_frame_batch(client, batch, slots, threshold)))
+        if len(in_flight) >= concurrency * 2:
+            write(await in_flight.popleft())
+    
+    while in_flight:
+        write(await in_flight.popleft())
+    report(events.finish())
+    
+    counts["seconds"] = time.time() - start_time
+    return counts
+
+async def run_ingestion(source, output_file=OUTPUT_FILE, endpoint_uri=None, config_file=ENDPOINT_CONFIG_FILE,
+                        edge_model=None, sample_fps=None, method="diff", change_threshold=None,
+                        max_gap_seconds=MAX_GAP_SECONDS, threshold=DETECTION_THRESHOLD, events_file=EVENTS_FILE):
+    """Ingest one video, stream or frame directory"""
+    if edge_model:
+        from edge_inference import EdgeInferenceEngine
+        client = EdgeInferenceEngine(edge_model)
+    else:
+        client = create_endpoint_client(endpoint_uri, config_file=config_file, concurrency=CONCURRENCY)
+    
+    profile = load_profile(get_model_key(config_file, edge_model))
+    detector = SceneChangeDetector(method, change_threshold, max_gap_seconds)
+    
+    async with client:
+        with open(output_file, "w") as output, open(events_file, "w") as events_output:
+            return await ingest_stream(
+                client, iter_frames(source, sample_fps), output, detector, profile, threshold=threshold,
+                events_output=events_output, max_gap_seconds=max_gap_seconds
+            )
+
+def main():
+    parser = argparse.ArgumentParser(description='Score trail-camera video, skipping unchanged frames')
+    parser.add_argument('--source', required=True, help='Video file, stream URL (e.g. rtsp://) or directory of stills')
+    parser.add_argument('--output', default=OUTPUT_FILE, help='JSONL file for per-frame results')
+    parser.add_argument('--events-output', default=EVENTS_FILE, help='JSONL file for elephant events as they close')
+    parser.add_argument('--endpoint-uri', help='Predict URI (default: from endpoint_config.json)')
+    parser.add_argument('--config-file', default=ENDPOINT_CONFIG_FILE, help='Endpoint configuration file')
+    parser.add_argument('--edge-model', help='Score with an exported model on local CPU instead')
+    parser.add_argument('--sample-fps', type=float, help='Decode at most this many frames per second')
+    parser.add_argument('--method', choices=['diff', 'histogram'], default='diff', help='Scene change measure')
+    parser.add_argument('--change-threshold', type=float,
+                       help=f'Scene change threshold (default: {CHANGE_THRESHOLD} diff, {HISTOGRAM_THRESHOLD} histogram)')
+    parser.add_argument('--max-gap', type=float, default=MAX_GAP_SECONDS,
+                       help='Score at least one frame this often, in seconds')
+    parser.add_argument('--threshold', type=float, default=DETECTION_THRESHOLD, help='Elephant confidence for a detection')
+    instrumentation.add_arguments(parser)
+    
+    args = parser.parse_args()
+    instrumentation.configure(args, "video_ingest")
+    
+    print("=" * 60)
+    print("🐘 ELEPHANT DETECTION - VIDEO INGESTION")
+    print("=" * 60)
+    print(f"  Source: {args.source}")
+    
+    counts = asyncio.run(run_ingestion(
+        args.source,
+        args.output,
+        endpoint_uri=args.endpoint_uri,
+        config_file=args.config_file,
+        edge_model=args.edge_model,
+        sample_fps=args.sample_fps,
+        method=args.method,
+        change_threshold=args.change_threshold,
+        max_gap_seconds=args.max_gap,
+        threshold=args.threshold,
+        events_file=args.events_output
+    ))
+    
+    skipped = counts["decoded"] - counts["sent"]
+    print(f"\n✅ Decoded {counts['decoded']} frames in {counts['seconds']:.1f}s, scored {counts['sent']} "
+          f"({skipped / max(1, counts['decoded']):.1%} skipped as unchanged)")
+    print(f"  Errors: {counts['errors']}")
+    
+    if counts["events"]:
+        print(f"\n🐘 {counts['events']} elephant detection(s), saved to: {args.events_output}")
+    else:
+        print("\n  No elephants detected")
+    print(f"✓ Results saved to: {args.output}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file